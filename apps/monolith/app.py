@@ -27,9 +27,11 @@ os.makedirs(RESULTS_DIR, exist_ok=True)
 
 from routes.uploads import uploads_bp
 from routes.forensic import forensic_bp
+from routes.jobs import jobs_bp
 
 app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
 app.register_blueprint(forensic_bp, url_prefix='/api/forensic')
+app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
 
 TOOLS = [
     { "name": "General", "tool_list": ["Original Image", "File Digest", "Hex Editor", "Similar Search"] },
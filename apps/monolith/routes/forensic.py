@@ -1,39 +1,115 @@
 import os
+import functools
 import cv2 as cv
 import numpy as np
 import uuid
 from pathlib import Path
-from flask import Blueprint, request, jsonify, current_app, send_file
+from typing import Optional
+from flask import Blueprint, request, jsonify, current_app, send_file, make_response, Response, stream_with_context
 import json
 
 # Import core logic (reusing existing packages)
 from imagesics_core.forensic import (
     ela, cloning, noise, digest, histogram, jpeg, ghost_maps, resampling, 
     metadata, pixel_analysis, filters, transforms, stereogram, wavelets, 
-    plots, jpeg_quality, external_tools, metrics
+    plots, jpeg_quality, external_tools, metrics, phash_index, report, jpeg_dct,
+    hex_view
 )
 from imagesics_core.forensic.ghost_maps import GhostMapRequest
+from imagesics_core.utils import result_cache, image_cache, upload_store, render
 
 forensic_bp = Blueprint('forensic', __name__)
 
 STORAGE_DIR = Path(os.getcwd()) / "storage"
 RESULTS_DIR = STORAGE_DIR / "results"
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+UPLOADS_DIR = STORAGE_DIR / "uploads"
+INDEX_DIR = STORAGE_DIR / "index"
 
-def load_image(path_str: str) -> np.ndarray:
-    """Load image from path, handling both absolute and relative paths."""
+# Minimum perceptual-hash similarity for local search results
+SIMILARITY_CUTOFF = 0.7
+
+def get_phash_index() -> phash_index.PHashIndex:
+    """Shared perceptual-hash index over the uploads directory."""
+    return phash_index.get_index(INDEX_DIR / "phash.jsonl", UPLOADS_DIR)
+
+# Repeated analyses of the same file with the same parameters are served
+# from here instead of being recomputed
+RESULT_CACHE = result_cache.ResultCache(
+    INDEX_DIR / "results",
+    RESULTS_DIR,
+    version=result_cache.code_version([Path(__file__), Path(ela.__file__).parent.parent]),
+    max_bytes=int(os.environ.get("IMAGESICS_RESULT_CACHE_BYTES", 1 << 30)),
+    max_age=float(os.environ.get("IMAGESICS_RESULT_CACHE_MAX_AGE", 7 * 24 * 3600)),
+)
+
+# Decoded uploads shared across requests; tools get read-only views
+IMAGE_CACHE = image_cache.ImageCache(
+    max_bytes=int(os.environ.get("IMAGESICS_IMAGE_CACHE_BYTES", image_cache.DEFAULT_MAX_BYTES)),
+)
+
+def get_upload_store() -> upload_store.UploadStore:
+    """Sidecar hash records of the uploads directory."""
+    return upload_store.get_store(UPLOADS_DIR, INDEX_DIR / "uploads")
+
+def resolve_path(path_str: str, relative_to_storage: bool = True) -> Path:
+    """Map an API path (/storage/..., relative or absolute) to a path on disk."""
     if path_str.startswith("/storage"):
         clean_path = path_str.replace("/storage", "", 1).lstrip("/")
-        path = STORAGE_DIR / clean_path
-    else:
-        path = Path(path_str)
-        if not path.is_absolute():
-            path = STORAGE_DIR / path_str
+        return STORAGE_DIR / clean_path
+    path = Path(path_str)
+    if relative_to_storage and not path.is_absolute():
+        path = STORAGE_DIR / path_str
+    return path
+
+def storage_file(path_str: str) -> Optional[Path]:
+    """An existing file under STORAGE_DIR named by an API path, else None."""
+    path = resolve_path(path_str, relative_to_storage=False).resolve()
+    if not path.is_relative_to(STORAGE_DIR.resolve()) or not path.is_file():
+        return None
+    return path
+
+def cached_result(view):
+    """Serve repeated requests for the same file and parameters from RESULT_CACHE."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            if request.method == 'GET':
+                params = request.args.to_dict()
+                source = resolve_path(params.pop('path', ''), relative_to_storage=False)
+            else:
+                params = dict(request.get_json(silent=True) or {})
+                source = resolve_path(params.pop('image_path', None) or '')
+            # Other file arguments (e.g. reference_path) are keyed by content too
+            for name, value in params.items():
+                if name.endswith('_path') and isinstance(value, str):
+                    params[name] = result_cache.file_sha256(str(resolve_path(value)))
+            key = RESULT_CACHE.make_key(
+                result_cache.file_sha256(str(source)), request.endpoint, params
+            )
+        except Exception:
+            return view(*args, **kwargs)
+
+        payload = RESULT_CACHE.get(key)
+        if payload is not None:
+            return jsonify(payload)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and response.is_json:
+            payload = response.get_json()
+            if isinstance(payload, dict) and "error" not in payload:
+                RESULT_CACHE.put(key, payload)
+        return response
+    return wrapper
+
+def load_image(path_str: str) -> np.ndarray:
+    """Load image from path, handling both absolute and relative paths."""
+    path = resolve_path(path_str)
     
     if not path.exists():
         raise FileNotFoundError(f"Image not found at {path}")
         
-    img = cv.imread(str(path))
+    img = IMAGE_CACHE.get(str(path))
     if img is None:
         raise ValueError("Failed to load image")
     return img
@@ -53,10 +129,81 @@ def save_bytes_result(data: bytes, prefix: str, ext: str = "jpg") -> str:
         f.write(data)
     return f"/storage/results/{filename}"
 
+def save_map_result(values: np.ndarray, prefix: str) -> str:
+    """Save a raw analysis map as float16 .npy and return URL path."""
+    filename = f"{prefix}_{uuid.uuid4()}.npy"
+    np.save(RESULTS_DIR / filename, np.asarray(values).astype(np.float16), allow_pickle=False)
+    return f"/storage/results/{filename}"
+
+def wants_raw_map() -> bool:
+    """Whether the request asks for the raw map alongside the rendering."""
+    return bool((request.get_json(silent=True) or {}).get('raw_map'))
+
 # ============================================================================
 # GENERAL TOOLS
 # ============================================================================
 
+@forensic_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the result and decoded-image caches."""
+    return jsonify({"results": RESULT_CACHE.stats(), "images": IMAGE_CACHE.stats()})
+
+@forensic_bp.route('/render', methods=['GET'])
+def render_raw_map():
+    """Render a stored raw map with a colormap, gain and threshold."""
+    path = resolve_path(request.args.get('path', ''))
+    if path.suffix != '.npy' or path.resolve().parent != RESULTS_DIR.resolve():
+        return jsonify({"error": "Not a stored map"}), 400
+    if not path.exists():
+        return jsonify({"error": "Map not found"}), 404
+    try:
+        args = request.args
+        def optional(name, cast):
+            return cast(args[name]) if args.get(name, '') != '' else None
+        values = np.load(path, mmap_mode='r', allow_pickle=False)
+        image = render.render_map(
+            values,
+            colormap=args.get('colormap', 'gray'),
+            gain=float(args.get('gain', 1.0)),
+            threshold=optional('threshold', float),
+            vmin=optional('vmin', float),
+            vmax=optional('vmax', float),
+            layer=optional('layer', int),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ok, buf = cv.imencode('.png', image, [cv.IMWRITE_PNG_COMPRESSION, 1])
+    return Response(buf.tobytes(), mimetype='image/png')
+
+@forensic_bp.route('/report', methods=['POST'])
+@cached_result
+def full_report():
+    """Run several tools in one pass over one decoded image."""
+    try:
+        data = request.json
+        img = load_image(data.get('image_path'))
+        tools = data.get('tools') or list(report.REPORT_TOOLS)
+        
+        unknown = [t for t in tools if t not in report.REPORT_TOOLS]
+        if unknown:
+            return jsonify({"error": f"Unknown tools: {', '.join(unknown)}",
+                            "tools": list(report.REPORT_TOOLS)}), 400
+        
+        outputs = report.run_report(img, tools, data.get('params', {}))
+        
+        results = {}
+        for name, output in outputs.items():
+            result = output.pop('result', None)
+            if isinstance(result, np.ndarray):
+                output['result_url'] = save_result(result, name)
+            elif isinstance(result, bytes):
+                output['result_url'] = save_bytes_result(result, name)
+            results[name] = output
+        
+        return jsonify({"results": results})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @forensic_bp.route('/hex', methods=['POST'])
 def get_hex_dump():
     """Return hex dump with pagination support for large files."""
@@ -66,24 +213,13 @@ def get_hex_dump():
         offset = data.get('offset', 0)
         length = data.get('length', 512)  # Default 512 bytes
         
-        # Get actual file path
-        if image_path.startswith("/storage"):
-            clean_path = image_path.replace("/storage", "", 1).lstrip("/")
-            real_path = STORAGE_DIR / clean_path
-        else:
-            real_path = Path(image_path)
+        real_path = resolve_path(image_path, relative_to_storage=False)
         
         # Check if file exists
         if not real_path.exists():
             return jsonify({"error": "File not found", "data": []}), 404
         
-        # Get file size
-        file_size = os.path.getsize(real_path)
-        
-        # Read chunk from file
-        with open(real_path, 'rb') as f:
-            f.seek(offset)
-            chunk = f.read(length)
+        chunk, file_size = hex_view.read_window(str(real_path), offset, length)
         
         # Convert to list of byte values
         byte_data = list(chunk)
@@ -99,22 +235,84 @@ def get_hex_dump():
     except Exception as e:
         return jsonify({"error": str(e), "data": []}), 500
 
+@forensic_bp.route('/hex/raw', methods=['GET'])
+def get_hex_raw():
+    """
+    Raw file bytes. Honours HTTP Range requests (206 with Content-Range),
+    so a viewer can fetch just the window it displays.
+    """
+    # Served by GET links, so confined to the storage directory
+    real_path = storage_file(request.args.get('path', ''))
+    if real_path is None:
+        return jsonify({"error": "File not found"}), 404
+    return send_file(str(real_path), mimetype='application/octet-stream', conditional=True)
+
+@forensic_bp.route('/hex/rows', methods=['GET'])
+def get_hex_rows():
+    """
+    Pre-formatted hex dump rows of a window of the file, as plain text.
+    
+    Query: path, offset (default 0), length (default 4096), width (default 16).
+    X-Offset, X-Length and X-Total-Size headers describe the window.
+    """
+    # Served by GET links, so confined to the storage directory
+    real_path = storage_file(request.args.get('path', ''))
+    if real_path is None:
+        return jsonify({"error": "File not found"}), 404
+    try:
+        offset = int(request.args.get('offset', 0))
+        length = int(request.args.get('length', 4096))
+        width = int(request.args.get('width', hex_view.DEFAULT_WIDTH))
+        chunk, file_size = hex_view.read_window(str(real_path), offset, length)
+        rows = hex_view.format_rows(chunk, offset, width)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = make_response(rows)
+    response.mimetype = 'text/plain'
+    response.headers['X-Offset'] = str(offset)
+    response.headers['X-Length'] = str(len(chunk))
+    response.headers['X-Total-Size'] = str(file_size)
+    return response
+
+@forensic_bp.route('/hex/search', methods=['GET'])
+def search_hex():
+    """
+    Offsets of a hex byte pattern across the whole file.
+    
+    Query: path, pattern (e.g. "FFD8FF"), start (default 0), limit (default 1000).
+    """
+    # Served by GET links, so confined to the storage directory
+    real_path = storage_file(request.args.get('path', ''))
+    if real_path is None:
+        return jsonify({"error": "File not found"}), 404
+    try:
+        pattern = hex_view.parse_pattern(request.args.get('pattern', ''))
+        start = int(request.args.get('start', 0))
+        limit = max(1, min(int(request.args.get('limit', hex_view.MAX_MATCHES)), hex_view.MAX_MATCHES))
+        matches, truncated = hex_view.search(str(real_path), pattern, start, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"matches": matches, "length": len(pattern), "truncated": truncated})
+
 @forensic_bp.route('/digest', methods=['POST'])
 def run_digest():
     """Calculate file hashes (MD5, SHA1, SHA256)."""
     data = request.json
     try:
         image_path = data.get('image_path')
-        img = load_image(image_path)
-        
-        if image_path.startswith("/storage"):
-             clean_path = image_path.replace("/storage", "", 1).lstrip("/")
-             disk_path = STORAGE_DIR / clean_path
-        else:
-             disk_path = Path(image_path)
-             
-        report = digest.generate_digest_report(str(disk_path), img)
-        return jsonify(report)
+        disk_path = resolve_path(image_path, relative_to_storage=False)
+        if not disk_path.exists():
+            raise FileNotFoundError(f"Image not found at {disk_path}")
+        
+        # Reuse the hashes taken at upload; decode only when the
+        # perceptual hashes are wanted and were not recorded
+        digest_report = digest.generate_digest_report(
+            str(disk_path),
+            image_hashes=bool(data.get('image_hashes', True)),
+            load_image=lambda: load_image(image_path),
+            precomputed=get_upload_store().record_for_path(disk_path),
+        )
+        return jsonify(digest_report)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -143,56 +341,37 @@ def run_reverse_search():
         
         # Local search
         if search_mode in ['local', 'both']:
-            query_img = cv.imread(str(query_path))
+            index = get_phash_index()
             
-            # Compute perceptual hash of query image
-            from PIL import Image
-            import imagehash
+            # Reuse the indexed hash when the query is itself an upload
+            query_hash = None
+            if query_path.parent.resolve() == index.uploads_dir.resolve():
+                query_hash = index.get(query_path.name)
+            if query_hash is None:
+                query_hash = phash_index.compute_phash(str(query_path))
             
-            query_img_rgb = cv.cvtColor(query_img, cv.COLOR_BGR2RGB)
-            query_pil = Image.fromarray(query_img_rgb)
-            query_hash = imagehash.phash(query_pil)
-            
-            # Search local database
-            uploads_dir = STORAGE_DIR / "uploads"
-            
-            for entry in uploads_dir.glob("*"):
-                if not entry.is_file() or entry.suffix.lower() not in ['.jpg', '.png', '.jpeg', '.webp']:
-                    continue
-                
-                # Skip the query image itself
-                try:
-                    if entry.samefile(query_path):
-                        continue
-                except:
-                    pass
+            if query_hash is not None:
+                # similarity > 0.7 <=> Hamming distance < 64 * 0.3
+                max_distance = int(phash_index.HASH_BITS * (1 - SIMILARITY_CUTOFF))
                 
-                try:
-                    # Compute hash of candidate image
-                    candidate_img = cv.imread(str(entry))
-                    if candidate_img is None:
-                        continue
-                        
-                    candidate_rgb = cv.cvtColor(candidate_img, cv.COLOR_BGR2RGB)
-                    candidate_pil = Image.fromarray(candidate_rgb)
-                    candidate_hash = imagehash.phash(candidate_pil)
-                    
-                    # Hamming distance (0 = identical, 64 = completely different)
-                    distance = query_hash - candidate_hash
+                for name, distance in index.search(query_hash, max_distance):
+                    # Skip the query image itself
+                    try:
+                        if (index.uploads_dir / name).samefile(query_path):
+                            continue
+                    except OSError:
+                        pass
                     
                     # Convert to similarity score (0-1, where 1 = identical)
                     similarity = 1.0 - (distance / 64.0)
                     
-                    # Only include if similarity > 70%
-                    if similarity > 0.7:
+                    if similarity > SIMILARITY_CUTOFF:
                         local_results.append({
-                            "filename": entry.name,
-                            "thumbnailUrl": f"/storage/uploads/{entry.name}",
+                            "filename": name,
+                            "thumbnailUrl": f"/storage/uploads/{name}",
                             "similarity": float(similarity),
                             "hash_distance": int(distance)
                         })
-                except Exception as e:
-                    continue
             
             # Sort by similarity (highest first)
             local_results.sort(key=lambda x: x['similarity'], reverse=True)
@@ -281,6 +460,7 @@ def run_reverse_search():
 # ============================================================================
 
 @forensic_bp.route('/various/median-filter', methods=['POST'])
+@cached_result
 def median_filtering():
     """Apply median filter for noise reduction."""
     try:
@@ -298,6 +478,7 @@ def median_filtering():
 
 
 @forensic_bp.route('/various/illuminant-map', methods=['POST'])
+@cached_result
 def illuminant_map():
     """Estimate illumination map."""
     try:
@@ -314,6 +495,7 @@ def illuminant_map():
 
 
 @forensic_bp.route('/various/dead-hot-pixels', methods=['POST'])
+@cached_result
 def dead_hot_pixels():
     """Detect sensor defects."""
     try:
@@ -334,14 +516,13 @@ def dead_hot_pixels():
 
 
 @forensic_bp.route('/various/stereogram', methods=['POST'])
+@cached_result
 def stereogram_decoder():
     """Decode autostereogram."""
     try:
         img = load_image(request.json.get('image_path'))
         
-        from imagesics_core.forensic.various import decode_stereogram
-        
-        result_bytes = decode_stereogram(img)
+        result_bytes = stereogram.decode_stereogram(img)
         result_url = save_bytes_result(result_bytes, "stereogram", "jpg")
         
         return jsonify({"result_url": result_url})
@@ -366,7 +547,7 @@ def get_header():
              real_path = path
              
         raw_hex = metadata.get_header_structure(real_path)
-        return jsonify({"hex": raw_hex})
+        return jsonify({"hex": raw_hex, "structure": metadata.get_container_structure(real_path)})
     except Exception as e:
         return jsonify({"error": str(e), "hex": ""})
 
@@ -382,6 +563,7 @@ def get_exif():
     return jsonify(metadata.get_exif_metadata(real_path))
 
 @forensic_bp.route('/metadata/thumbnail', methods=['GET'])
+@cached_result
 def get_thumbnail():
     """Extract embedded thumbnail."""
     path = request.args.get('path')
@@ -409,11 +591,34 @@ def get_gps():
             real_path = path
     return jsonify(metadata.get_gps_coords(real_path))
 
+@forensic_bp.route('/metadata/batch', methods=['POST'])
+def get_metadata_batch():
+    """
+    EXIF, GPS and thumbnail data of many files, streamed as NDJSON.
+    
+    Body: {"paths": [...], "thumbnails": false}. One JSON record per line
+    is written, in request order, as each batch of files is read.
+    """
+    data = request.json or {}
+    paths = data.get('paths')
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        return jsonify({"error": "paths must be a list of strings"}), 400
+    real_paths = [str(resolve_path(p, relative_to_storage=False)) for p in paths]
+    records = metadata.get_metadata_batch(real_paths, thumbnails=bool(data.get('thumbnails', False)))
+    
+    def generate():
+        for path, record in zip(paths, records):
+            record["path"] = path
+            yield json.dumps(record, default=str) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # ============================================================================
 # INSPECTION TOOLS
 # ============================================================================
 
 @forensic_bp.route('/histogram', methods=['POST'])
+@cached_result
 def run_histogram():
     """Compute RGB and luminance histograms."""
     try:
@@ -423,7 +628,55 @@ def run_histogram():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@forensic_bp.route('/histogram/stats', methods=['POST'])
+def histogram_stats():
+    """Histogram statistics over a [start, end] level range."""
+    data = request.get_json(silent=True) or {}
+    try:
+        start, end = int(data.get('start', 0)), int(data.get('end', 255))
+    except (TypeError, ValueError):
+        return jsonify({"error": "start and end must be integers"}), 400
+    try:
+        img = load_image(data.get('image_path') or '')
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 404
+    # Tables are memoized with the cached image: only the first request
+    # for an image reads its pixels
+    tables = histogram.histogram_tables(img)
+    channels = data.get('channels') or list(tables)
+    unknown = [c for c in channels if c not in tables]
+    if unknown:
+        return jsonify({"error": f"Unknown channel: {unknown[0]}"}), 400
+    return jsonify({"stats": {c: tables[c].stats(start, end).dict() for c in channels}})
+
+@forensic_bp.route('/histogram/colors', methods=['POST'])
+@cached_result
+def histogram_colors():
+    """Unique color count and, optionally, the most frequent colors."""
+    data = request.get_json(silent=True) or {}
+    try:
+        top = int(data.get('top', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "top must be an integer"}), 400
+    try:
+        img = load_image(data.get('image_path') or '')
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({"error": str(e)}), 404
+    unique_colors, unique_ratio = histogram.get_unique_colors_info(img)
+    result = {"unique_colors": unique_colors, "unique_ratio": unique_ratio}
+    if top > 0:
+        colors, counts = histogram.color_frequencies(img, top)
+        pixels = img.shape[0] * img.shape[1]
+        # BGR to "#rrggbb"; gray levels are repeated over the channels
+        result["palette"] = [
+            {"color": "#" + "".join(f"{v:02x}" for v in (color[::-1] if color.size == 3 else color.repeat(3))),
+             "count": int(count), "percent": round(count / pixels * 100, 3)}
+            for color, count in zip(colors, counts)
+        ]
+    return jsonify(result)
+
 @forensic_bp.route('/filter/adjust', methods=['POST'])
+@cached_result
 def adjust():
     """Global brightness/contrast/gamma adjustments."""
     try:
@@ -439,6 +692,7 @@ def adjust():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/filter/contrast', methods=['POST'])
+@cached_result
 def enhance_contrast():
     """Contrast enhancement detection."""
     try:
@@ -451,6 +705,7 @@ def enhance_contrast():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/inspection/compare', methods=['POST'])
+@cached_result
 def compare_images():
     """Reference comparison using SSIM, PSNR, and difference."""
     try:
@@ -475,6 +730,7 @@ def compare_images():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/inspection/magnifier', methods=['POST'])
+@cached_result
 def enhancing_magnifier():
     """ROI-based magnifier with adjustments."""
     try:
@@ -506,33 +762,23 @@ def enhancing_magnifier():
 # ============================================================================
 
 @forensic_bp.route('/detail/luminance', methods=['POST'])
+@cached_result
 def luminance_gradient():
     """Analyze luminance gradient for lighting consistency."""
     try:
         img = load_image(request.json.get('image_path'))
+        magnitude = filters.luminance_map(img)
+        result = filters.compute_luminance_gradient(img, magnitude=magnitude)
         
-        # Convert to grayscale
-        if len(img.shape) == 3:
-            gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
-        else:
-            gray = img
-            
-        # Compute gradients
-        grad_x = cv.Sobel(gray, cv.CV_64F, 1, 0, ksize=3)
-        grad_y = cv.Sobel(gray, cv.CV_64F, 0, 1, ksize=3)
-        
-        # Magnitude
-        magnitude = np.sqrt(grad_x**2 + grad_y**2)
-        magnitude_norm = cv.normalize(magnitude, None, 0, 255, cv.NORM_MINMAX).astype(np.uint8)
-        
-        # Apply colormap
-        result = cv.applyColorMap(magnitude_norm, cv.COLORMAP_JET)
-        
-        return jsonify({"result_url": save_result(result, "luminance")})
+        response = {"result_url": save_result(result, "luminance")}
+        if wants_raw_map():
+            response["map_url"] = save_map_result(magnitude, "luminance")
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/filter/echo', methods=['POST'])
+@cached_result
 def echo_filter():
     """Echo edge filter for high-frequency content."""
     try:
@@ -543,6 +789,7 @@ def echo_filter():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/wavelet', methods=['POST'])
+@cached_result
 def wavelet_analysis():
     """Wavelet threshold analysis."""
     try:
@@ -558,6 +805,7 @@ def wavelet_analysis():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/detail/frequency', methods=['POST'])
+@cached_result
 def frequency_split():
     """FFT-based frequency domain analysis."""
     try:
@@ -574,6 +822,7 @@ def frequency_split():
 # ============================================================================
 
 @forensic_bp.route('/plots/rgb', methods=['POST'])
+@cached_result
 def rgb_plots():
     """3D scatter plot of RGB/HSV pixels."""
     try:
@@ -589,6 +838,7 @@ def rgb_plots():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/colors/convert', methods=['POST'])
+@cached_result
 def color_space_conversion():
     """Convert and display different color spaces."""
     try:
@@ -608,6 +858,7 @@ def color_space_conversion():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/transform/pca', methods=['POST'])
+@cached_result
 def pca_transform():
     """PCA projection of color distribution."""
     try:
@@ -619,6 +870,7 @@ def pca_transform():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/analysis/stats', methods=['POST'])
+@cached_result
 def pixel_stats():
     """Compute pixel statistics (min, max, mean, variance)."""
     try:
@@ -633,27 +885,43 @@ def pixel_stats():
 # ============================================================================
 
 @forensic_bp.route('/noise', methods=['POST'])
+@cached_result
 def run_noise():
     """Signal separation (noise extraction)."""
     try:
         data = request.json
         img = load_image(data.get('image_path'))
-        result = noise.perform_noise_separation(img, **data.get('params', {}))
-        return jsonify({"result_url": save_result(result, "noise")})
+        params = data.get('params', {})
+        response = {}
+        if wants_raw_map():
+            map_params = {k: params[k] for k in ('mode', 'radius', 'sigma', 'grayscale') if k in params}
+            values = noise.noise_map(img, **map_params)
+            result = noise.perform_noise_separation(img, **params, noise=values)
+            response["map_url"] = save_map_result(values, "noise")
+        else:
+            result = noise.perform_noise_separation(img, **params)
+        response["result_url"] = save_result(result, "noise")
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/analysis/minmax', methods=['POST'])
+@cached_result
 def minmax_dev():
     """Min/Max deviation analysis."""
     try:
         img = load_image(request.json.get('image_path'))
-        res = pixel_analysis.compute_minmax_deviation(img)
-        return jsonify({"result_url": save_result(res, "minmax")})
+        deviation = pixel_analysis.minmax_map(img)
+        res = pixel_analysis.compute_minmax_deviation(img, deviation=deviation)
+        response = {"result_url": save_result(res, "minmax")}
+        if wants_raw_map():
+            response["map_url"] = save_map_result(deviation, "minmax")
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/noise/bitplane', methods=['POST'])
+@cached_result
 def bit_plane_analysis():
     """Bit plane value analysis."""
     try:
@@ -676,28 +944,19 @@ def bit_plane_analysis():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/noise/prnu', methods=['POST'])
+@cached_result
 def prnu_identification():
     """PRNU (sensor pattern noise) identification."""
     try:
         img = load_image(request.json.get('image_path'))
         
-        # Simplified PRNU extraction (high-pass filter)
-        if len(img.shape) == 3:
-            gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY).astype(np.float32)
-        else:
-            gray = img.astype(np.float32)
-            
-        # Denoise using Gaussian blur
-        denoised = cv.GaussianBlur(gray, (5, 5), 0)
-        
-        # Extract noise residual
-        prnu = gray - denoised
-        
-        # Normalize for visualization
-        prnu_norm = cv.normalize(prnu, None, 0, 255, cv.NORM_MINMAX).astype(np.uint8)
-        result = cv.applyColorMap(prnu_norm, cv.COLORMAP_JET)
+        prnu = noise.prnu_map(img)
+        result = noise.compute_prnu(img, prnu=prnu)
         
-        return jsonify({"result_url": save_result(result, "prnu")})
+        response = {"result_url": save_result(result, "prnu")}
+        if wants_raw_map():
+            response["map_url"] = save_map_result(prnu, "prnu")
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -706,31 +965,42 @@ def prnu_identification():
 # ============================================================================
 
 @forensic_bp.route('/jpeg/quality', methods=['POST'])
+@cached_result
 def jpeg_quality_estimation():
     """Estimate JPEG quality factor."""
     try:
-        img = load_image(request.json.get('image_path'))
-        result = jpeg_quality.compute_jpeg_quality_estimation(img)
+        data = request.json
+        img = load_image(data.get('image_path'))
+        result = jpeg_quality.compute_jpeg_quality_estimation(img, full_curve=bool(data.get('full_curve')))
         
         # Save plot
         plot_url = save_bytes_result(result['plot'], "quality_plot", "jpg")
-        return jsonify({"result_url": plot_url, "quality": "See plot for quality estimation"})
+        return jsonify({"result_url": plot_url, "quality": result['quality'], "errors": result['errors']})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/ela', methods=['POST'])
+@cached_result
 def run_ela():
     """Error Level Analysis."""
     try:
         data = request.json
         img = load_image(data.get('image_path'))
         params = data.get('params', {})
-        result = ela.perform_ela(img, **params)
-        return jsonify({"result_url": save_result(result, "ela")})
+        response = {}
+        if wants_raw_map():
+            difference = ela.ela_map(img, int(params.get('quality', 75)))
+            result = ela.perform_ela(img, **params, difference=difference)
+            response["map_url"] = save_map_result(difference, "ela")
+        else:
+            result = ela.perform_ela(img, **params)
+        response["result_url"] = save_result(result, "ela")
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/jpeg/ghost', methods=['POST'])
+@cached_result
 def jpeg_ghost():
     """JPEG ghost map detection."""
     try:
@@ -739,66 +1009,101 @@ def jpeg_ghost():
         
         # Create request object
         ghost_params = GhostMapRequest(**params)
-        result_bytes = ghost_maps.compute_ghost_maps(img, ghost_params)
+        maps, qualities = ghost_maps.ghost_map_stack(img, ghost_params)
+        result_bytes = ghost_maps.compute_ghost_maps(img, ghost_params, maps=maps)
         result_url = save_bytes_result(result_bytes, "ghost")
         
-        return jsonify({"result_url": result_url})
+        response = {"result_url": result_url}
+        if wants_raw_map():
+            # One layer per quality
+            response["map_url"] = save_map_result(maps, "ghost")
+            response["qualities"] = qualities
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/jpeg/compression', methods=['POST'])
+@cached_result
 def multiple_compression():
     """Multiple compression detection."""
     try:
         img = load_image(request.json.get('image_path'))
         
-        # Analyze compression artifacts across multiple quality levels
-        qualities = [50, 60, 70, 80, 90, 95]
-        errors = []
+        result_bytes = jpeg_quality.compute_multiple_compression(img)
         
-        if len(img.shape) == 3:
-            gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
-        else:
-            gray = img
-            
-        for q in qualities:
-            encode_param = [int(cv.IMWRITE_JPEG_QUALITY), q]
-            _, enc = cv.imencode('.jpg', gray, encode_param)
-            dec = cv.imdecode(enc, cv.IMREAD_GRAYSCALE)
-            
-            diff = cv.absdiff(gray, dec)
-            mae = float(np.mean(diff))
-            errors.append(mae)
-        
-        # Create visualization plot
-        import matplotlib
-        matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
-        from io import BytesIO
-        
-        fig, ax = plt.subplots(figsize=(8, 5))
-        ax.plot(qualities, errors, marker='o', linewidth=2, markersize=8)
-        ax.set_title('Multiple Compression Detection', fontsize=14, fontweight='bold')
-        ax.set_xlabel('JPEG Quality Level', fontsize=12)
-        ax.set_ylabel('Mean Absolute Error', fontsize=12)
-        ax.grid(True, alpha=0.3)
-        ax.set_facecolor('#f8f8f8')
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='jpg', dpi=100, bbox_inches='tight')
-        plt.close(fig)
-        buf.seek(0)
-        
-        result_url = save_bytes_result(buf.getvalue(), "compression", "jpg")
+        result_url = save_bytes_result(result_bytes, "compression", "jpg")
         return jsonify({"result_url": result_url})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def read_jpeg_bytes(path_str: str) -> bytes:
+    """Raw bytes of an uploaded file for bitstream-level JPEG analysis."""
+    path = resolve_path(path_str)
+    if not path.exists():
+        raise FileNotFoundError(f"Image not found at {path}")
+    return path.read_bytes()
+
+@forensic_bp.route('/jpeg/dct/quality', methods=['POST'])
+@cached_result
+def jpeg_dct_quality():
+    """Quality factor from the file's own quantization tables."""
+    try:
+        tables = jpeg_dct.read_quantization_tables(read_jpeg_bytes(request.json.get('image_path')))
+        result = jpeg_dct.estimate_quality(tables)
+        result["tables"] = {str(k): v.tolist() for k, v in tables.items()}
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@forensic_bp.route('/jpeg/dct/histograms', methods=['POST'])
+@cached_result
+def jpeg_dct_histograms():
+    """Double quantization histograms of DCT coefficients."""
+    try:
+        params = request.json.get('params', {})
+        coefficients = jpeg_dct.read_coefficients(read_jpeg_bytes(request.json.get('image_path')))
+        histograms = jpeg_dct.dq_histograms(
+            coefficients,
+            component=int(params.get('component', 0)),
+            frequencies=int(params.get('frequencies', 9)),
+            max_value=int(params.get('max_value', 32))
+        )
+        result_url = save_bytes_result(jpeg_dct.plot_dq_histograms(histograms), "dq_histograms")
+        return jsonify({"result_url": result_url, "histograms": histograms})
+    except (ValueError, IndexError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@forensic_bp.route('/jpeg/dct/ghost', methods=['POST'])
+@cached_result
+def jpeg_dct_ghost():
+    """JPEG ghost maps computed from the DCT coefficients (no re-encoding)."""
+    try:
+        image_path = request.json.get('image_path')
+        options = GhostMapRequest(**request.json.get('params', {}))
+        coefficients = jpeg_dct.read_coefficients(read_jpeg_bytes(image_path))
+        qualities = list(range(options.qmin, options.qmax + 1, options.qstep))
+        maps = jpeg_dct.dct_ghost_maps(coefficients, qualities)
+        result_bytes = ghost_maps.plot_ghost_maps(
+            maps, [f"Quality {q}" for q in qualities], "DCT ghost plots",
+            original=load_image(image_path) if options.include_original else None,
+            grayscale=options.grayscale
+        )
+        return jsonify({"result_url": save_bytes_result(result_bytes, "dct_ghost")})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # ============================================================================
 # TAMPERING TOOLS
 # ============================================================================
 
 @forensic_bp.route('/tampering/copymove', methods=['POST'])
+@cached_result
 def copy_move_detection():
     """Copy-move forgery detection."""
     try:
@@ -829,6 +1134,7 @@ def copy_move_detection():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/tampering/splicing', methods=['POST'])
+@cached_result
 def splicing_detection():
     """Composite splicing detection."""
     try:
@@ -843,33 +1149,50 @@ def splicing_detection():
         return jsonify({"error": str(e)}), 500
 
 @forensic_bp.route('/tampering/resampling', methods=['POST'])
+@cached_result
 def resampling_detection():
     """Image resampling detection."""
     try:
-        img = load_image(request.json.get('image_path'))
-        
-        # Resampling detection is computationally intensive
-        # Crop to smaller size for web performance
-        h, w = img.shape[:2]
-        if h > 512 or w > 512:
-            # Crop center 512x512
-            cy, cx = h // 2, w // 2
-            img = img[max(0, cy-256):cy+256, max(0, cx-256):cx+256]
+        data = request.json
+        img = load_image(data.get('image_path'))
         
-        # Use simplified parameters for faster processing
         from imagesics_core.forensic.resampling import ResamplingRequest, compute_resampling_analysis
         
+        # The whole image, or only the selected regions, is analysed;
+        # upsampling the spectrum would quadruple its size
         params = ResamplingRequest(
+            filter_5x5=bool(data.get('filter_5x5', False)),
+            selected_points=data.get('selected_points') or [],
+            regions=data.get('regions') or [],
             compute_fourier=True,
             hanning=True,
-            upsample=False,  # Disable upsampling for speed
+            upsample=False,
             highpass_1=True,
             gamma=4.0
         )
         
-        result_bytes = compute_resampling_analysis(img, params)
+        if resampling.regions_of(params):
+            rois = resampling.resampling_region_maps(img, params)
+            result_bytes = compute_resampling_analysis(img, params, regions=rois)
+            response = {
+                "result_url": save_bytes_result(result_bytes, "resampling", "jpg"),
+                "regions": [{"bbox": list(roi.bbox)} for roi in rois],
+            }
+            if wants_raw_map():
+                for entry, roi in zip(response["regions"], rois):
+                    entry["map_url"] = save_map_result(roi.p_map, "resampling")
+            return jsonify(response)
+        
+        maps = resampling.resampling_maps(img, params)
+        result_bytes = compute_resampling_analysis(img, params, maps=maps)
         result_url = save_bytes_result(result_bytes, "resampling", "jpg")
         
-        return jsonify({"result_url": result_url})
+        response = {"result_url": result_url}
+        if wants_raw_map():
+            response["map_url"] = save_map_result(maps[0], "resampling")
+        return jsonify(response)
+    except ValueError as e:
+        # Malformed or out-of-image regions
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+
+from imagesics_core.forensic import cloning, ghost_maps, jpeg_quality
+from imagesics_core.forensic.ghost_maps import GhostMapRequest
+from imagesics_core.forensic.resampling import ResamplingRequest, compute_resampling_analysis
+from imagesics_core.utils import jobs
+from routes.forensic import INDEX_DIR, load_image, resolve_path, save_result, save_bytes_result
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_MANAGER = jobs.JobManager(
+    max_workers=int(os.environ.get("IMAGESICS_JOB_WORKERS", 0)) or None,
+    state_dir=INDEX_DIR / "jobs"
+)
+
+# ============================================================================
+# JOB TASKS (run in worker processes)
+# ============================================================================
+
+def resampling_task(image_path: str, params: dict) -> dict:
+    """Resampling detection on the full-resolution image."""
+    img = load_image(image_path)
+    options = ResamplingRequest(**{"upsample": False, **params})
+    result_bytes = compute_resampling_analysis(img, options, progress=jobs.report_progress)
+    return {"result_url": save_bytes_result(result_bytes, "resampling", "jpg")}
+
+def ghost_task(image_path: str, params: dict) -> dict:
+    """JPEG ghost maps."""
+    img = load_image(image_path)
+    result_bytes = ghost_maps.compute_ghost_maps(
+        img, GhostMapRequest(**params), progress=jobs.report_progress
+    )
+    return {"result_url": save_bytes_result(result_bytes, "ghost")}
+
+def quality_task(image_path: str, params: dict) -> dict:
+    """JPEG quality estimation plot."""
+    img = load_image(image_path)
+    result = jpeg_quality.compute_jpeg_quality_estimation(
+        img, progress=jobs.report_progress, full_curve=bool(params.get('full_curve'))
+    )
+    return {"result_url": save_bytes_result(result['plot'], "quality_plot", "jpg"), "quality": result['quality']}
+
+def copymove_task(image_path: str, params: dict) -> dict:
+    """Copy-move forgery detection."""
+    img = load_image(image_path)
+    result_img, stats = cloning.perform_cloning_analysis(
+        img,
+        algorithm=params.get('algorithm', 'BRISK'),
+        response_threshold=int(params.get('response_threshold', 90)),
+        matching_threshold=int(params.get('matching_threshold', 20)),
+        distance_threshold=int(params.get('distance_threshold', 15)),
+        min_cluster_size=int(params.get('min_cluster_size', 5)),
+        progress=jobs.report_progress
+    )
+    return {"result_url": save_result(result_img, "copymove"), "stats": stats.dict()}
+
+JOB_TASKS = {
+    "resampling": resampling_task,
+    "ghost": ghost_task,
+    "quality": quality_task,
+    "copymove": copymove_task,
+}
+
+# ============================================================================
+# JOB API
+# ============================================================================
+
+@jobs_bp.route('/', methods=['POST'])
+def submit_job():
+    """Queue a heavy analysis and return its job id immediately."""
+    data = request.json or {}
+    tool = data.get('tool')
+    image_path = data.get('image_path')
+
+    if tool not in JOB_TASKS:
+        return jsonify({"error": f"Unknown tool: {tool}", "tools": sorted(JOB_TASKS)}), 400
+    if not image_path or not resolve_path(image_path).exists():
+        return jsonify({"error": "Image not found"}), 404
+
+    job_id = JOB_MANAGER.submit(tool, JOB_TASKS[tool], image_path, data.get('params', {}))
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events"
+    }), 202
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Current status, progress and (when done) result of a job."""
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job state changes as server-sent events until it finishes."""
+    if JOB_MANAGER.get(job_id) is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def stream():
+        last = None
+        while True:
+            job = JOB_MANAGER.get(job_id)
+            if job is None:
+                return
+            state = (job["status"], job["progress"], job["message"])
+            if state != last:
+                last = state
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in jobs.FINAL_STATES:
+                return
+            time.sleep(0.25)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache"})
@@ -1,8 +1,10 @@
 import os
-import uuid
 from pathlib import Path
 from flask import Blueprint, request, jsonify, current_app
 
+from imagesics_core.forensic import phash_index
+from imagesics_core.utils import upload_store
+
 uploads_bp = Blueprint('uploads', __name__)
 
 @uploads_bp.route('/', methods=['POST'])
@@ -16,22 +18,35 @@ def upload_file():
 
     if file:
         filename = file.filename
-        # Generate safe unique filename
-        unique_filename = f"{uuid.uuid4()}_{filename}"
         
         # Use config path
         # Assuming app.config['UPLOADS_FOLDER'] is set or relative path
         uploads_dir = os.path.join(os.getcwd(), 'storage', 'uploads')
-        os.makedirs(uploads_dir, exist_ok=True)
+        index_dir = os.path.join(os.getcwd(), 'storage', 'index')
         
-        save_path = os.path.join(uploads_dir, unique_filename)
-        file.save(save_path)
+        # Stream to disk while hashing; identical content is stored once
+        store = upload_store.get_store(Path(uploads_dir), Path(index_dir) / 'uploads')
+        record, duplicate = store.save(file.stream, filename)
+        unique_filename = record["id"]
+
+        # Keep the similar-search index current; never fail the upload over it
+        if not duplicate:
+            try:
+                # The first search of each worker indexes older files
+                index = phash_index.get_index(Path(index_dir) / 'phash.jsonl', Path(uploads_dir), sync=False)
+                is_image = Path(unique_filename).suffix.lower() in phash_index.IMAGE_EXTENSIONS
+                if is_image and record.get("phash"):
+                    index.add(unique_filename, int(record["phash"], 16))
+            except Exception as e:
+                print(f"Perceptual hash indexing error: {e}")
 
         return jsonify({
             "id": unique_filename,
             "filename": filename,
             "url": f"/storage/uploads/{unique_filename}",
-            "path": f"/storage/uploads/{unique_filename}" # Keeping relative for frontend use
+            "path": f"/storage/uploads/{unique_filename}", # Keeping relative for frontend use
+            "sha256": record["sha256"],
+            "duplicate": duplicate
         })
     
     return jsonify({"error": "Upload failed"}), 500
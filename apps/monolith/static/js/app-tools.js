@@ -99,6 +99,41 @@ async function showPixelStatistics(container) {
                     ${rows}
                 </table>
                 <p class="text-muted">Statistical analysis of pixel values per color channel</p>
+                <div id="colorPalette"></div>
+            `;
+            showColorPalette(document.getElementById('colorPalette'));
+        } else if (data.error) {
+            container.innerHTML = `<p class="text-error">Error: ${data.error}</p>`;
+        }
+    } catch (error) {
+        container.innerHTML = `<p class="text-error">Error: ${error.message}</p>`;
+    }
+}
+
+async function showColorPalette(container) {
+    try {
+        const response = await fetch('/api/forensic/histogram/colors', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ image_path: window.appState.currentImagePath, top: 16 })
+        });
+
+        const data = await response.json();
+
+        if (data.palette) {
+            const rows = data.palette.map(entry => `
+                <tr>
+                    <td><span style="display: inline-block; width: 14px; height: 14px; background: ${entry.color}; border: 1px solid var(--border-color);"></span> ${entry.color}</td>
+                    <td>${entry.count} (${entry.percent}%)</td>
+                </tr>`).join('');
+
+            container.innerHTML = `
+                <h4>Colors</h4>
+                <p>${data.unique_colors} unique colors (${data.unique_ratio}% of pixels)</p>
+                <table class="result-table">
+                    <tr><th>Most Frequent</th><th>Pixels</th></tr>
+                    ${rows}
+                </table>
             `;
         } else if (data.error) {
             container.innerHTML = `<p class="text-error">Error: ${data.error}</p>`;
@@ -198,28 +233,26 @@ async function showPRNU(container) {
 }
 
 // JPEG Tools
-async function showJPEGQuality(container) {
+async function showJPEGQuality(container, fullCurve = false) {
     try {
         const response = await fetch('/api/forensic/jpeg/quality', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image_path: window.appState.currentImagePath })
+            body: JSON.stringify({ image_path: window.appState.currentImagePath, full_curve: fullCurve })
         });
 
         const data = await response.json();
 
         if (data.result_url) {
-            container.innerHTML = `
-                <h4>JPEG Quality Estimation</h4>
-                <img src="${data.result_url}" class="result-image" alt="Quality Plot">
-                <p class="text-muted">Quality vs Error curve - local minima indicate compression quality</p>
-            `;
-        } else if (data.quality) {
             container.innerHTML = `
                 <h4>JPEG Quality Estimation</h4>
                 <p>Estimated Quality: <strong>${data.quality}</strong></p>
-                <p class="text-muted">Based on quantization table analysis</p>
+                <img src="${data.result_url}" class="result-image" alt="Quality Plot">
+                <p class="text-muted">Quality vs Error curve - the dip at the lowest error marks the compression quality</p>
+                ${fullCurve ? '' : '<button class="btn-primary" id="qualityFullCurve">Show full 0-100 curve</button>'}
             `;
+            const button = document.getElementById('qualityFullCurve');
+            if (button) button.addEventListener('click', () => showJPEGQuality(container, true));
         } else if (data.error) {
             container.innerHTML = `<p class="text-error">Error: ${data.error}</p>`;
         }
@@ -342,23 +375,54 @@ async function showSplicing(container) {
 }
 
 async function showResampling(container) {
+    container.innerHTML = `
+        <h4>Image Resampling Detection</h4>
+        <div class="form-group">
+            <label class="form-label">Regions (optional)</label>
+            <input type="text" class="form-input" id="resamplingRegions" placeholder="x0,y0,x1,y1; x,y,x,y,x,y">
+            <p class="text-muted">Rectangles by two corners or polygons by their points, separated by ";"</p>
+        </div>
+        <button class="btn-primary" onclick="runResampling()">Analyze</button>
+        <div id="resamplingResult"></div>
+    `;
+    await runResampling();
+}
+
+function parseRegions(text) {
+    return text.split(';').map(part => part.trim()).filter(part => part).map(part => {
+        const values = part.split(',').map(v => parseInt(v.trim()));
+        if (values.length < 4 || values.length % 2 || values.some(isNaN)) {
+            throw new Error(`Invalid region: ${part}`);
+        }
+        const points = [];
+        for (let i = 0; i < values.length; i += 2) points.push([values[i], values[i + 1]]);
+        return points;
+    });
+}
+
+async function runResampling() {
+    const resultDiv = document.getElementById('resamplingResult');
+    resultDiv.innerHTML = '<p class="text-muted">Processing...</p>';
     try {
+        const regions = parseRegions(document.getElementById('resamplingRegions').value);
         const response = await fetch('/api/forensic/tampering/resampling', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image_path: window.appState.currentImagePath })
+            body: JSON.stringify({ image_path: window.appState.currentImagePath, regions: regions })
         });
 
         const data = await response.json();
 
         if (data.result_url) {
-            container.innerHTML = `
-                <h4>Image Resampling Detection</h4>
+            const scope = data.regions ? `${data.regions.length} selected region(s)` : 'whole image';
+            resultDiv.innerHTML = `
                 <img src="${data.result_url}" class="result-image" alt="Resampling">
-                <p class="text-muted">Scaling artifact detection</p>
+                <p class="text-muted">Scaling artifact detection (${scope})</p>
             `;
+        } else if (data.error) {
+            resultDiv.innerHTML = `<p class="text-error">Error: ${data.error}</p>`;
         }
     } catch (error) {
-        container.innerHTML = `<p class="text-error">Error: ${error.message}</p>`;
+        resultDiv.innerHTML = `<p class="text-error">Error: ${error.message}</p>`;
     }
 }
@@ -472,7 +472,31 @@ async function showHeaderStructure(container) {
         const response = await fetch(`/api/forensic/metadata/header?path=${encodeURIComponent(window.appState.currentImagePath)}`);
         const data = await response.json();
 
+        const structure = data.structure || {};
+        const summarize = (fields) => Object.entries(fields || {})
+            .filter(([key]) => key !== 'tags')
+            .map(([key, value]) => `${key}: ${typeof value === 'object' ? JSON.stringify(value) : value}`)
+            .join(', ');
+        const rows = [];
+        const addRows = (entries, depth) => {
+            (entries || []).forEach(entry => {
+                rows.push(`<tr><td style="font-family: monospace;">0x${entry.offset.toString(16).toUpperCase()}</td><td>${entry.length}</td><td style="padding-left: ${0.5 + depth}rem;">${entry.name}</td><td>${summarize(entry.fields)}</td></tr>`);
+                ((entry.fields && entry.fields.tags) || []).forEach(tag => {
+                    rows.push(`<tr><td style="font-family: monospace;">0x${tag.offset.toString(16).toUpperCase()}</td><td></td><td style="padding-left: ${1.5 + depth}rem;">${tag.name}</td><td>${tag.value}</td></tr>`);
+                });
+                addRows(entry.children, depth + 1);
+            });
+        };
+        addRows(structure.entries, 0);
+
         container.innerHTML = `
+            <h4>File Structure${structure.format ? ` (${structure.format}, ${structure.size} bytes)` : ''}</h4>
+            ${structure.error ? `<p class="text-error">${structure.error}</p>` : ''}
+            ${rows.length ? `
+            <table class="result-table">
+                <tr><th>Offset</th><th>Length</th><th>Name</th><th>Fields</th></tr>
+                ${rows.join('')}
+            </table>` : ''}
             <h4>File Header</h4>
             <pre style="background: var(--bg-tertiary); padding: 1rem; border-radius: 6px; overflow-x: auto; font-size: 0.75rem; font-family: monospace;">${data.hex || 'No header data'}</pre>
         `;
@@ -573,15 +597,80 @@ async function showChannelHistogram(container) {
         container.innerHTML = `
             <h4>Channel Histogram</h4>
             <canvas id="histogramChart" style="width: 100%; height: 300px;"></canvas>
+            <div class="form-group">
+                <label class="form-label">Channel</label>
+                <select id="histogramChannel" class="form-select">
+                    <option value="value">Value</option>
+                    <option value="red">Red</option>
+                    <option value="green">Green</option>
+                    <option value="blue">Blue</option>
+                </select>
+            </div>
+            <div class="form-group">
+                <label class="form-label">Start: <span id="histogramStartValue">0</span></label>
+                <input type="range" class="form-range" min="0" max="255" value="0" id="histogramStart">
+            </div>
+            <div class="form-group">
+                <label class="form-label">End: <span id="histogramEndValue">255</span></label>
+                <input type="range" class="form-range" min="0" max="255" value="255" id="histogramEnd">
+            </div>
+            <div id="histogramStats"></div>
         `;
 
         // Render histogram using Chart.js
         renderHistogram(data);
+
+        ['histogramChannel', 'histogramStart', 'histogramEnd'].forEach(id => {
+            document.getElementById(id).addEventListener('input', updateHistogramStats);
+        });
+        updateHistogramStats();
     } catch (error) {
         container.innerHTML = `<p class="text-error">Error: ${error.message}</p>`;
     }
 }
 
+// Range statistics come from server-side prefix sums, so slider moves
+// never trigger a pass over the image; only the latest request is shown
+let histogramStatsRequest = 0;
+
+async function updateHistogramStats() {
+    const channel = document.getElementById('histogramChannel').value;
+    const start = parseInt(document.getElementById('histogramStart').value);
+    const end = parseInt(document.getElementById('histogramEnd').value);
+    document.getElementById('histogramStartValue').textContent = start;
+    document.getElementById('histogramEndValue').textContent = end;
+
+    const requestId = ++histogramStatsRequest;
+    try {
+        const response = await fetch('/api/forensic/histogram/stats', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                image_path: window.appState.currentImagePath,
+                channels: [channel],
+                start: start,
+                end: end
+            })
+        });
+        const data = await response.json();
+        if (requestId !== histogramStatsRequest) return;
+
+        const statsDiv = document.getElementById('histogramStats');
+        if (!statsDiv) return;
+        if (!data.stats) {
+            statsDiv.innerHTML = `<p class="text-error">Error: ${data.error || 'Unknown error'}</p>`;
+            return;
+        }
+        const rows = Object.entries(data.stats[channel]).map(([key, value]) =>
+            `<tr><td>${key.replace(/_/g, ' ')}</td><td>${Array.isArray(value) ? value.join(' - ') : value}</td></tr>`
+        ).join('');
+        statsDiv.innerHTML = `<table class="result-table">${rows}</table>`;
+    } catch (error) {
+        const statsDiv = document.getElementById('histogramStats');
+        if (statsDiv) statsDiv.innerHTML = `<p class="text-error">Error: ${error.message}</p>`;
+    }
+}
+
 function showGlobalAdjustments(container) {
     container.innerHTML = `
         <h4>Global Adjustments</h4>
@@ -67,26 +67,37 @@ class HexEditor {
         `;
     }
 
-    async loadData(offset = 0) {
-        try {
-            const response = await fetch('/api/forensic/hex', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    image_path: this.filePath,
-                    offset: offset,
-                    length: this.bytesPerRow * this.rowsPerPage
-                })
-            });
+    async fetchBytes(offset, length) {
+        // Byte range of the file; the server answers Range requests with 206
+        const url = `/api/forensic/hex/raw?path=${encodeURIComponent(this.filePath)}`;
+        const response = await fetch(url, {
+            headers: { 'Range': `bytes=${offset}-${offset + length - 1}` }
+        });
 
-            const result = await response.json();
+        const range = response.headers.get('Content-Range');
+        const total = range ? parseInt(range.split('/')[1]) : null;
 
-            if (result.error) {
-                this.showError(result.error);
-                return;
-            }
+        if (response.status === 416) {
+            // Past the end of the file
+            return { data: new Uint8Array(0), offset: offset, total: total || 0 };
+        }
+        if (!response.ok) {
+            let message = response.statusText;
+            try {
+                message = (await response.json()).error || message;
+            } catch (e) { /* not JSON */ }
+            throw new Error(message);
+        }
+
+        const data = new Uint8Array(await response.arrayBuffer());
+        return { data: data, offset: offset, total: total !== null ? total : data.length };
+    }
+
+    async loadData(offset = 0) {
+        try {
+            const result = await this.fetchBytes(offset, this.bytesPerRow * this.rowsPerPage);
 
-            this.totalSize = result.total_size;
+            this.totalSize = result.total;
             this.offset = result.offset;
 
             // Update file info (if element exists)
@@ -283,25 +294,15 @@ class HexEditor {
 
         try {
             // Get original file data
-            const response = await fetch('/api/forensic/hex', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    image_path: this.filePath,
-                    offset: 0,
-                    length: this.totalSize
-                })
-            });
-
-            const result = await response.json();
+            const response = await fetch(`/api/forensic/hex/raw?path=${encodeURIComponent(this.filePath)}`);
 
-            if (result.error) {
-                alert('Error loading file: ' + result.error);
+            if (!response.ok) {
+                alert('Error loading file: ' + response.statusText);
                 return;
             }
 
             // Apply modifications
-            const fileData = new Uint8Array(result.data);
+            const fileData = new Uint8Array(await response.arrayBuffer());
 
             for (const [address, value] of this.modified.entries()) {
                 if (address < fileData.length) {
@@ -352,19 +353,9 @@ class HexEditor {
         this.loading = true;
 
         try {
-            const response = await fetch('/api/forensic/hex', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    image_path: this.filePath,
-                    offset: offset,
-                    length: this.bytesPerRow * this.rowsPerPage
-                })
-            });
+            const result = await this.fetchBytes(offset, this.bytesPerRow * this.rowsPerPage);
 
-            const result = await response.json();
-
-            if (!result.error && result.data.length > 0) {
+            if (result.data.length > 0) {
                 const contentDiv = document.getElementById('hexEditorContent');
                 const currentScrollTop = contentDiv.scrollTop;
 
@@ -388,7 +379,7 @@ class HexEditor {
         }
     }
 
-    search() {
+    async search() {
         const searchInput = document.getElementById('hexSearchInput');
         const query = searchInput.value.trim().toUpperCase().replace(/\s/g, '');
 
@@ -409,73 +400,39 @@ class HexEditor {
             return;
         }
 
-        // Clear previous highlights
-        document.querySelectorAll('.search-highlight, .search-current').forEach(el => {
-            el.classList.remove('search-highlight', 'search-current');
-        });
-
-        // Find all matches in current view
-        const bytes = document.querySelectorAll('.hex-byte:not(.empty)');
-        this.searchResults = [];
-        const patternLength = query.length / 2;
-
-        let i = 0;
-        while (i < bytes.length) {
-            const byteElem = bytes[i];
-
-            // Check if this position starts a match
-            if (byteElem.textContent.trim() === query.substring(0, 2)) {
-                let match = true;
-
-                // Check if entire pattern matches
-                for (let j = 1; j < patternLength; j++) {
-                    const nextByte = bytes[i + j];
-                    const expectedHex = query.substring(j * 2, j * 2 + 2);
-
-                    if (!nextByte || nextByte.textContent.trim() !== expectedHex) {
-                        match = false;
-                        break;
-                    }
-                }
-
-                if (match) {
-                    // Store this match
-                    const matchElements = [];
-                    for (let j = 0; j < patternLength; j++) {
-                        matchElements.push(bytes[i + j]);
-                    }
-
-                    this.searchResults.push({
-                        startIndex: i,
-                        length: patternLength,
-                        elements: matchElements
-                    });
-
-                    // Skip past this match to avoid overlapping
-                    i += patternLength;
-                    continue;
-                }
-            }
-
-            i++;
+        // Search the whole file on the server
+        let result;
+        try {
+            const params = new URLSearchParams({ path: this.filePath, pattern: query });
+            const response = await fetch(`/api/forensic/hex/search?${params}`);
+            result = await response.json();
+        } catch (error) {
+            alert('Search failed: ' + error.message);
+            return;
+        }
+        if (result.error) {
+            alert(result.error);
+            return;
         }
 
         this.lastSearchQuery = query;
+        this.searchResults = result.matches.map(offset => ({ offset: offset, length: result.length }));
 
         if (this.searchResults.length > 0) {
             this.currentSearchIndex = 0;
-            this.highlightSearchResult(0);
+            await this.highlightSearchResult(0);
 
             // Enable navigation buttons
             document.getElementById('hexFindNext').disabled = false;
             document.getElementById('hexFindPrev').disabled = false;
 
-            showToast(`Found ${this.searchResults.length} match(es)`, 'success');
+            const more = result.truncated ? '+' : '';
+            showToast(`Found ${this.searchResults.length}${more} match(es)`, 'success');
         } else {
             this.currentSearchIndex = -1;
             document.getElementById('hexFindNext').disabled = true;
             document.getElementById('hexFindPrev').disabled = true;
-            alert('Pattern not found in current view');
+            alert('Pattern not found');
         }
     }
 
@@ -495,42 +452,47 @@ class HexEditor {
         this.highlightSearchResult(this.currentSearchIndex);
     }
 
-    highlightSearchResult(index) {
-        // Clear all current highlights
-        document.querySelectorAll('.search-current').forEach(el => {
-            el.classList.remove('search-current');
-        });
+    async highlightSearchResult(index) {
+        const match = this.searchResults[index];
+        if (!match) return;
 
-        // Remove all highlights first
-        document.querySelectorAll('.search-highlight').forEach(el => {
-            el.classList.remove('search-highlight');
+        // Load the page holding the match unless it is already displayed
+        const shown = document.querySelector(`.hex-byte[data-address="${match.offset}"]`);
+        if (!shown) {
+            const rowStart = match.offset - (match.offset % this.bytesPerRow);
+            await this.loadData(Math.max(0, rowStart - 4 * this.bytesPerRow));
+        }
+
+        // Clear previous highlights
+        document.querySelectorAll('.search-highlight, .search-current').forEach(el => {
+            el.classList.remove('search-highlight', 'search-current');
         });
 
-        // Highlight all matches in light green
-        this.searchResults.forEach((result) => {
-            result.elements.forEach(el => {
+        // Highlight every displayed match, the current one in bright green
+        let first = null;
+        for (const result of this.searchResults) {
+            for (let k = 0; k < result.length; k++) {
+                const el = document.querySelector(`.hex-byte[data-address="${result.offset + k}"]`);
+                if (!el) continue;
                 el.classList.add('search-highlight');
-            });
-        });
+                if (result === match) {
+                    el.classList.add('search-current');
+                    first = first || el;
+                }
+            }
+        }
 
-        // Highlight current match in bright green
-        if (this.searchResults[index]) {
-            this.searchResults[index].elements.forEach(el => {
-                el.classList.add('search-current');
+        // Scroll to current match
+        if (first) {
+            first.scrollIntoView({
+                behavior: 'smooth',
+                block: 'center'
             });
-
-            // Scroll to current match
-            if (this.searchResults[index].elements[0]) {
-                this.searchResults[index].elements[0].scrollIntoView({
-                    behavior: 'smooth',
-                    block: 'center'
-                });
-            }
         }
 
         // Update footer
         document.getElementById('hexPositionInfo').textContent =
-            `Match ${index + 1} of ${this.searchResults.length}`;
+            `Match ${index + 1} of ${this.searchResults.length} at 0x${this.formatAddress(match.offset)}`;
     }
 
     gotoAddress() {
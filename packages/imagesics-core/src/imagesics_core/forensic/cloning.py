@@ -1,8 +1,9 @@
 from itertools import compress
 import cv2 as cv
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 from pydantic import BaseModel
+from scipy.spatial import cKDTree
 
 class CloningResult(BaseModel):
     keypoints_count: int
@@ -13,6 +14,80 @@ class CloningResult(BaseModel):
     # We might want to return coordinates of matches/clusters for frontend drawing
     # But for now, we will return the processed image if requested via API.
 
+def _cluster_matches(
+    points: np.ndarray,
+    query: np.ndarray,
+    train: np.ndarray,
+    ds: np.ndarray,
+    min_dist: float,
+    min_cluster_size: int
+) -> List[np.ndarray]:
+    """
+    Group geometrically consistent matches.
+    
+    The group of match i holds i and every later match j of similar length
+    whose endpoints both lie within min_dist of i's endpoints (in the same
+    or swapped order), except the mirror of a match already in the group.
+    Candidate pairs come from KD-tree radius queries over the endpoint
+    pairs, so the cost follows the number of nearby pairs instead of all
+    O(M^2) pairs.
+    
+    Returns:
+        Index arrays (into the match arrays) of groups with at least
+        min_cluster_size members, ordered by their first match.
+    """
+    n = len(ds)
+    if n == 0:
+        return []
+    a = points[query]
+    b = points[train]
+    # Both endpoints within min_dist implies the (a, b) vectors are within
+    # min_dist in the max norm, which the trees search for.
+    tree = cKDTree(np.hstack([a, b]))
+    
+    # Same orientation: a_i near a_j and b_i near b_j
+    pairs_same = tree.query_pairs(min_dist, p=np.inf, output_type='ndarray')
+    # Swapped orientation: a_i near b_j and b_i near a_j
+    pairs_swapped = tree.sparse_distance_matrix(
+        cKDTree(np.hstack([b, a])), min_dist, p=np.inf, output_type='ndarray'
+    )
+    
+    i = np.concatenate([pairs_same[:, 0], pairs_swapped['i']]).astype(np.int64)
+    j = np.concatenate([pairs_same[:, 1], pairs_swapped['j']]).astype(np.int64)
+    pair_keys = np.unique(np.minimum(i, j) * n + np.maximum(i, j))
+    i, j = pair_keys // n, pair_keys % n
+    valid = i < j
+    i, j = i[valid], j[valid]
+    
+    def near(p, q):
+        d = np.linalg.norm(p - q, axis=1)
+        return (d > 0) & (d < min_dist)
+    
+    consistent = (
+        (near(a[i], a[j]) & near(b[i], b[j])) | (near(a[i], b[j]) & near(b[i], a[j]))
+    ) & (np.abs(ds[i] - ds[j]) <= min_dist)
+    i, j = i[consistent], j[consistent]
+    
+    # Mirror (train, query) of each match, or -1. A later match is dropped
+    # when its mirror is the group's first match or lies between it and
+    # the match (the mirror passes the same test, so it is a member).
+    width = int(max(query.max(), train.max())) + 1
+    keys = query * width + train
+    order = np.argsort(keys)
+    pos = np.searchsorted(keys[order], train * width + query)
+    pos = np.minimum(pos, n - 1)
+    mirror = np.where(keys[order][pos] == train * width + query, order[pos], -1)
+    unique = ~((mirror[j] >= i) & (mirror[j] < j))
+    i, j = i[unique], j[unique]
+    
+    counts = np.bincount(i, minlength=n) + 1
+    starts = np.searchsorted(i, np.arange(n))
+    ends = np.searchsorted(i, np.arange(n), side='right')
+    return [
+        np.concatenate([[k], j[starts[k]:ends[k]]])
+        for k in np.flatnonzero(counts >= min_cluster_size)
+    ]
+
 def perform_cloning_analysis(
     image: np.ndarray,
     algorithm: str = "BRISK",
@@ -21,7 +96,8 @@ def perform_cloning_analysis(
     distance_threshold: int = 15, # 0-100
     min_cluster_size: int = 5,
     mask: Optional[np.ndarray] = None,
-    draw_output: bool = True
+    draw_output: bool = True,
+    progress: Optional[Callable[[float], None]] = None
 ) -> Tuple[np.ndarray, CloningResult]:
     
     gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
@@ -38,7 +114,10 @@ def perform_cloning_analysis(
         
     kpts, desc = detector.detectAndCompute(gray, mask)
     if kpts is None or len(kpts) == 0:
-         return image, CloningResult(0,0,0,0,0)
+         return image, CloningResult(
+             keypoints_count=0, filtered_count=0, matches_count=0,
+             clusters_count=0, regions_count=0
+         )
 
     total_kpts = len(kpts)
     
@@ -54,7 +133,10 @@ def perform_cloning_analysis(
     
     filtered_count = len(kpts)
     if filtered_count < 2 or desc is None:
-         return image, CloningResult(total_kpts, filtered_count, 0, 0, 0)
+         return image, CloningResult(
+             keypoints_count=total_kpts, filtered_count=filtered_count,
+             matches_count=0, clusters_count=0, regions_count=0
+         )
 
     # Matching
     matching_val = matching_threshold / 100 * 255
@@ -65,104 +147,68 @@ def perform_cloning_analysis(
     if raw_matches:
         matches = [item for sublist in raw_matches for item in sublist]
         matches = [m for m in matches if m.queryIdx != m.trainIdx]
-        
-    matches_count = len(matches)
+    
+    if progress is not None:
+        progress(0.3)
     
     # Clustering
-    clusters = []
     distance_val = distance_threshold / 100
     min_dist = distance_val * np.min(gray.shape) / 2
     
-    if matches:
-        kpts_a = np.array([p.pt for p in kpts])
-        ds = np.linalg.norm(
-            [kpts_a[m.queryIdx] - kpts_a[m.trainIdx] for m in matches], axis=1
-        )
-        # Filter matches by min distance
-        matches = [m for i, m in enumerate(matches) if ds[i] > min_dist]
-        ds = ds[ds > min_dist] # Update ds to match filtered matches
-        
-        # Cluster logic (simplified port of original O(N^2))
-        total_clusters = len(matches)
-        # Note: Original logic is complex. Implementing simplified version for now.
-        # Actually, let's try to match logic.
-        visited = [False] * total_clusters # Not used?
-        
-        for i in range(total_clusters):
-            match0 = matches[i]
-            d0 = ds[i]
-            group = [match0]
-            
-            for j in range(i + 1, total_clusters):
-                match1 = matches[j]
-                d1 = ds[j]
-                if np.abs(d0 - d1) > min_dist:
-                    continue
-                
-                # Check spatial consistency
-                a0 = np.array(kpts[match0.queryIdx].pt)
-                b0 = np.array(kpts[match0.trainIdx].pt)
-                a1 = np.array(kpts[match1.queryIdx].pt)
-                b1 = np.array(kpts[match1.trainIdx].pt)
-                
-                aa = np.linalg.norm(a0 - a1)
-                bb = np.linalg.norm(b0 - b1)
-                ab = np.linalg.norm(a0 - b1)
-                ba = np.linalg.norm(b0 - a1)
-                
-                if not (0 < aa < min_dist and 0 < bb < min_dist or 0 < ab < min_dist and 0 < ba < min_dist):
-                    continue
-                
-                # Deduplicate?
-                found = False
-                for g in group:
-                    if g.queryIdx == match1.trainIdx and g.trainIdx == match1.queryIdx:
-                        found = True
-                        break
-                if not found:
-                    group.append(match1)
-            
-            if len(group) >= min_cluster_size:
-                clusters.append(group)
+    points = np.array([k.pt for k in kpts], dtype=np.float64)
+    query = np.array([m.queryIdx for m in matches], dtype=np.int64)
+    train = np.array([m.trainIdx for m in matches], dtype=np.int64)
+    match_dist = np.array([m.distance for m in matches], dtype=np.float64)
+    
+    # Filter matches by min distance
+    ds = np.linalg.norm(points[query] - points[train], axis=1) if matches else np.empty(0)
+    keep = ds > min_dist
+    query, train, match_dist, ds = query[keep], train[keep], match_dist[keep], ds[keep]
+    
+    clusters = _cluster_matches(points, query, train, ds, min_dist, min_cluster_size)
+    
+    if progress is not None:
+        progress(0.9)
+    
+    members = np.concatenate(clusters) if clusters else np.empty(0, dtype=np.int64)
+    sizes = np.array([k.size for k in kpts], dtype=np.float64)
     
     # Output Drawing
     output = np.copy(image)
-    if draw_output:
-        # Original logic for drawing
-        hsv = np.zeros((1, 1, 3))
-        angles = []
-        for c in clusters:
-            for m in c:
-                ka = kpts[m.queryIdx]
-                pa = tuple(map(int, ka.pt))
-                sa = int(np.round(ka.size))
-                kb = kpts[m.trainIdx]
-                pb = tuple(map(int, kb.pt))
-                sb = int(np.round(kb.size))
-                
-                angle = np.arctan2(pb[1] - pa[1], pb[0] - pa[0])
-                if angle < 0:
-                    angle += np.pi
-                angles.append(angle)
-                
-                hsv[0, 0, 0] = angle / np.pi * 180
-                hsv[0, 0, 1] = 255
-                hsv[0, 0, 2] = m.distance / matching_val * 255 if matching_val > 0 else 0
-                rgb = cv.cvtColor(hsv.astype(np.uint8), cv.COLOR_HSV2BGR)
-                color = tuple([int(x) for x in rgb[0, 0]])
-                
-                cv.circle(output, pa, sa, color, 1, cv.LINE_AA)
-                cv.circle(output, pb, sb, color, 1, cv.LINE_AA)
-                cv.line(output, pa, pb, color, 1, cv.LINE_AA)
+    if draw_output and len(members):
+        pa = points[query[members]].astype(int)
+        pb = points[train[members]].astype(int)
+        sa = np.round(sizes[query[members]]).astype(int).tolist()
+        sb = np.round(sizes[train[members]]).astype(int).tolist()
+        
+        # Hue from the match direction, value from descriptor distance
+        angles = np.arctan2(pb[:, 1] - pa[:, 1], pb[:, 0] - pa[:, 0])
+        angles[angles < 0] += np.pi
+        hsv = np.empty((len(members), 1, 3), dtype=np.uint8)
+        hsv[:, 0, 0] = (angles / np.pi * 180).astype(np.uint8)
+        hsv[:, 0, 1] = 255
+        value = match_dist[members] / matching_val * 255 if matching_val > 0 else 0
+        hsv[:, 0, 2] = np.asarray(value).astype(np.uint8)
+        colors = cv.cvtColor(hsv, cv.COLOR_HSV2BGR)[:, 0].tolist()
+        
+        for a, b, ra, rb, color in zip(map(tuple, pa.tolist()), map(tuple, pb.tolist()), sa, sb, colors):
+            cv.circle(output, a, ra, color, 1, cv.LINE_AA)
+            cv.circle(output, b, rb, color, 1, cv.LINE_AA)
+            cv.line(output, a, b, color, 1, cv.LINE_AA)
 
-    # Region counting logic
+    # Regions: connected areas covered by the keypoints of clustered matches
     regions = 0
-    # ... (omitted for brevity, can implement if needed)
+    if len(members):
+        covered = np.zeros(gray.shape, dtype=np.uint8)
+        for idx in np.unique(np.concatenate([query[members], train[members]])):
+            center = tuple(points[idx].astype(int).tolist())
+            cv.circle(covered, center, max(1, int(np.round(sizes[idx]))), 255, -1)
+        regions = cv.connectedComponents(covered)[0] - 1
 
     return output, CloningResult(
         keypoints_count=total_kpts,
         filtered_count=filtered_count,
-        matches_count=len(matches),
+        matches_count=len(ds),
         clusters_count=len(clusters),
         regions_count=regions
     )
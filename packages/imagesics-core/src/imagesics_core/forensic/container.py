@@ -0,0 +1,430 @@
+"""
+Container structure of JPEG, PNG and TIFF files.
+
+Walks JPEG marker segments, PNG chunks and TIFF IFDs (including the TIFF
+structure inside a JPEG Exif segment) without decoding any pixels. The
+file is memory-mapped, so only the headers are read: payloads are
+skipped by their lengths, and the one linear step, finding the end of
+JPEG entropy-coded data, is a C regex scan over the mapping.
+
+Each structure entry is {"offset", "length", "name", "fields"} (plus
+"children" for nested IFDs), where offset and length cover the whole
+segment, chunk or IFD. Results are cached by file digest.
+"""
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from imagesics_core.forensic.jpeg_dct import SOS, iter_segments
+from imagesics_core.utils.result_cache import file_sha256
+
+CACHE_SIZE = 64
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Values of TIFF entries with more items than this are summarized
+MAX_VALUES = 16
+MAX_TEXT = 256
+MAX_IFDS = 64
+
+_SOF_PROCESS = {
+    0xC0: "Baseline DCT", 0xC1: "Extended sequential DCT", 0xC2: "Progressive DCT",
+    0xC3: "Lossless", 0xC5: "Differential sequential DCT", 0xC6: "Differential progressive DCT",
+    0xC7: "Differential lossless", 0xC9: "Extended sequential DCT, arithmetic",
+    0xCA: "Progressive DCT, arithmetic", 0xCB: "Lossless, arithmetic",
+    0xCD: "Differential sequential DCT, arithmetic", 0xCE: "Differential progressive DCT, arithmetic",
+    0xCF: "Differential lossless, arithmetic",
+}
+
+# TIFF field types: (struct code, size)
+_TIFF_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1),
+    7: ("B", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8),
+    13: ("I", 4),
+}
+
+# Tags that point to sub-IFDs, with the tag table their entries use
+_SUB_IFDS = {34665: "Exif", 34853: "GPS", 40965: "Interop", 330: "SubIFD"}
+
+_PNG_COLOR_TYPES = {0: "Grayscale", 2: "RGB", 3: "Palette", 4: "Grayscale + alpha", 6: "RGBA"}
+
+
+class ContainerError(ValueError):
+    """The file is not a supported container or is truncated."""
+
+
+def _u16(data, offset: int, big: bool = True) -> int:
+    return int.from_bytes(data[offset:offset + 2], "big" if big else "little")
+
+
+def _u32(data, offset: int, big: bool = True) -> int:
+    return int.from_bytes(data[offset:offset + 4], "big" if big else "little")
+
+
+def _text(raw: bytes) -> str:
+    text = raw.decode("latin-1").rstrip("\x00")
+    return text if len(text) <= MAX_TEXT else text[:MAX_TEXT] + "..."
+
+
+# ---------------------------------------------------------------------------
+# TIFF
+# ---------------------------------------------------------------------------
+
+def _tag_names(table: str) -> Dict[int, str]:
+    from PIL import ExifTags, TiffTags
+
+    if table == "GPS":
+        return ExifTags.GPSTAGS
+    names = {tag: info[0] for tag, info in TiffTags.TAGS_V2.items()}
+    names.update(ExifTags.TAGS)
+    return names
+
+
+def _tiff_value(data, base: int, entry: int, field_type: int, count: int, big: bool) -> Tuple[Any, int]:
+    """Decoded value of an IFD entry and the offset of its data."""
+    code, size = _TIFF_TYPES.get(field_type, ("B", 1))
+    total = size * count
+    if total <= 4:
+        offset = entry + 8
+    else:
+        offset = base + _u32(data, entry + 8, big)
+    if field_type == 2:
+        return _text(bytes(data[offset:offset + min(count, MAX_TEXT + 1)])), offset
+    if field_type == 7 or count > MAX_VALUES:
+        return f"<{total} bytes>", offset
+    raw = bytes(data[offset:offset + total])
+    if len(raw) < total:
+        return "<truncated>", offset
+    values = struct.unpack(("<>"[big]) + code * count, raw)
+    if field_type in (5, 10):
+        values = tuple(f"{n}/{d}" for n, d in zip(values[::2], values[1::2]))
+    return (values[0] if len(values) == 1 else list(values)), offset
+
+
+def _walk_ifds(data, base: int, first: int, big: bool, table: str, label: str,
+               seen: set, ifds: List[dict], depth: int = 0) -> None:
+    """Append the entries of an IFD chain starting at base + first to ifds."""
+    names = _tag_names(table)
+    offset = first
+    index = 0
+    while offset and len(seen) < MAX_IFDS:
+        start = base + offset
+        if start in seen or start + 2 > len(data):
+            break
+        seen.add(start)
+        count = _u16(data, start, big)
+        end = start + 2 + 12 * count + 4
+        if end > len(data):
+            raise ContainerError(f"Truncated IFD at offset {start}")
+
+        tags = []
+        children: List[dict] = []
+        name = f"{label} {index}" if table == "Image" else label
+        ifd = {"offset": start, "length": end - start, "name": name,
+               "fields": {"entries": count, "tags": tags}}
+        ifds.append(ifd)
+        for k in range(count):
+            entry = start + 2 + 12 * k
+            tag = _u16(data, entry, big)
+            field_type = _u16(data, entry + 2, big)
+            n = _u32(data, entry + 4, big)
+            value, value_offset = _tiff_value(data, base, entry, field_type, n, big)
+            tags.append({"tag": tag, "name": names.get(tag, f"0x{tag:04X}"), "type": field_type,
+                         "count": n, "offset": value_offset, "value": value})
+            if tag in _SUB_IFDS and depth < 4:
+                pointers = value if isinstance(value, list) else [value]
+                for pointer in pointers:
+                    if isinstance(pointer, int):
+                        ifd["children"] = children
+                        _walk_ifds(data, base, pointer, big, _SUB_IFDS[tag],
+                                   _SUB_IFDS[tag], seen, children, depth + 1)
+        if not children:
+            ifd.pop("children", None)
+        offset = _u32(data, end - 4, big) if table == "Image" else 0
+        index += 1
+
+
+def _parse_tiff_header(data, entries: List[dict], base: int = 0) -> None:
+    """Append the TIFF header at base and its IFDs to entries."""
+    order = bytes(data[base:base + 2])
+    if order not in (b"II", b"MM"):
+        raise ContainerError("Not a TIFF structure")
+    big = order == b"MM"
+    magic = _u16(data, base + 2, big)
+    header = {"offset": base, "length": 8, "name": "TIFF header",
+              "fields": {"byte_order": "Big-endian" if big else "Little-endian", "magic": magic}}
+    entries.append(header)
+    if magic == 43:
+        header["fields"]["variant"] = "BigTIFF (IFDs not parsed)"
+        return
+    if magic != 42:
+        raise ContainerError(f"Unknown TIFF magic {magic}")
+    first = _u32(data, base + 4, big)
+    header["fields"]["first_ifd"] = first
+    _walk_ifds(data, base, first, big, "Image", "IFD", set(), entries)
+
+
+# ---------------------------------------------------------------------------
+# JPEG
+# ---------------------------------------------------------------------------
+
+def _jpeg_marker_name(marker: int) -> str:
+    if 0xE0 <= marker <= 0xEF:
+        return f"APP{marker - 0xE0}"
+    if marker in _SOF_PROCESS:
+        return f"SOF{marker - 0xC0}"
+    if 0xD0 <= marker <= 0xD7:
+        return f"RST{marker - 0xD0}"
+    return {0xC4: "DHT", 0xCC: "DAC", 0xDA: "SOS", 0xDB: "DQT", 0xDD: "DRI", 0xFE: "COM",
+            0xD8: "SOI", 0xD9: "EOI", 0x01: "TEM"}.get(marker, f"0x{marker:02X}")
+
+
+def _jpeg_fields(marker: int, data, start: int, length: int) -> Tuple[dict, List[dict]]:
+    """Decoded fields (and nested entries) of a segment payload."""
+    payload = data[start:start + length]
+    fields: Dict[str, Any] = {}
+    children: List[dict] = []
+
+    if marker in _SOF_PROCESS and length >= 6:
+        n = payload[5]
+        fields = {
+            "process": _SOF_PROCESS[marker],
+            "precision": payload[0],
+            "height": _u16(payload, 1),
+            "width": _u16(payload, 3),
+            "components": [
+                {"id": payload[6 + 3 * k], "h": payload[7 + 3 * k] >> 4,
+                 "v": payload[7 + 3 * k] & 15, "table": payload[8 + 3 * k]}
+                for k in range(n) if 8 + 3 * k < length
+            ],
+        }
+    elif marker == 0xDB:
+        tables = []
+        pos = 0
+        while pos < length:
+            precision, table_id = payload[pos] >> 4, payload[pos] & 15
+            tables.append({"id": table_id, "precision": 16 if precision else 8})
+            pos += 1 + 64 * (2 if precision else 1)
+        fields = {"tables": tables}
+    elif marker == 0xC4:
+        tables = []
+        pos = 0
+        while pos + 17 <= length:
+            symbols = sum(payload[pos + 1:pos + 17])
+            tables.append({"class": "AC" if payload[pos] >> 4 else "DC", "id": payload[pos] & 15,
+                           "symbols": symbols})
+            pos += 17 + symbols
+        fields = {"tables": tables}
+    elif marker == SOS and length >= 1:
+        n = payload[0]
+        fields = {
+            "components": [{"id": payload[1 + 2 * k], "dc_table": payload[2 + 2 * k] >> 4,
+                            "ac_table": payload[2 + 2 * k] & 15} for k in range(n)],
+            "spectral": [payload[1 + 2 * n], payload[2 + 2 * n]] if length >= 3 + 2 * n else None,
+            "approximation": [payload[3 + 2 * n] >> 4, payload[3 + 2 * n] & 15] if length >= 4 + 2 * n else None,
+        }
+    elif marker == 0xDD and length >= 2:
+        fields = {"restart_interval": _u16(payload, 0)}
+    elif marker == 0xFE:
+        fields = {"comment": _text(bytes(payload))}
+    elif marker == 0xE0 and bytes(payload[:5]) == b"JFIF\x00" and length >= 14:
+        fields = {"identifier": "JFIF", "version": f"{payload[5]}.{payload[6]:02d}",
+                  "units": payload[7], "density": [_u16(payload, 8), _u16(payload, 10)],
+                  "thumbnail": [payload[12], payload[13]]}
+    elif marker == 0xE1 and bytes(payload[:6]) == b"Exif\x00\x00":
+        fields = {"identifier": "Exif"}
+        try:
+            _parse_tiff_header(data, children, start + 6)
+        except ContainerError as e:
+            fields["error"] = str(e)
+    elif marker == 0xE1 and bytes(payload[:29]) == b"http://ns.adobe.com/xap/1.0/\x00":
+        fields = {"identifier": "XMP", "packet_length": length - 29}
+    elif marker == 0xE2 and bytes(payload[:12]) == b"ICC_PROFILE\x00" and length >= 14:
+        fields = {"identifier": "ICC profile", "chunk": payload[12], "chunks": payload[13]}
+    elif marker == 0xE2 and bytes(payload[:4]) == b"MPF\x00":
+        fields = {"identifier": "MPF"}
+    elif marker == 0xED and bytes(payload[:14]) == b"Photoshop 3.0\x00":
+        fields = {"identifier": "Photoshop IRB"}
+    elif marker == 0xEE and bytes(payload[:5]) == b"Adobe" and length >= 12:
+        fields = {"identifier": "Adobe", "version": _u16(payload, 5), "transform": payload[11]}
+    elif 0xE0 <= marker <= 0xEF:
+        ident = bytes(payload[:32]).split(b"\x00", 1)[0]
+        if ident and all(32 <= b < 127 for b in ident):
+            fields = {"identifier": ident.decode("ascii")}
+    return fields, children
+
+
+def _parse_jpeg(data, entries: List[dict]) -> None:
+    size = len(data)
+    pos = 0
+    try:
+        for marker, offset, length in iter_segments(data):
+            if marker is None:
+                entries.append({"offset": offset, "length": length, "name": "Scan data", "fields": {}})
+            elif length == 2:
+                entries.append({"offset": offset, "length": 2, "name": _jpeg_marker_name(marker), "fields": {}})
+            else:
+                fields, children = _jpeg_fields(marker, data, offset + 4, length - 4)
+                entry = {"offset": offset, "length": length, "name": _jpeg_marker_name(marker),
+                         "fields": fields}
+                if children:
+                    entry["children"] = children
+                entries.append(entry)
+            pos = offset + length
+    except ValueError as e:
+        if pos < 2 or data[pos] == 0xFF:
+            raise ContainerError(str(e))
+        # Not a marker where one should be: show the rest as unparsed
+        entries.append({"offset": pos, "length": size - pos, "name": "Unexpected data",
+                        "fields": {"error": f"Expected marker at offset {pos}"}})
+        return
+    if pos < size:
+        entries.append({"offset": pos, "length": size - pos, "name": "Trailing data",
+                        "fields": {"starts_with": bytes(data[pos:pos + 16]).hex()}})
+
+
+# ---------------------------------------------------------------------------
+# PNG
+# ---------------------------------------------------------------------------
+
+def _png_fields(chunk_type: str, payload) -> dict:
+    length = len(payload)
+    if chunk_type == "IHDR" and length >= 13:
+        return {"width": _u32(payload, 0), "height": _u32(payload, 4), "bit_depth": payload[8],
+                "color_type": _PNG_COLOR_TYPES.get(payload[9], payload[9]), "compression": payload[10],
+                "filter": payload[11], "interlace": "Adam7" if payload[12] else "None"}
+    if chunk_type == "PLTE":
+        return {"entries": length // 3}
+    if chunk_type == "pHYs" and length >= 9:
+        return {"pixels_per_unit": [_u32(payload, 0), _u32(payload, 4)],
+                "unit": "metre" if payload[8] else "unknown"}
+    if chunk_type == "gAMA" and length >= 4:
+        return {"gamma": _u32(payload, 0) / 100000}
+    if chunk_type == "sRGB" and length >= 1:
+        return {"rendering_intent": payload[0]}
+    if chunk_type == "tIME" and length >= 7:
+        return {"time": "%04d-%02d-%02d %02d:%02d:%02d" % ((_u16(payload, 0),) + tuple(payload[2:7]))}
+    if chunk_type in ("tEXt", "zTXt", "iTXt", "iCCP"):
+        keyword, _, rest = bytes(payload[:MAX_TEXT * 4]).partition(b"\x00")
+        fields = {"keyword": keyword.decode("latin-1")}
+        if chunk_type == "tEXt":
+            fields["text"] = _text(rest)
+        elif chunk_type == "zTXt" and rest:
+            try:
+                fields["text"] = _text(zlib.decompressobj().decompress(bytes(payload[len(keyword) + 2:]), MAX_TEXT * 4))
+            except zlib.error:
+                pass
+        return fields
+    return {}
+
+
+def _parse_png(data, entries: List[dict]) -> None:
+    entries.append({"offset": 0, "length": 8, "name": "Signature", "fields": {}})
+    pos = 8
+    size = len(data)
+    while pos + 12 <= size:
+        length = _u32(data, pos)
+        chunk_type = bytes(data[pos + 4:pos + 8]).decode("latin-1")
+        end = pos + 12 + length
+        if end > size:
+            raise ContainerError(f"Truncated {chunk_type} chunk at offset {pos}")
+        crc = _u32(data, end - 4)
+        if chunk_type == "IDAT" and entries[-1]["name"] == "IDAT":
+            # Consecutive image data chunks are one entry
+            previous = entries[-1]
+            previous["length"] = end - previous["offset"]
+            previous["fields"]["chunks"] += 1
+            previous["fields"]["data_length"] += length
+        else:
+            fields = _png_fields(chunk_type, data[pos + 8:pos + 8 + length])
+            if chunk_type == "IDAT":
+                fields = {"chunks": 1, "data_length": length}
+            else:
+                fields["crc_ok"] = zlib.crc32(data[pos + 4:end - 4]) == crc
+            entry = {"offset": pos, "length": end - pos, "name": chunk_type, "fields": fields}
+            if chunk_type == "eXIf":
+                children: List[dict] = []
+                try:
+                    _parse_tiff_header(data, children, pos + 8)
+                except ContainerError as e:
+                    fields["error"] = str(e)
+                if children:
+                    entry["children"] = children
+            entries.append(entry)
+        pos = end
+        if chunk_type == "IEND":
+            break
+    if pos < size:
+        entries.append({"offset": pos, "length": size - pos, "name": "Trailing data",
+                        "fields": {"starts_with": bytes(data[pos:pos + 16]).hex()}})
+
+
+# ---------------------------------------------------------------------------
+
+def detect_format(head: bytes) -> Optional[str]:
+    if head[:2] == b"\xff\xd8":
+        return "JPEG"
+    if head[:8] == PNG_SIGNATURE:
+        return "PNG"
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "TIFF"
+    return None
+
+
+# Each parser appends to the list it is given, so entries read before an
+# error are kept
+_PARSERS = {"JPEG": _parse_jpeg, "PNG": _parse_png, "TIFF": _parse_tiff_header}
+
+
+def parse_bytes(data) -> dict:
+    """
+    Structure of a JPEG, PNG or TIFF held in a bytes-like object.
+
+    Returns:
+        {"format", "size", "entries", "error"}; entries read before a
+        truncation are kept and the error is reported.
+    """
+    fmt = detect_format(bytes(data[:8]))
+    if fmt is None:
+        raise ContainerError("Unsupported format (expected JPEG, PNG or TIFF)")
+    result = {"format": fmt, "size": len(data), "entries": [], "error": None}
+    try:
+        _PARSERS[fmt](data, result["entries"])
+    except (ContainerError, IndexError, struct.error) as e:
+        result["error"] = str(e) or "Truncated file"
+    return result
+
+
+def parse_file(path: str) -> dict:
+    """Structure of a file, read through a memory mapping."""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ContainerError("Empty file")
+        with mm:
+            return parse_bytes(mm)
+
+
+_cache: "OrderedDict[str, dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse(path: str) -> dict:
+    """parse_file, cached by the file's SHA-256."""
+    digest = file_sha256(path)
+    with _cache_lock:
+        result = _cache.get(digest)
+        if result is not None:
+            _cache.move_to_end(digest)
+            return result
+    result = parse_file(path)
+    result["digest"] = digest
+    with _cache_lock:
+        _cache[digest] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
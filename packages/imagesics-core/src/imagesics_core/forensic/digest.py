@@ -1,4 +1,5 @@
 import hashlib
+import mmap
 import os
 import magic
 import re
@@ -6,6 +7,8 @@ import cv2 as cv
 import numpy as np
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 def get_ballistics_info(filename: str) -> str:
     table = [
@@ -20,19 +23,82 @@ def get_ballistics_info(filename: str) -> str:
             return entry[1]
     return "Unknown source or manually renamed"
 
+# Report name -> hashlib algorithm
+HASH_ALGORITHMS = {
+    "MD5": "md5",
+    "SHA1": "sha1",
+    "SHA2-224": "sha224",
+    "SHA2-256": "sha256",
+    "SHA2-384": "sha384",
+    "SHA2-512": "sha512",
+    "SHA3-224": "sha3_224",
+    "SHA3-256": "sha3_256",
+    "SHA3-384": "sha3_384",
+    "SHA3-512": "sha3_512",
+}
+
+CHUNK_SIZE = 4 << 20
+# Files at least this large are hashed with the hashers running in parallel
+PARALLEL_THRESHOLD = 64 << 20
+
+def new_hashers() -> dict:
+    """Fresh hashlib objects for every HASH_ALGORITHMS entry."""
+    return {name: hashlib.new(algorithm) for name, algorithm in HASH_ALGORITHMS.items()}
+
 def compute_hashes(data: bytes) -> dict:
-    return {
-        "MD5": hashlib.md5(data).hexdigest(),
-        "SHA1": hashlib.sha1(data).hexdigest(),
-        "SHA2-224": hashlib.sha224(data).hexdigest(),
-        "SHA2-256": hashlib.sha256(data).hexdigest(),
-        "SHA2-384": hashlib.sha384(data).hexdigest(),
-        "SHA2-512": hashlib.sha512(data).hexdigest(),
-        "SHA3-224": hashlib.sha3_224(data).hexdigest(),
-        "SHA3-256": hashlib.sha3_256(data).hexdigest(),
-        "SHA3-384": hashlib.sha3_384(data).hexdigest(),
-        "SHA3-512": hashlib.sha3_512(data).hexdigest(),
-    }
+    hashers = new_hashers()
+    for h in hashers.values():
+        h.update(data)
+    return {name: h.hexdigest() for name, h in hashers.items()}
+
+def hash_file(
+    file_path: str,
+    use_mmap: bool = False,
+    max_workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> dict:
+    """
+    All HASH_ALGORITHMS of a file in one streaming pass.
+    
+    Each chunk is read once and fed to every hasher, so memory use is
+    bounded by the chunk size. hashlib releases the GIL on large updates:
+    for files of at least PARALLEL_THRESHOLD bytes the hashers run on a
+    thread pool, each consuming the same chunk. With use_mmap the file is
+    mapped instead of read, and each hasher consumes the mapping directly.
+    
+    Returns:
+        {name: hex digest}, as compute_hashes.
+    """
+    hashers = new_hashers()
+    size = os.path.getsize(file_path)
+    parallel = size >= PARALLEL_THRESHOLD
+    pool = ThreadPoolExecutor(max_workers=max_workers or min(len(hashers), os.cpu_count() or 1)) if parallel else None
+    
+    def feed(chunk) -> None:
+        if pool is None:
+            for h in hashers.values():
+                h.update(chunk)
+        else:
+            list(pool.map(lambda h: h.update(chunk), hashers.values()))
+    
+    try:
+        with open(file_path, "rb") as f:
+            if use_mmap and size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        for start in range(0, size, chunk_size):
+                            feed(view[start:start + chunk_size])
+                    finally:
+                        view.release()
+            else:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    feed(chunk)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    
+    return {name: h.hexdigest() for name, h in hashers.items()}
 
 def compute_image_hashes(image: np.ndarray) -> dict:
     # Safely handle image hash availability
@@ -72,17 +138,37 @@ def get_file_details(file_path: str) -> dict:
         "Name ballistics": get_ballistics_info(p.name)
     }
 
-def generate_digest_report(file_path: str, image: np.ndarray) -> dict:
-    """Generate comprehensive digest report for file and image."""
-    with open(file_path, 'rb') as f:
-        data = f.read()
+def generate_digest_report(
+    file_path: str,
+    image: Optional[np.ndarray] = None,
+    image_hashes: bool = True,
+    load_image: Optional[Callable[[], np.ndarray]] = None,
+    use_mmap: bool = False,
+    precomputed: Optional[dict] = None
+) -> dict:
+    """
+    Generate comprehensive digest report for file and image.
     
+    The file is hashed in one streaming pass (see hash_file). The image is
+    only needed for the perceptual hashes: it is decoded (with load_image,
+    or cv.imread) when image_hashes is set and no image is given.
+    precomputed may hold "file_hashes" and "image_hashes" computed
+    earlier (e.g. at upload), which are used instead.
+    """
+    precomputed = precomputed or {}
     details = get_file_details(file_path)
-    file_hashes = compute_hashes(data)
-    img_hashes = compute_image_hashes(image)
+    file_hashes = precomputed.get("file_hashes") or hash_file(file_path, use_mmap=use_mmap)
     
-    return {
+    report = {
         "details": details,
         "file_hashes": file_hashes,
-        "image_hashes": img_hashes
     }
+    if image_hashes and precomputed.get("image_hashes"):
+        report["image_hashes"] = precomputed["image_hashes"]
+    elif image_hashes:
+        if image is None:
+            image = load_image() if load_image is not None else cv.imread(file_path)
+        if image is None:
+            raise ValueError("Could not decode image")
+        report["image_hashes"] = compute_image_hashes(image)
+    return report
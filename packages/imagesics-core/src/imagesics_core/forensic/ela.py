@@ -1,7 +1,32 @@
 import cv2 as cv
 import numpy as np
+from typing import Optional
 from imagesics_core.utils.processing import create_lut, desaturate
 from imagesics_core.forensic.jpeg import compress_jpg
+from imagesics_core.utils import tiling
+
+# Peak working memory of perform_ela per pixel of a BGR image
+ELA_BYTES_PER_PIXEL = 64
+
+def ela_map(
+    image: np.ndarray,
+    quality: int = 75,
+    compressed: Optional[np.ndarray] = None,
+    normalized: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Raw error levels: per-channel absolute difference, as float32 in
+    [0, 1], between the image and its JPEG round-trip at quality.
+    """
+    if compressed is None and normalized is None and tiling.needs_tiling(image.shape, ELA_BYTES_PER_PIXEL):
+        return tiling.process_tiled(
+            image, lambda tile: ela_map(tile, quality),
+            ELA_BYTES_PER_PIXEL, halo=tiling.JPEG_ALIGN, align=tiling.JPEG_ALIGN
+        )
+    original = image.astype(np.float32) / 255 if normalized is None else normalized
+    if compressed is None:
+        compressed = compress_jpg(image, quality)
+    return cv.absdiff(original, compressed.astype(np.float32) / 255)
 
 def perform_ela(
     image: np.ndarray,
@@ -9,7 +34,10 @@ def perform_ela(
     scale: int = 50,
     contrast: int = 20,
     linear: bool = False,
-    grayscale: bool = False
+    grayscale: bool = False,
+    compressed: Optional[np.ndarray] = None,
+    normalized: Optional[np.ndarray] = None,
+    difference: Optional[np.ndarray] = None
 ) -> np.ndarray:
     """
     Perform Error Level Analysis (ELA).
@@ -21,24 +49,34 @@ def perform_ela(
         contrast: Contrast enhancement (0-100).
         linear: Use linear difference instead of absdiff.
         grayscale: Output grayscale result.
+        compressed: Precomputed JPEG round-trip of image at quality.
+        normalized: Precomputed float32 image scaled to [0, 1].
+        difference: Precomputed ela_map() of image at quality.
         
     Returns:
         ELA processed BGR image.
     """
-    original = image.astype(np.float32) / 255
-    compressed = compress_jpg(image, quality)
+    if (compressed is None and normalized is None and difference is None
+            and tiling.needs_tiling(image.shape, ELA_BYTES_PER_PIXEL)):
+        # Tiles on the JPEG block grid recompress exactly as the whole image
+        return tiling.process_tiled(
+            image,
+            lambda tile: perform_ela(tile, quality, scale, contrast, linear, grayscale),
+            ELA_BYTES_PER_PIXEL, halo=tiling.JPEG_ALIGN, align=tiling.JPEG_ALIGN
+        )
     
     contrast_val = int(contrast / 100 * 128)
     
     if not linear:
-        difference = cv.absdiff(
-            original, compressed.astype(np.float32) / 255
-        )
+        if difference is None:
+            difference = ela_map(image, quality, compressed, normalized)
         ela = cv.convertScaleAbs(cv.sqrt(difference) * 255, None, scale / 20)
     else:
         # Note: Original code had logic: cv.convertScaleAbs(cv.subtract(self.compressed, self.image), None, scale)
         # But wait, self.compressed is uint8 (from compress_jpg), self.image is uint8. 
         # cv.subtract handles saturation.
+        if compressed is None:
+            compressed = compress_jpg(image, quality)
         ela = cv.convertScaleAbs(
             cv.subtract(compressed, image), None, scale
         )
@@ -25,7 +25,7 @@ def compute_splicing_noiseprint(image: np.ndarray) -> dict:
     # Placeholder for actual logic if installed
     # based on sherloq/gui/splicing.py
     try:
-        from jpeg import estimate_qf
+        from imagesics_core.forensic.jpeg import estimate_qf
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
         qf = estimate_qf(image) # This needs imageSICS port of jpeg.estimate_qf
         
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from typing import Optional, Tuple
 
 def adjust_image(image: np.ndarray, brightness: float = 0, contrast: float = 1.0, gamma: float = 1.0) -> np.ndarray:
     """
@@ -76,3 +77,38 @@ def apply_gradient(image: np.ndarray, axis: str = 'x') -> np.ndarray:
         
     abs_grad = np.absolute(grad)
     return np.uint8(abs_grad)
+
+def luminance_map(
+    image: np.ndarray,
+    gradients: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> np.ndarray:
+    """
+    Raw luminance gradient magnitude (float32).
+    gradients: precomputed (Sobel x, Sobel y) of the grayscale image.
+    """
+    if gradients is None:
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image
+        gradients = (
+            cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3),
+            cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        )
+    grad_x, grad_y = gradients
+    return cv2.magnitude(grad_x.astype(np.float32), grad_y.astype(np.float32))
+
+def compute_luminance_gradient(
+    image: np.ndarray,
+    gradients: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    magnitude: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Colormapped luminance gradient magnitude for lighting consistency.
+    gradients: precomputed (Sobel x, Sobel y) of the grayscale image.
+    magnitude: precomputed luminance_map() of the image.
+    """
+    if magnitude is None:
+        magnitude = luminance_map(image, gradients)
+    magnitude_norm = cv2.normalize(magnitude, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    return cv2.applyColorMap(magnitude_norm, cv2.COLORMAP_JET)
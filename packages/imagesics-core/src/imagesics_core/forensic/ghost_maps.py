@@ -1,11 +1,15 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import io
 import math
-from typing import Tuple, List, Optional
+from typing import Callable, Tuple, List, Optional
 from pydantic import BaseModel
 
+from imagesics_core.utils import tiling
+from imagesics_core.utils.render import Panel, render
+
+# Peak working memory of one quality of compute_ghost_maps per pixel
+GHOST_BYTES_PER_PIXEL = 24
+
 class GhostMapRequest(BaseModel):
     qmin: int = 50
     qmax: int = 90
@@ -15,62 +19,82 @@ class GhostMapRequest(BaseModel):
     grayscale: bool = True
     include_original: bool = False
 
-def compute_ghost_maps(image: np.ndarray, params: GhostMapRequest) -> bytes:
+def ghost_map_stack(
+    image: np.ndarray,
+    params: GhostMapRequest,
+    progress: Optional[Callable[[float], None]] = None,
+    recompress: Optional[Callable[[int], np.ndarray]] = None
+) -> Tuple[np.ndarray, List[int]]:
     """
-    Compute JPEG Ghost Maps and return the plotted image as bytes.
+    Raw JPEG ghost maps: the mean squared recompression error of every
+    16x16 block at each quality, normalized per block to [0, 1].
+    
+    recompress(quality) may supply precomputed JPEG round-trips of the
+    image; it is only used when no grid offset is applied.
+    
+    Returns:
+        (maps of shape (rows, cols, n qualities) as float32, qualities)
     """
     Qmin = params.qmin
     Qmax = params.qmax
     Qstep = params.qstep
     shift_x = params.xoffset
     shift_y = params.yoffset
-    includeoriginal = params.include_original
-    grayscale = params.grayscale
     
     averagingBlock = 16
     
-    original = image.astype(np.float64)
-    ydim, xdim, zdim = original.shape
+    ydim, xdim, zdim = image.shape
     
     nQ = int((Qmax - Qmin) / Qstep) + 1
-    
-    ghostmap = np.zeros((ydim, xdim, nQ))
-    
-    idx = 0
-    for quality in range(Qmin, Qmax + 1, Qstep):
-        # Shift
-        shifted_original = np.roll(original, shift_x, axis=1)
-        shifted_original = np.roll(shifted_original, shift_y, axis=0)
-        
-        # Re-compress
-        _, encoded = cv2.imencode(".jpg", shifted_original, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
-        tmpResave = cv2.imdecode(encoded, cv2.IMREAD_ANYCOLOR).astype(np.float64)
-        
-        # Ensure sizes match (sometimes recompression might change size? unlikely for same size)
-        
-        # Difference
-        diff = np.square(shifted_original - tmpResave)
-        ghostmap[:, :, idx] = np.mean(diff, axis=2)
-        idx += 1
-        
-    # Block averaging
-    # Vectorized block averaging if possible, or simple loop
-    # Original used loop, let's optimize slightly or stick to reliable loop
-    # Optimization: using uniform filter (box blur) is effectively sliding window average, 
-    # but we need non-overlapping block average.
-    # We can reshape.
+    qualities = list(range(Qmin, Qmax + 1, Qstep))[:nQ]
     
     # Trim to multiple of averagingBlock
-    ny = (ydim // averagingBlock) * averagingBlock
-    nx = (xdim // averagingBlock) * averagingBlock
     n_gy = ydim // averagingBlock
     n_gx = xdim // averagingBlock
+    blkE = np.zeros((n_gy, n_gx, nQ), dtype=np.float32)
     
-    ghostmap_trimmed = ghostmap[:ny, :nx, :]
+    # Shift
+    shifted = np.roll(image, (shift_y, shift_x), axis=(0, 1))
     
-    # Reshape to (n_gy, block, n_gx, block, nQ) -> mean over axis 1 and 3
-    reshaped = ghostmap_trimmed.reshape(n_gy, averagingBlock, n_gx, averagingBlock, nQ)
-    blkE = np.mean(reshaped, axis=(1, 3)) # Result shape (n_gy, n_gx, nQ)
+    # Large images are processed in tiles on the 16-pixel grid, which is
+    # both the JPEG MCU and the averaging block
+    if tiling.needs_tiling(image.shape, GHOST_BYTES_PER_PIXEL):
+        side = tiling.tile_size(GHOST_BYTES_PER_PIXEL, halo=averagingBlock, align=averagingBlock)
+        tiles = list(tiling.iter_tiles(ydim, xdim, side, averagingBlock, averagingBlock))
+    else:
+        tiles = [tiling.Tile((0, ydim, 0, xdim), (0, ydim, 0, xdim))]
+    whole = len(tiles) == 1
+    
+    steps = len(tiles) * nQ
+    for t, tile in enumerate(tiles):
+        original = shifted[tile.source]
+        y0, y1, x0, x1 = tile.core
+        by0, by1 = y0 // averagingBlock, min(n_gy, y1 // averagingBlock)
+        bx0, bx1 = x0 // averagingBlock, min(n_gx, x1 // averagingBlock)
+        rows, cols = by1 - by0, bx1 - bx0
+        if rows == 0 or cols == 0:
+            continue
+        
+        for idx, quality in enumerate(qualities):
+            if progress is not None:
+                progress((t * nQ + idx) / steps)
+            
+            # Re-compress
+            if recompress is not None and whole and shift_x == 0 and shift_y == 0:
+                resaved = recompress(quality)
+            else:
+                _, encoded = cv2.imencode(".jpg", original, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+                resaved = cv2.imdecode(encoded, cv2.IMREAD_ANYCOLOR)
+            
+            # Squared difference in float32 (absdiff of uint8 is exact)
+            diff = cv2.absdiff(original, resaved).astype(np.float32)
+            cv2.multiply(diff, diff, dst=diff)
+            diff = diff[tile.crop][:rows * averagingBlock, :cols * averagingBlock]
+            
+            # Block averaging: area resampling by an integer factor is the
+            # mean of each block; then average the channels
+            blocks = cv2.resize(diff, (cols, rows), interpolation=cv2.INTER_AREA)
+            blkE[by0:by1, bx0:bx1, idx] = blocks.reshape(rows, cols, -1).mean(axis=2)
     
     # Normalize
     minval = np.min(blkE, axis=2, keepdims=True)
@@ -81,37 +105,51 @@ def compute_ghost_maps(image: np.ndarray, params: GhostMapRequest) -> bytes:
     range_val[range_val == 0] = 1.0
     
     blkE = (blkE - minval) / range_val
+    return blkE, qualities
+
+def compute_ghost_maps(
+    image: np.ndarray,
+    params: GhostMapRequest,
+    progress: Optional[Callable[[float], None]] = None,
+    recompress: Optional[Callable[[int], np.ndarray]] = None,
+    maps: Optional[np.ndarray] = None
+) -> bytes:
+    """
+    Compute JPEG Ghost Maps and return the plotted image as bytes.
     
-    # Plotting
-    fig_size = (12, 8)
-    fig = plt.figure(figsize=fig_size)
-    
-    if includeoriginal:
-        sp = math.ceil(math.sqrt(nQ + 1))
-        # Original
-        original_norm = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
-        ax = plt.subplot(sp, sp, 1)
-        ax.imshow(original_norm)
-        ax.set_title("Original Image")
-        ax.axis("off")
-        start_idx = 2
+    recompress(quality) may supply precomputed JPEG round-trips of the
+    image; it is only used when no grid offset is applied. maps may
+    supply the precomputed ghost_map_stack() of the image.
+    """
+    if maps is None:
+        maps, qualities = ghost_map_stack(image, params, progress, recompress)
     else:
-        sp = math.ceil(math.sqrt(nQ))
-        start_idx = 1
+        qualities = list(range(params.qmin, params.qmax + 1, params.qstep))[:maps.shape[2]]
+    
+    labels = [f"Quality {q}" for q in qualities]
+    return plot_ghost_maps(
+        maps, labels, f"Ghost plots for grid offset X = {params.xoffset} and Y = {params.yoffset}",
+        original=image if params.include_original else None, grayscale=params.grayscale
+    )
+
+def plot_ghost_maps(
+    maps: np.ndarray,
+    labels: List[str],
+    title: str,
+    original: Optional[np.ndarray] = None,
+    grayscale: bool = True
+) -> bytes:
+    """Plot normalized ghost maps (rows, cols, n) in a grid; returns JPEG bytes."""
+    nQ = maps.shape[2]
+    
+    panels = []
+    if original is not None:
+        panels.append(Panel(original, "Original Image"))
+    sp = math.ceil(math.sqrt(nQ + len(panels)))
         
-    cmap = "gray" if grayscale else None
+    colormap = None if grayscale else cv2.COLORMAP_VIRIDIS
     
     for c in range(nQ):
-        ax = plt.subplot(sp, sp, start_idx + c)
-        ax.imshow(blkE[:, :, c], cmap=cmap, vmin=0, vmax=1)
-        ax.axis("off")
-        ax.set_title(f"Quality {Qmin + c * Qstep}")
+        panels.append(Panel(maps[:, :, c], labels[c], colormap=colormap, vmin=0, vmax=1))
         
-    plt.suptitle(f"Ghost plots for grid offset X = {shift_x} and Y = {shift_y}")
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return render(panels, cols=sp, title=title)
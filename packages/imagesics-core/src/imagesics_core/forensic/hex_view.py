@@ -0,0 +1,127 @@
+"""
+Hex view of files of any size.
+
+Files are memory-mapped, so reading a window or searching touches only
+the pages involved instead of loading the file. Rows are formatted with
+table lookups over the whole window at once, and pattern search uses
+mmap.find (a C substring search) across the whole file.
+"""
+import mmap
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+# "HH " for every byte value, and the printable ASCII form of each byte
+_HEX = np.array([f"{b:02X} ".encode() for b in range(256)], dtype="S3").view(np.uint8).reshape(256, 3)
+_ASCII = np.array([b if 32 <= b <= 126 else ord(".") for b in range(256)], dtype=np.uint8)
+
+DEFAULT_WIDTH = 16
+MAX_WINDOW = 1 << 20
+MAX_MATCHES = 1000
+
+
+@contextmanager
+def mapped(path: str) -> Iterator[memoryview]:
+    """Read-only view of a file's contents (empty for an empty file)."""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            yield memoryview(b"")
+            return
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            view.release()
+            mm.close()
+
+
+def read_window(path: str, offset: int, length: int) -> Tuple[bytes, int]:
+    """
+    Bytes [offset, offset + length) of a file, clamped to the file.
+
+    Returns:
+        (data, total file size)
+    """
+    if offset < 0 or length < 0:
+        raise ValueError("offset and length must be non-negative")
+    length = min(length, MAX_WINDOW)
+    with mapped(path) as view:
+        return bytes(view[offset:offset + length]), len(view)
+
+
+def format_rows(data: bytes, offset: int = 0, width: int = DEFAULT_WIDTH) -> bytes:
+    """
+    Classic hex dump rows: "OOOOOOOO  HH HH ...  |ascii|\\n".
+
+    The last row is padded so every row has the same layout.
+    """
+    if width <= 0:
+        raise ValueError("width must be positive")
+    if not data:
+        return b""
+    values = np.frombuffer(data, dtype=np.uint8)
+    n_rows = -(-len(values) // width)
+    padded = np.zeros(n_rows * width, dtype=np.uint8)
+    padded[:len(values)] = values
+
+    hex_part = _HEX[padded].reshape(n_rows, width * 3)
+    ascii_part = _ASCII[padded].reshape(n_rows, width)
+    if len(values) % width:
+        # Blank the padding of the last row
+        tail = len(values) % width
+        hex_part[-1, tail * 3:] = ord(" ")
+        ascii_part[-1, tail:] = ord(" ")
+
+    digits = max(8, len(f"{offset + (n_rows - 1) * width:X}"))
+    addresses = np.array(
+        [f"{offset + r * width:0{digits}X}  ".encode() for r in range(n_rows)],
+        dtype=f"S{digits + 2}"
+    )
+    address_part = addresses.view(np.uint8).reshape(n_rows, digits + 2)
+
+    sep = np.full((n_rows, 1), ord("|"), dtype=np.uint8)
+    newline = np.full((n_rows, 1), ord("\n"), dtype=np.uint8)
+    rows = np.hstack([address_part, hex_part, np.full((n_rows, 1), ord(" "), np.uint8),
+                      sep, ascii_part, sep, newline])
+    return rows.tobytes()
+
+
+def parse_pattern(pattern: str) -> bytes:
+    """Bytes of a hex pattern such as "FF D8 FF" (whitespace ignored)."""
+    cleaned = "".join(pattern.split())
+    if not cleaned or len(cleaned) % 2:
+        raise ValueError("Hex pattern must have an even number of digits")
+    try:
+        return bytes.fromhex(cleaned)
+    except ValueError:
+        raise ValueError("Invalid hex pattern. Use only 0-9 and A-F")
+
+
+def search(path: str, pattern: bytes, start: int = 0, limit: int = MAX_MATCHES) -> Tuple[List[int], bool]:
+    """
+    Offsets of non-overlapping occurrences of pattern from start.
+
+    Returns:
+        (offsets, truncated): truncated is True when more than limit
+        matches exist; the search can be resumed after the last offset.
+    """
+    if not pattern:
+        raise ValueError("Empty pattern")
+    matches: List[int] = []
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return matches, False
+        with mm:
+            pos = mm.find(pattern, max(0, start))
+            while pos != -1:
+                if len(matches) == limit:
+                    return matches, True
+                matches.append(pos)
+                pos = mm.find(pattern, pos + len(pattern))
+    return matches, False
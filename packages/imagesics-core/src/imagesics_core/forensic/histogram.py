@@ -2,7 +2,8 @@ import cv2 as cv
 import numpy as np
 from typing import Dict, List, Tuple
 from pydantic import BaseModel
-from imagesics_core.utils.processing import compute_hist
+from imagesics_core.forensic import pixel_analysis
+from imagesics_core.utils import image_cache
 
 class HistogramStats(BaseModel):
     least_frequent: int
@@ -17,93 +18,219 @@ class HistogramStats(BaseModel):
     fullness: float
     smoothness: float
 
+# Pixels packed per pass when counting colors; bounds the key temporaries
+COLOR_CHUNK = 1 << 20
+# Every popcount of a byte, for counting the bits set in the color bitmap
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _color_chunks(image: np.ndarray):
+    """
+    Packed uint32 color keys (B << 16 | G << 8 | R for BGR, the value for
+    gray) of consecutive row blocks of a uint8 image.
+    """
+    rows_per_chunk = max(1, COLOR_CHUNK // max(1, image.shape[1]))
+    for y in range(0, image.shape[0], rows_per_chunk):
+        block = image[y:y + rows_per_chunk]
+        if block.ndim == 2:
+            yield block.astype(np.uint32).ravel()
+            continue
+        keys = block[:, :, 0].astype(np.uint32)
+        for c in range(1, block.shape[2]):
+            keys <<= 8
+            keys |= block[:, :, c]
+        yield keys.ravel()
+
+def count_unique_colors(image: np.ndarray) -> int:
+    """
+    Exact number of distinct colors of an image.
+
+    uint8 gray and BGR images set one bit per packed color in a bitmap of
+    the 2^24 color space (2 MB) and count the set bits, which is linear in
+    the pixel count. Other images (alpha, non-uint8) fall back to sorting
+    the rows.
+    """
+    if image.dtype != np.uint8 or (image.ndim == 3 and image.shape[2] not in (1, 3)):
+        chans = image.shape[2] if image.ndim == 3 else 1
+        return int(np.unique(image.reshape(-1, chans), axis=0).shape[0])
+    bitmap = np.zeros(1 << 21, dtype=np.uint8)
+    for keys in _color_chunks(image):
+        np.bitwise_or.at(bitmap, keys >> 3, np.left_shift(1, keys & 7).astype(np.uint8))
+    return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+def color_frequencies(image: np.ndarray, top: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-color pixel counts of a uint8 gray or BGR image, most frequent
+    first.
+
+    Counts are accumulated over the packed colors in a table covering the
+    whole color space (128 MB for BGR), so this is meant for palette
+    analysis rather than for just counting the colors.
+
+    Args:
+        image: uint8 gray or BGR image.
+        top: Keep only this many most frequent colors (all if 0).
+
+    Returns:
+        (colors, counts): (n, channels) uint8 colors and their counts.
+    """
+    if image.dtype != np.uint8 or (image.ndim == 3 and image.shape[2] not in (1, 3)):
+        raise ValueError("Color frequencies need a uint8 gray or BGR image")
+    chans = image.shape[2] if image.ndim == 3 else 1
+    counts = np.zeros(1 << (8 * chans), dtype=np.int64)
+    for keys in _color_chunks(image):
+        np.add.at(counts, keys, 1)
+    keys = np.flatnonzero(counts)
+    order = np.argsort(-counts[keys], kind="stable")
+    if top > 0:
+        order = order[:top]
+    keys = keys[order].astype(np.uint32)
+    shifts = np.arange(8 * (chans - 1), -1, -8, dtype=np.uint32)
+    colors = ((keys[:, None] >> shifts) & 0xFF).astype(np.uint8)
+    return colors, counts[keys]
+
 def get_unique_colors_info(image: np.ndarray) -> Tuple[int, float]:
-    rows, cols, chans = image.shape
+    rows, cols = image.shape[:2]
     pixels = rows * cols
-    unique_colors = np.unique(
-        np.reshape(image, (pixels, chans)), axis=0
-    ).shape[0]
+    unique_colors = count_unique_colors(image)
     unique_ratio = np.round(unique_colors / pixels * 100, 2)
     return int(unique_colors), float(unique_ratio)
 
-def calculate_stats(hist: np.ndarray, start: int = 0, end: int = 255) -> HistogramStats:
-    total = np.sum(hist)
-    
-    # Clip range
-    if end <= start:
-        end = start + 1
-    elif start >= end:
-        start = end - 1
+def _sparse_table(values: np.ndarray, better) -> List[np.ndarray]:
+    """
+    Range-query table: level k holds, for every i, the index of the best
+    value in values[i:i + 2**k] (the first one on ties).
+    """
+    table = [np.arange(values.size)]
+    span = 1
+    while 2 * span <= values.size:
+        prev = table[-1]
+        left, right = prev[:-span], prev[span:]
+        table.append(np.where(better(values[right], values[left]), right, left))
+        span *= 2
+    return table
+
+
+class HistogramTable:
+    """
+    A 256-bin histogram prepared for statistics over any [start, end]
+    level range.
+
+    Prefix sums of the counts, first and second moments, empty bins and
+    smoothness terms, plus sparse tables for the range minimum and
+    maximum, answer calculate_stats() in constant time per range instead
+    of a pass over the bins.
+    """
+
+    def __init__(self, hist: np.ndarray):
+        self.hist = np.asarray(hist, dtype=np.int64).reshape(-1)
+        levels = np.arange(self.hist.size, dtype=np.int64)
+        zero = np.zeros(1, dtype=np.int64)
+        self.total = int(self.hist.sum())
+        self._count = np.concatenate([zero, np.cumsum(self.hist)])
+        self._sum = np.concatenate([zero, np.cumsum(levels * self.hist)])
+        self._sum_sq = np.concatenate([zero, np.cumsum(levels * levels * self.hist)])
+        self._empty = np.concatenate([zero, np.cumsum(self.hist == 0)])
         
-    x = np.arange(256)[start : end + 1]
-    y = hist[start : end + 1]
-    count = np.sum(y)
+        # Smoothness compares each bin with the linear extrapolations from
+        # both sides: |y[i] - ((2y[i-1] - y[i-2]) + (2y[i+1] - y[i+2])) / 2|
+        h = self.hist.astype(np.float64)
+        rough = np.zeros_like(h)
+        rough[2:-2] = np.abs(h[2:-2] - h[1:-3] - h[3:-1] + (h[:-4] + h[4:]) / 2)
+        self._rough = np.concatenate([np.zeros(1), np.cumsum(rough)])
+        
+        self._min_table = _sparse_table(self.hist, np.less)
+        self._max_table = _sparse_table(self.hist, np.greater)
+        
+        # Nearest nonzero bin at or after / at or before each level
+        nonzero = self.hist > 0
+        n = self.hist.size
+        next_nz = np.where(nonzero, levels, n)
+        self._next_nonzero = np.minimum.accumulate(next_nz[::-1])[::-1]
+        prev_nz = np.where(nonzero, levels, -1)
+        self._prev_nonzero = np.maximum.accumulate(prev_nz)
 
-    if count == 0:
-        return HistogramStats(
-            least_frequent=0, most_frequent=0, average_level=0, median_level=0,
-            deviation=0, pixel_count=0, percentile=0, nonzero_range=(0, 0),
-            empty_bins=0, fullness=0, smoothness=0
-        )
+    def _arg(self, table: List[np.ndarray], start: int, end: int, better) -> int:
+        k = (end - start + 1).bit_length() - 1
+        left, right = table[k][start], table[k][end - (1 << k) + 1]
+        a, b = self.hist[left], self.hist[right]
+        if better(b, a) or (a == b and right < left):
+            return int(right)
+        return int(left)
 
-    argmin = int(np.argmin(y) + start)
-    argmax = int(np.argmax(y) + start)
-    mean = np.round(np.sum(x * y) / count, 2)
-    stddev = np.round(np.sqrt(np.sum(((x - mean) ** 2) * y) / count), 2)
-    # Median
-    # cumsum > count/2
-    cumsum = np.cumsum(y)
-    median_idx = np.argmax(cumsum > count / 2)
-    median = int(median_idx + start)
-    
-    percent = np.round(count / total * 100, 2)
-    
-    nonzero_indices = np.nonzero(y)[0]
-    if len(nonzero_indices) > 0:
-        nonzero_range = (int(nonzero_indices[0] + start), int(nonzero_indices[-1] + start))
-    else:
-        nonzero_range = (0, 0)
+    def stats(self, start: int = 0, end: int = 255) -> HistogramStats:
+        # Clip range
+        if end <= start:
+            end = start + 1
+        elif start >= end:
+            start = end - 1
+        start = max(int(start), 0)
+        end = min(int(end), self.hist.size - 1)
+        
+        count = int(self._count[end + 1] - self._count[start]) if start <= end else 0
+        if count == 0:
+            return HistogramStats(
+                least_frequent=0, most_frequent=0, average_level=0, median_level=0,
+                deviation=0, pixel_count=0, percentile=0, nonzero_range=(0, 0),
+                empty_bins=0, fullness=0, smoothness=0
+            )
+        
+        argmin = self._arg(self._min_table, start, end, np.less)
+        argmax = self._arg(self._max_table, start, end, np.greater)
+        total_x = int(self._sum[end + 1] - self._sum[start])
+        total_xx = int(self._sum_sq[end + 1] - self._sum_sq[start])
+        mean = np.round(total_x / count, 2)
+        # Deviation around the rounded mean, as before
+        variance = (total_xx - 2 * mean * total_x + mean * mean * count) / count
+        stddev = np.round(np.sqrt(max(variance, 0.0)), 2)
+        # Median: first level whose cumulative count exceeds half the range
+        median = int(np.searchsorted(self._count, self._count[start] + count / 2, side="right") - 1)
+        
+        percent = np.round(count / self.total * 100, 2)
+        nonzero_range = (int(self._next_nonzero[start]), int(self._prev_nonzero[end]))
+        empty = int(self._empty[end + 1] - self._empty[start])
         
-    empty = len(x) - np.count_nonzero(y)
-    
-    max_val = np.max(y)
-    fullness = 0.0
-    if max_val > 0:
+        max_val = int(self.hist[argmax])
         fullness = np.round(count / (255 * max_val) * 100, 2)
         
-    # Smoothness
-    y_norm = y / max_val if max_val > 0 else y
-    sweep = len(y_norm)
-    smoothness_val = 0.0
-    if sweep >= 5:
-        for i in range(2, sweep - 2):
-            yl = 2 * y_norm[i - 1] - y_norm[i - 2]
-            yr = 2 * y_norm[i + 1] - y_norm[i + 2]
-            smoothness_val += abs(y_norm[i] - (yl + yr) / 2)
-        smoothness_val = np.round((1 - (smoothness_val / (sweep - 2))) * 100, 2)
+        # Smoothness
+        sweep = end - start + 1
+        smoothness_val = 0.0
+        if sweep >= 5:
+            rough = (self._rough[end - 1] - self._rough[start + 2]) / max_val
+            smoothness_val = np.round((1 - (rough / (sweep - 2))) * 100, 2)
         
-    return HistogramStats(
-        least_frequent=argmin,
-        most_frequent=argmax,
-        average_level=mean,
-        median_level=median,
-        deviation=stddev,
-        pixel_count=int(count),
-        percentile=percent,
-        nonzero_range=nonzero_range,
-        empty_bins=empty,
-        fullness=fullness,
-        smoothness=smoothness_val
-    )
+        return HistogramStats(
+            least_frequent=argmin,
+            most_frequent=argmax,
+            average_level=mean,
+            median_level=median,
+            deviation=stddev,
+            pixel_count=count,
+            percentile=percent,
+            nonzero_range=nonzero_range,
+            empty_bins=empty,
+            fullness=fullness,
+            smoothness=smoothness_val
+        )
+
+def calculate_stats(hist: np.ndarray, start: int = 0, end: int = 255) -> HistogramStats:
+    return HistogramTable(hist).stats(start, end)
+
+def histogram_tables(image: np.ndarray) -> Dict[str, HistogramTable]:
+    """
+    Red, green, blue and value histogram tables of an image, memoized
+    with its histograms for read-only (cached) images so range queries
+    never revisit the pixels.
+    """
+    def build(im: np.ndarray) -> Dict[str, HistogramTable]:
+        return {name: HistogramTable(hist) for name, hist in _histograms(im).items()}
+    return image_cache.derived(image, "histogram_tables", build)
+
+def _histograms(image: np.ndarray) -> Dict[str, np.ndarray]:
+    # Channel histograms are shared with the pixel statistics
+    blue, green, red = pixel_analysis.channel_histograms(image)[:3]
+    return {"red": red, "green": green, "blue": blue, "value": pixel_analysis.gray_histogram(image)}
 
 def compute_all_histograms(image: np.ndarray) -> Dict[str, List[int]]:
-    channels = list(cv.split(cv.cvtColor(image, cv.COLOR_BGR2RGB)))
-    channels.append(cv.cvtColor(image, cv.COLOR_BGR2GRAY))
     # Returns Red, Green, Blue, Value
-    hists = [compute_hist(c).tolist() for c in channels]
-    return {
-        "red": hists[0],
-        "green": hists[1],
-        "blue": hists[2],
-        "value": hists[3]
-    }
+    return {name: hist.tolist() for name, hist in _histograms(image).items()}
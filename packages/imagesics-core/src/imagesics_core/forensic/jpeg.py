@@ -80,18 +80,26 @@ def compress_jpg(image: np.ndarray, quality: int, color: bool = True) -> np.ndar
 
 def loss_curve(image: np.ndarray, qualities: Tuple[int, ...] = tuple(range(1, 101)), normalize: bool = True) -> np.ndarray:
     """Compute error between original and compressed for different qualities."""
-    x = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if len(image.shape) > 2 else image
-    c = np.array(
-        [cv.mean(cv.absdiff(compress_jpg(x, q, False), x))[0] for q in qualities]
-    )
+    from imagesics_core.forensic import quality_sweep
+    c = quality_sweep.sweep(quality_sweep.to_gray(image), qualities)
     if normalize:
         c = cv.normalize(c, None, 0, 1, cv.NORM_MINMAX).flatten()
     return c
 
 
-def estimate_qf(image: np.ndarray) -> int:
-    """Estimate the original Quality Factor (QF) of the image."""
-    return int(np.argmin(loss_curve(image))) + 1 # +1 because range starts at 1? Verify utility.
+def estimate_qf(image: np.ndarray, step: int = 3) -> int:
+    """
+    Estimate the original Quality Factor (QF) of the image as the quality
+    in 1-99 at the deepest dip of the recompression error.
+
+    The curve of a block-aligned centre crop is searched coarse-to-fine
+    every `step` qualities from 50 up; step=1 evaluates all of them.
+    """
+    from imagesics_core.forensic import jpeg_quality, quality_sweep
+    gray = quality_sweep.centre_crop(quality_sweep.to_gray(image), jpeg_quality.SAMPLE_SIDE)
+    return quality_sweep.coarse_to_fine(
+        gray, 1, 99, step, candidates=3, dense_below=jpeg_quality.DENSE_BELOW
+    )[0]
 
 
 def get_tables(quality: int) -> np.ndarray:
@@ -120,11 +128,12 @@ def get_tables(quality: int) -> np.ndarray:
             [99, 99, 99, 99, 99, 99, 99, 99],
         ]
     )
-    quality = np.clip(quality, 1, 100)
+    # Integer scaling as in libjpeg's jpeg_quality_scaling
+    quality = int(np.clip(quality, 1, 100))
     if quality < 50:
-        quality = 5000 / quality
+        quality = 5000 // quality
     else:
         quality = 200 - quality * 2
     tables = np.concatenate((luma[:, :, np.newaxis], chroma[:, :, np.newaxis]), axis=2)
-    tables = (tables * quality + 50) / 100
+    tables = (tables * quality + 50) // 100
     return np.clip(tables, 1, 255).astype(int)
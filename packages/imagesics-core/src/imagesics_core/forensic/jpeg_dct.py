@@ -0,0 +1,485 @@
+"""
+DCT-domain JPEG analysis.
+
+Reads the quantization tables and quantized DCT coefficients straight from
+a JPEG bitstream, so compression history can be analysed without
+re-encoding pixels: exact quality factor from the tables, double
+quantization histograms and blockwise ghost maps computed in the DCT
+domain.
+
+Coefficients can be read from baseline and extended sequential Huffman
+JPEGs (SOF0/SOF1); quantization tables from any JPEG.
+"""
+import io
+import math
+import re
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from imagesics_core.forensic.jpeg import DCT_SIZE, TABLE_SIZE, ZIG_ZAG, get_tables
+
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+DQT = 0xDB
+DHT = 0xC4
+DRI = 0xDD
+SOF_SEQUENTIAL = (0xC0, 0xC1)
+SOF_OTHER = (0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+# Natural (row-major) index of each zig-zag position
+ZIG_ZAG_NATURAL = [r * DCT_SIZE + c for r, c in ZIG_ZAG]
+
+_SCAN_END = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+_RESTART = re.compile(rb"\xff[\xd0-\xd7]")
+
+
+class JpegComponent:
+    """One color component and its quantized DCT coefficients."""
+
+    def __init__(self, component_id: int, h: int, v: int, table_id: int):
+        self.id = component_id
+        self.h = h
+        self.v = v
+        self.table_id = table_id
+        # (block rows, block cols, 64) quantized coefficients, natural order
+        self.coefficients: Optional[np.ndarray] = None
+
+
+class JpegCoefficients:
+    """Quantization tables and coefficient planes of a JPEG file."""
+
+    def __init__(self, width: int, height: int, tables: Dict[int, np.ndarray],
+                 components: List[JpegComponent]):
+        self.width = width
+        self.height = height
+        self.tables = tables
+        self.components = components
+
+    def table(self, component: int = 0) -> np.ndarray:
+        """8x8 quantization table of a component."""
+        return self.tables[self.components[component].table_id]
+
+    def dequantized(self, component: int = 0) -> np.ndarray:
+        """(block rows, block cols, 64) DCT coefficients of a component."""
+        c = self.components[component]
+        return c.coefficients.astype(np.float64) * self.table(component).reshape(-1)
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def iter_segments(data) -> Iterator[Tuple[Optional[int], int, int]]:
+    """
+    Walk a JPEG bitstream (bytes-like, e.g. an mmap) in file order.
+
+    Yields (marker, offset, length) of each part, where offset is that of
+    the 0xFF byte and length includes the marker: 2 for standalone markers
+    (SOI, EOI, RSTn, TEM), 2 + the length field for marker segments
+    (payload at offset + 4). The entropy-coded data after each SOS is
+    yielded with marker None. Stops after EOI; bytes after it are not
+    visited.
+
+    Raises:
+        ValueError: If the data is not a JPEG, a marker is missing where
+            one is expected, or a segment runs past the end of the data.
+            Parts yielded before the error are valid.
+    """
+    if bytes(data[:2]) != b"\xff\xd8":
+        raise ValueError("Not a JPEG file")
+    yield SOI, 0, 2
+    pos = 2
+    size = len(data)
+    while pos + 2 <= size:
+        if data[pos] != 0xFF:
+            raise ValueError(f"Corrupt JPEG: expected marker at offset {pos}")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        if marker == EOI or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            yield marker, pos, 2
+            if marker == EOI:
+                return
+            pos += 2
+            continue
+        if pos + 4 > size:
+            raise ValueError(f"Truncated marker at offset {pos}")
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if length < 2 or pos + 2 + length > size:
+            raise ValueError(f"Truncated FF{marker:02X} segment at offset {pos}")
+        yield marker, pos, 2 + length
+        pos += 2 + length
+        if marker == SOS:
+            # Entropy-coded data runs to the next non-RST marker
+            end = _SCAN_END.search(data, pos)
+            scan_end = end.start() if end else size
+            yield None, pos, scan_end - pos
+            pos = scan_end
+
+
+def _parse_dqt(data: bytes, offset: int, length: int, tables: Dict[int, np.ndarray]) -> None:
+    end = offset + length
+    while offset < end:
+        precision, table_id = data[offset] >> 4, data[offset] & 0x0F
+        offset += 1
+        size = TABLE_SIZE * (2 if precision else 1)
+        values = np.frombuffer(data[offset:offset + size], dtype=">u2" if precision else np.uint8)
+        offset += size
+        table = np.zeros(TABLE_SIZE, dtype=np.int64)
+        table[ZIG_ZAG_NATURAL] = values
+        tables[table_id] = table.reshape(DCT_SIZE, DCT_SIZE)
+
+
+def read_quantization_tables(data: bytes) -> Dict[int, np.ndarray]:
+    """Quantization tables of a JPEG file by table id, as 8x8 arrays."""
+    tables: Dict[int, np.ndarray] = {}
+    for marker, offset, length in iter_segments(data):
+        if marker == DQT:
+            _parse_dqt(data, offset + 4, length - 4, tables)
+    if not tables:
+        raise ValueError("No quantization tables found")
+    return tables
+
+
+def _block_grid(c: JpegComponent, width: int, height: int, hmax: int, vmax: int) -> Tuple[int, int]:
+    """(rows, cols) of 8x8 blocks covering a component."""
+    return (_ceil_div(_ceil_div(height * c.v, vmax), DCT_SIZE),
+            _ceil_div(_ceil_div(width * c.h, hmax), DCT_SIZE))
+
+
+def _huffman_lookup(counts: bytes, symbols: bytes) -> List[int]:
+    """65536-entry table mapping the next 16 bits to (code length << 8 | symbol)."""
+    lookup = [0] * 65536
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        span = 1 << (16 - length)
+        for _ in range(counts[length - 1]):
+            start = code << (16 - length)
+            lookup[start:start + span] = [(length << 8) | symbols[k]] * span
+            code += 1
+            k += 1
+        code <<= 1
+    return lookup
+
+
+def _decode_scan(
+    data: bytes,
+    scan_components: List[Tuple[JpegComponent, List[int], List[int]]],
+    blocks: Dict[int, Tuple[array, int, int]],
+    mcus_x: int,
+    mcus_y: int,
+    restart_interval: int
+) -> None:
+    """Huffman-decode one sequential scan into the per-component block arrays."""
+    interleaved = len(scan_components) > 1
+    natural = ZIG_ZAG_NATURAL
+    segments = _RESTART.split(data)
+    segment_index = 0
+    total = mcus_x * mcus_y
+    mcu = 0
+    while mcu < total:
+        if segment_index >= len(segments):
+            raise ValueError("Corrupt JPEG: scan data ended early")
+        seg = segments[segment_index].replace(b"\xff\x00", b"\xff")
+        segment_index += 1
+        seg_len = len(seg)
+        pos = 0
+        acc = 0
+        bits = 0
+        preds = [0] * len(scan_components)
+        stop = min(total, mcu + restart_interval) if restart_interval else total
+
+        while mcu < stop:
+            my, mx = divmod(mcu, mcus_x)
+            for ci, (comp, dc_lut, ac_lut) in enumerate(scan_components):
+                out, row_blocks, col_blocks = blocks[comp.id]
+                for by in range(comp.v if interleaved else 1):
+                    for bx in range(comp.h if interleaved else 1):
+                        if interleaved:
+                            row, col = my * comp.v + by, mx * comp.h + bx
+                        else:
+                            row, col = my, mx
+                        base = (row * col_blocks + col) * TABLE_SIZE
+
+                        # DC coefficient
+                        while bits <= 48:
+                            acc = (acc << 8) | (seg[pos] if pos < seg_len else 0xFF)
+                            pos += 1
+                            bits += 8
+                        entry = dc_lut[(acc >> (bits - 16)) & 0xFFFF]
+                        if not entry:
+                            raise ValueError("Corrupt JPEG: invalid Huffman code")
+                        bits -= entry >> 8
+                        s = entry & 0xFF
+                        diff = 0
+                        if s:
+                            diff = (acc >> (bits - s)) & ((1 << s) - 1)
+                            bits -= s
+                            if diff < (1 << (s - 1)):
+                                diff -= (1 << s) - 1
+                        preds[ci] += diff
+                        out[base] = preds[ci]
+
+                        # AC coefficients
+                        k = 1
+                        while k < TABLE_SIZE:
+                            if bits <= 48:
+                                while bits <= 48:
+                                    acc = (acc << 8) | (seg[pos] if pos < seg_len else 0xFF)
+                                    pos += 1
+                                    bits += 8
+                                acc &= (1 << bits) - 1
+                            entry = ac_lut[(acc >> (bits - 16)) & 0xFFFF]
+                            if not entry:
+                                raise ValueError("Corrupt JPEG: invalid Huffman code")
+                            bits -= entry >> 8
+                            rs = entry & 0xFF
+                            r, s = rs >> 4, rs & 0x0F
+                            if s == 0:
+                                if r != 15:
+                                    break  # EOB
+                                k += 16
+                                continue
+                            k += r
+                            value = (acc >> (bits - s)) & ((1 << s) - 1)
+                            bits -= s
+                            if value < (1 << (s - 1)):
+                                value -= (1 << s) - 1
+                            if k < TABLE_SIZE:
+                                out[base + natural[k]] = value
+                            k += 1
+            mcu += 1
+
+
+def read_coefficients(data: bytes) -> JpegCoefficients:
+    """
+    Decode the quantized DCT coefficients of a sequential Huffman JPEG.
+
+    Raises:
+        ValueError: For non-JPEG data, progressive/lossless/arithmetic
+            JPEGs and corrupt bitstreams.
+    """
+    tables: Dict[int, np.ndarray] = {}
+    dc_luts: Dict[int, List[int]] = {}
+    ac_luts: Dict[int, List[int]] = {}
+    restart_interval = 0
+    frame = None
+    blocks: Dict[int, Tuple[array, int, int]] = {}
+    scan = None
+
+    for marker, segment, size in iter_segments(data):
+        offset, length = segment + 4, size - 4
+        if marker is None:
+            if scan is not None:
+                _decode_scan(data[segment:segment + size], *scan)
+                scan = None
+        elif marker == DQT:
+            _parse_dqt(data, offset, length, tables)
+        elif marker == DHT:
+            end = offset + length
+            while offset < end:
+                table_class, table_id = data[offset] >> 4, data[offset] & 0x0F
+                counts = data[offset + 1:offset + 17]
+                symbols = data[offset + 17:offset + 17 + sum(counts)]
+                offset += 17 + sum(counts)
+                (ac_luts if table_class else dc_luts)[table_id] = _huffman_lookup(counts, symbols)
+        elif marker == DRI:
+            restart_interval = int.from_bytes(data[offset:offset + 2], "big")
+        elif marker in SOF_OTHER:
+            raise ValueError("Only baseline and extended sequential JPEGs are supported")
+        elif marker in SOF_SEQUENTIAL:
+            if data[offset] != 8:
+                raise ValueError("Only 8-bit JPEGs are supported")
+            height = int.from_bytes(data[offset + 1:offset + 3], "big")
+            width = int.from_bytes(data[offset + 3:offset + 5], "big")
+            components = []
+            for i in range(data[offset + 5]):
+                c = offset + 6 + 3 * i
+                components.append(JpegComponent(data[c], data[c + 1] >> 4, data[c + 1] & 0x0F, data[c + 2]))
+            hmax = max(c.h for c in components)
+            vmax = max(c.v for c in components)
+            mcus_x = _ceil_div(width, DCT_SIZE * hmax)
+            mcus_y = _ceil_div(height, DCT_SIZE * vmax)
+            for c in components:
+                rows, cols = mcus_y * c.v, mcus_x * c.h
+                blocks[c.id] = (array("i", bytes(4 * rows * cols * TABLE_SIZE)), rows, cols)
+            frame = (width, height, components, hmax, vmax, mcus_x, mcus_y)
+        elif marker == SOS:
+            if frame is None:
+                raise ValueError("Corrupt JPEG: scan before frame header")
+            width, height, components, hmax, vmax, mcus_x, mcus_y = frame
+            by_id = {c.id: c for c in components}
+            scan_components = []
+            for i in range(data[offset]):
+                c = offset + 1 + 2 * i
+                comp = by_id[data[c]]
+                scan_components.append((comp, dc_luts[data[c + 1] >> 4], ac_luts[data[c + 1] & 0x0F]))
+            if len(scan_components) == 1:
+                # Non-interleaved scans cover the component's own block grid
+                rows, cols = _block_grid(scan_components[0][0], width, height, hmax, vmax)
+                scan_mcus = (cols, rows)
+            else:
+                scan_mcus = (mcus_x, mcus_y)
+            # Decoded when the entropy-coded data that follows is reached
+            scan = (scan_components, blocks, scan_mcus[0], scan_mcus[1], restart_interval)
+
+    if frame is None:
+        raise ValueError("No frame header found")
+    width, height, components, hmax, vmax, _, _ = frame
+    for c in components:
+        out, rows, cols = blocks[c.id]
+        coefficients = np.frombuffer(out, dtype=np.int32).reshape(rows, cols, TABLE_SIZE)
+        # Drop MCU padding beyond the component's own extent
+        used_rows, used_cols = _block_grid(c, width, height, hmax, vmax)
+        c.coefficients = coefficients[:used_rows, :used_cols]
+    return JpegCoefficients(width, height, tables, components)
+
+
+# ============================================================================
+# ANALYSIS
+# ============================================================================
+
+def estimate_quality(tables: Dict[int, np.ndarray]) -> dict:
+    """
+    Quality factor of the standard (IJG) tables closest to the given ones.
+
+    Returns:
+        {"quality": int, "exact": bool, "error": mean absolute table
+        difference} for the luminance table and, if present, chrominance.
+    """
+    standard = np.stack([get_tables(q) for q in range(1, 101)])  # (100, 8, 8, 2)
+    result = {}
+    for name, table_id, channel in (("luminance", 0, 0), ("chrominance", 1, 1)):
+        if table_id not in tables:
+            continue
+        errors = np.abs(standard[..., channel] - tables[table_id]).mean(axis=(1, 2))
+        best = int(np.argmin(errors))
+        result[name] = {
+            "quality": best + 1,
+            "exact": bool(errors[best] == 0),
+            "error": float(errors[best]),
+        }
+    if "luminance" in result:
+        result["quality"] = result["luminance"]["quality"]
+        result["exact"] = all(r["exact"] for r in result.values() if isinstance(r, dict))
+    return result
+
+
+def dq_histograms(
+    coefficients: JpegCoefficients,
+    component: int = 0,
+    frequencies: int = 9,
+    max_value: int = 32
+) -> List[dict]:
+    """
+    Histograms of quantized AC coefficients for double quantization analysis.
+
+    A JPEG compressed twice with different tables shows periodic peaks and
+    gaps in these histograms, with a period of about the ratio of the first
+    and second quantization steps. The strongest period of each histogram
+    and its strength relative to the median of its spectrum (score) are
+    reported; higher scores mean stronger periodicity.
+
+    Args:
+        coefficients: Decoded coefficients.
+        component: Component index (0 = luminance).
+        frequencies: Number of AC frequencies, in zig-zag order.
+        max_value: Histograms cover quantized values in [-max_value, max_value]
+            (at least 8).
+    """
+    max_value = max(8, int(max_value))
+    coeffs = coefficients.components[component].coefficients.reshape(-1, TABLE_SIZE)
+    table = coefficients.table(component).reshape(-1)
+    results = []
+    for k in range(1, frequencies + 1):
+        index = ZIG_ZAG_NATURAL[k]
+        values = coeffs[:, index]
+        values = values[np.abs(values) <= max_value]
+        hist = np.bincount(values + max_value, minlength=2 * max_value + 1)
+
+        # Periodicity of the magnitude histogram (zero bin excluded), after
+        # removing its smooth decay
+        magnitude = np.log1p(hist[max_value + 1:] + hist[:max_value][::-1])
+        x = np.arange(len(magnitude))
+        residual = magnitude - np.polyval(np.polyfit(x, magnitude, 2), x)
+        spectrum = np.abs(np.fft.rfft(residual))
+        peak = int(np.argmax(spectrum[3:])) + 3
+        period = float(len(magnitude) / peak)
+        score = float(spectrum[peak] / (np.median(spectrum[1:]) + 1e-9))
+
+        results.append({
+            "frequency": list(ZIG_ZAG[k]),
+            "quantization": int(table[index]),
+            "values": list(range(-max_value, max_value + 1)),
+            "histogram": hist.tolist(),
+            "period": period,
+            "score": score,
+        })
+    return results
+
+
+def dct_ghost_maps(
+    coefficients: JpegCoefficients,
+    qualities: Sequence[int],
+    component: int = 0,
+    block_average: int = 2
+) -> np.ndarray:
+    """
+    Blockwise JPEG ghost maps computed in the DCT domain.
+
+    Each block's dequantized coefficients are requantized with the standard
+    table of every quality; the squared requantization error of a block is
+    its pixel-domain error before rounding (the DCT is orthonormal). Errors
+    are averaged over block_average x block_average blocks and normalized
+    per location across qualities.
+
+    Returns:
+        float array (rows, cols, len(qualities)) in [0, 1].
+    """
+    dct = coefficients.dequantized(component)
+    channel = 0 if component == 0 else 1
+    rows, cols = dct.shape[:2]
+    maps = np.empty((rows, cols, len(qualities)))
+    for i, q in enumerate(qualities):
+        step = get_tables(q)[..., channel].reshape(-1)
+        maps[..., i] = np.mean(np.square(dct - np.round(dct / step) * step), axis=2)
+
+    n = block_average
+    rows, cols = rows // n * n, cols // n * n
+    maps = maps[:rows, :cols].reshape(rows // n, n, cols // n, n, -1).mean(axis=(1, 3))
+
+    low = maps.min(axis=2, keepdims=True)
+    span = maps.max(axis=2, keepdims=True) - low
+    span[span == 0] = 1.0
+    return (maps - low) / span
+
+
+def plot_dq_histograms(histograms: List[dict]) -> bytes:
+    """Plot dq_histograms() output as a grid of bar charts; returns JPEG bytes."""
+    # pyplot is slow to import and only this plot needs it
+    import matplotlib.pyplot as plt
+
+    n = len(histograms)
+    cols = min(3, n)
+    rows = math.ceil(n / cols)
+    fig, axes = plt.subplots(rows, cols, figsize=(4 * cols, 3 * rows), squeeze=False)
+    for ax in axes.flat[n:]:
+        ax.axis("off")
+    for ax, h in zip(axes.flat, histograms):
+        ax.bar(h["values"], h["histogram"], width=1.0, color="#4a7ab5")
+        u, v = h["frequency"]
+        ax.set_title(f"({u},{v}) q={h['quantization']} period={h['period']:.1f} score={h['score']:.1f}",
+                     fontsize=9)
+        ax.set_yscale("symlog")
+    fig.suptitle("DCT coefficient histograms")
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="jpg", dpi=100)
+    plt.close(fig)
+    return buf.getvalue()
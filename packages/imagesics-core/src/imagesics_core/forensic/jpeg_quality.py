@@ -1,41 +1,54 @@
 import cv2
 import numpy as np
 import io
-import matplotlib.pyplot as plt
+from typing import Callable, Optional, Tuple
 
-def compute_jpeg_quality_estimation(image: np.ndarray) -> dict:
+from imagesics_core.forensic import quality_sweep
+
+# Coarse quality step above DENSE_BELOW; below it every quality is tried
+QUALITY_STEP = 3
+DENSE_BELOW = 50
+# Side of the centre crop the recompression curve is measured on
+SAMPLE_SIDE = 1024
+
+def compute_jpeg_quality_estimation(
+    image: np.ndarray,
+    progress: Optional[Callable[[float], None]] = None,
+    gray: Optional[np.ndarray] = None,
+    full_curve: bool = False
+) -> dict:
     """
     Estimate JPEG Quality by re-compressing and measuring residuals.
-    Returns: { "quality": q_factor, "plot": image_bytes }
+    Returns: { "quality": q_factor, "errors": {quality: error}, "plot": image_bytes }
+    
+    The curve is measured on a block-aligned centre crop of at most
+    SAMPLE_SIDE pixels, which keeps the 8x8 grid of the original
+    compression. The estimate is the quality in 1-99 at the deepest dip
+    of the error, found coarse-to-fine; full_curve evaluates every
+    quality 0-100 instead. The plot shows the qualities evaluated.
+    
+    gray may supply the precomputed grayscale image.
     """
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-        
-    errors = []
-    qualities = list(range(101))
-    
-    for q in qualities:
-        # Encoder params
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), q]
-        # Encode
-        _, enc = cv2.imencode('.jpg', gray, encode_param)
-        # Decode
-        dec = cv2.imdecode(enc, cv2.IMREAD_GRAYSCALE)
-        
-        # Mean absolute difference
-        diff = cv2.absdiff(gray, dec)
-        mae = np.mean(diff)
-        errors.append(mae)
+    import matplotlib.pyplot as plt
+
+    if gray is None:
+        gray = quality_sweep.to_gray(image)
+    sample = quality_sweep.centre_crop(gray, SAMPLE_SIDE)
         
-    # Find local minima? Or just return the plot.
-    # Usually the local minimum (that isn't 100) nearest to actual quality.
-    # Sherloq implementation just plots it.
+    if full_curve:
+        qualities = list(range(101))
+        errors = dict(zip(qualities, quality_sweep.sweep(sample, qualities, progress=progress)))
+        depths = quality_sweep.dip_depths({q: errors[q] for q in range(1, 100)})
+        quality = min(depths, key=lambda q: (depths[q], errors[q], q))
+    else:
+        quality, errors = quality_sweep.coarse_to_fine(
+            sample, 1, 99, QUALITY_STEP, candidates=3, progress=progress, dense_below=DENSE_BELOW
+        )
     
     fig, ax = plt.subplots(figsize=(6, 4))
-    ax.plot(qualities, errors)
-    ax.set_title("residuals vs quality")
+    ax.plot(list(errors), list(errors.values()), marker='.' if not full_curve else None)
+    ax.axvline(quality, color='tab:red', linestyle='--', linewidth=1)
+    ax.set_title(f"residuals vs quality (estimate: {quality})")
     ax.set_xlabel("JPEG Quality")
     ax.set_ylabel("Error (MAE)")
     ax.grid(True)
@@ -45,4 +58,35 @@ def compute_jpeg_quality_estimation(image: np.ndarray) -> dict:
     plt.close(fig)
     buf.seek(0)
     
-    return {"plot": buf.getvalue()}
+    return {"quality": quality, "errors": {int(q): float(e) for q, e in errors.items()}, "plot": buf.getvalue()}
+
+
+def compute_multiple_compression(
+    image: np.ndarray,
+    qualities: Tuple[int, ...] = (50, 60, 70, 80, 90, 95),
+    gray: Optional[np.ndarray] = None
+) -> bytes:
+    """
+    Plot recompression error across quality levels to expose multiple
+    JPEG compression. Returns the plot as JPEG bytes.
+    """
+    import matplotlib.pyplot as plt
+
+    if gray is None:
+        gray = quality_sweep.to_gray(image)
+    
+    errors = quality_sweep.sweep(gray, qualities)
+    
+    fig, ax = plt.subplots(figsize=(8, 5))
+    ax.plot(qualities, errors, marker='o', linewidth=2, markersize=8)
+    ax.set_title('Multiple Compression Detection', fontsize=14, fontweight='bold')
+    ax.set_xlabel('JPEG Quality Level', fontsize=12)
+    ax.set_ylabel('Mean Absolute Error', fontsize=12)
+    ax.grid(True, alpha=0.3)
+    ax.set_facecolor('#f8f8f8')
+    
+    buf = io.BytesIO()
+    plt.savefig(buf, format='jpg', dpi=100, bbox_inches='tight')
+    plt.close(fig)
+    buf.seek(0)
+    return buf.getvalue()
@@ -1,61 +1,38 @@
 import cv2
 import numpy as np
-import subprocess
-import json
-import os
+import re
+import base64
 from pathlib import Path
-from imagesics_core.config.paths import get_exiftool_path
+from typing import Dict, Iterable, Iterator, List, Tuple
+from imagesics_core.forensic import container, metadata_model
+from imagesics_core.utils import exiftool
+
+# Files read per ExifTool command by get_metadata_batch
+BATCH_SIZE = 64
 
 def get_exif_metadata(image_path: str) -> dict:
     """
     Get EXIF metadata using ExifTool, with PIL/piexif fallback.
     """
-    exiftool = get_exiftool_path()
-    
     # Try exiftool first if it exists
-    if exiftool and os.path.exists(exiftool):
+    if exiftool.available():
         try:
-            result = subprocess.run(
-                [exiftool, "-j", image_path],
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=10
-            )
-            return json.loads(result.stdout)[0]
+            return exiftool.execute_json(image_path)[0]
         except Exception as e:
             pass  # Fall through to PIL fallback
     
-    # Fallback to PIL/piexif
+    return _exif_fallback(image_path)
+
+def _exif_fallback(image_path: str) -> dict:
+    """EXIF metadata from the PIL/piexif metadata model."""
     try:
-        from PIL import Image
-        import piexif
-        
-        img = Image.open(image_path)
-        exif_dict = {}
-        
-        if hasattr(img, '_getexif') and img._getexif():
-            exif_data = img._getexif()
-            for tag_id, value in exif_data.items():
-                tag = piexif.TAGS.get(tag_id, tag_id)
-                exif_dict[str(tag)] = str(value)
-        
-        # Try piexif for more complete data
-        if 'exif' in img.info:
-            exif_bytes = img.info['exif']
-            exif_data = piexif.load(exif_bytes)
-            
-            # Extract readable EXIF data
-            for ifd in ("0th", "Exif", "GPS", "1st"):
-                if ifd in exif_data:
-                    for tag, value in exif_data[ifd].items():
-                        tag_name = piexif.TAGS[ifd].get(tag, {}).get("name", str(tag))
-                        exif_dict[tag_name] = str(value) if not isinstance(value, bytes) else value.decode('utf-8', errors='ignore')
-        
-        return exif_dict if exif_dict else {"info": "No EXIF data found"}
-        
+        model = metadata_model.load(image_path)
     except Exception as e:
         return {"error": f"Failed to read EXIF: {str(e)}"}
+    if model.error:
+        return {"error": f"Failed to read EXIF: {model.error}"}
+    exif_dict = model.exif()
+    return exif_dict if exif_dict else {"info": "No EXIF data found"}
 
 def get_header_structure(image_path: str) -> str:
     """
@@ -69,57 +46,47 @@ def get_header_structure(image_path: str) -> str:
     except Exception as e:
         return str(e)
 
+def get_container_structure(image_path: str) -> dict:
+    """
+    JPEG segments, PNG chunks or TIFF IFDs with offsets and decoded fields.
+    """
+    try:
+        return container.parse(image_path)
+    except Exception as e:
+        return {"error": str(e), "entries": []}
+
 def analyze_thumbnail(image_path: str) -> dict:
     """
     Extract embedded thumbnails.
     """
-    exiftool = get_exiftool_path()
-    
     # Try exiftool first
-    if exiftool and os.path.exists(exiftool):
+    if exiftool.available():
         try:
-            result = subprocess.run(
-                [exiftool, "-ThumbnailImage", "-b", image_path],
-                capture_output=True,
-                timeout=10
-            )
-            if len(result.stdout) > 0:
-                return {"has_thumbnail": True, "size": len(result.stdout)}
+            thumbnail = exiftool.execute("-ThumbnailImage", "-b", image_path)
+            if len(thumbnail) > 0:
+                return {"has_thumbnail": True, "size": len(thumbnail)}
         except:
             pass
     
     # Fallback to PIL/piexif
     try:
-        from PIL import Image
-        import piexif
-        
-        img = Image.open(image_path)
-        
-        if 'exif' in img.info:
-            exif_dict = piexif.load(img.info['exif'])
-            if 'thumbnail' in exif_dict and exif_dict['thumbnail']:
-                return {"has_thumbnail": True, "size": len(exif_dict['thumbnail'])}
-        
-        return {"has_thumbnail": False}
+        thumbnail = _thumbnail_fallback(image_path)
     except:
         return {"has_thumbnail": False, "error": "Failed to extract"}
+    if thumbnail:
+        return {"has_thumbnail": True, "size": len(thumbnail)}
+    return {"has_thumbnail": False}
 
 def get_gps_coords(image_path: str) -> dict:
     """
     Extract GPS coordinates with exiftool and PIL/piexif fallback.
     """
-    exiftool = get_exiftool_path()
-    
     # Try exiftool first
-    if exiftool and os.path.exists(exiftool):
+    if exiftool.available():
         try:
-            result = subprocess.run(
-                [exiftool, "-j", "-n", "-Composite:GPSLatitude", "-Composite:GPSLongitude", image_path],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            data = json.loads(result.stdout)[0]
+            data = exiftool.execute_json(
+                "-n", "-Composite:GPSLatitude", "-Composite:GPSLongitude", image_path
+            )[0]
             lat = data.get("Composite:GPSLatitude") or data.get("GPSLatitude")
             lon = data.get("Composite:GPSLongitude") or data.get("GPSLongitude")
             if lat and lon:
@@ -127,75 +94,120 @@ def get_gps_coords(image_path: str) -> dict:
         except:
             pass
     
-    # Fallback to PIL/piexif
+    return _gps_fallback(image_path)
+
+def _gps_fallback(image_path: str) -> dict:
+    """GPS coordinates from the PIL/piexif metadata model."""
     try:
-        from PIL import Image
-        import piexif
-        
-        img = Image.open(image_path)
-        
-        if 'exif' in img.info:
-            exif_dict = piexif.load(img.info['exif'])
-            
-            if 'GPS' in exif_dict and exif_dict['GPS']:
-                gps_data = exif_dict['GPS']
-                
-                # Extract latitude
-                if piexif.GPSIFD.GPSLatitude in gps_data and piexif.GPSIFD.GPSLatitudeRef in gps_data:
-                    lat = gps_data[piexif.GPSIFD.GPSLatitude]
-                    lat_ref = gps_data[piexif.GPSIFD.GPSLatitudeRef].decode()
-                    
-                    # Convert to decimal degrees
-                    lat_decimal = lat[0][0]/lat[0][1] + lat[1][0]/(lat[1][1]*60) + lat[2][0]/(lat[2][1]*3600)
-                    if lat_ref == 'S':
-                        lat_decimal = -lat_decimal
-                    
-                    # Extract longitude
-                    if piexif.GPSIFD.GPSLongitude in gps_data and piexif.GPSIFD.GPSLongitudeRef in gps_data:
-                        lon = gps_data[piexif.GPSIFD.GPSLongitude]
-                        lon_ref = gps_data[piexif.GPSIFD.GPSLongitudeRef].decode()
-                        
-                        lon_decimal = lon[0][0]/lon[0][1] + lon[1][0]/(lon[1][1]*60) + lon[2][0]/(lon[2][1]*3600)
-                        if lon_ref == 'W':
-                            lon_decimal = -lon_decimal
-                        
-                        return {"latitude": lat_decimal, "longitude": lon_decimal}
-        
-        return {"error": "No GPS data"}
+        model = metadata_model.load(image_path)
     except Exception as e:
         return {"error": str(e)}
+    if model.error:
+        return {"error": model.error}
+    return model.gps() or {"error": "No GPS data"}
 
 def extract_thumbnail(image_path: str) -> bytes:
     """
     Extract thumbnail bytes with exiftool and PIL/piexif fallback.
     """
-    exiftool = get_exiftool_path()
-    
     # Try exiftool first
-    if exiftool and os.path.exists(exiftool):
+    if exiftool.available():
         try:
-            result = subprocess.run(
-                [exiftool, "-b", "-ThumbnailImage", image_path],
-                capture_output=True,
-                timeout=10
-            )
-            if len(result.stdout) > 0:
-                return result.stdout
+            thumbnail = exiftool.execute("-b", "-ThumbnailImage", image_path)
+            if len(thumbnail) > 0:
+                return thumbnail
         except:
             pass
     
     # Fallback to PIL/piexif
     try:
-        from PIL import Image
-        import piexif
-        
-        img = Image.open(image_path)
-        
-        if 'exif' in img.info:
-            exif_dict = piexif.load(img.info['exif'])
-            if 'thumbnail' in exif_dict and exif_dict['thumbnail']:
-                return exif_dict['thumbnail']
-        
-        return b""
+        return _thumbnail_fallback(image_path)
     except:
         return b""
+
+def _thumbnail_fallback(image_path: str) -> bytes:
+    """Thumbnail bytes from the PIL/piexif metadata model (empty if there is none)."""
+    model = metadata_model.load(image_path)
+    if model.error and not model.thumbnail:
+        raise ValueError(model.error)
+    return model.thumbnail
+
+def _read_exiftool_batch(paths: List[str], thumbnails: bool) -> Tuple[Dict[str, dict], ...]:
+    """
+    All tags, numeric GPS and (optionally) base64 thumbnails of a chunk of
+    files, each keyed by path, from up to three commands on one ExifTool
+    worker. Files ExifTool cannot read are missing from the results.
+    """
+    def read(worker):
+        def by_source(run, *args):
+            try:
+                entries = run(*args)
+            except ValueError:
+                # No output: none of the files could be read
+                entries = []
+            return {entry.get("SourceFile"): entry for entry in entries}
+        
+        exif = by_source(worker.get_metadata_batch, paths)
+        gps = by_source(worker.execute_json, "-n", "-Composite:GPSLatitude", "-Composite:GPSLongitude", *paths)
+        thumb = by_source(worker.execute_json, "-b", "-ThumbnailImage", *paths) if thumbnails else {}
+        return exif, gps, thumb
+    
+    return exiftool.get_pool().run(read)
+
+def _batch_record(path: str, exif: dict, gps: dict, thumb: dict, thumbnails: bool) -> dict:
+    """Combine the ExifTool results for one file, using the PIL/piexif fallbacks where they are missing."""
+    record = {"path": path}
+    record["exif"] = exif if exif else _exif_fallback(path)
+    
+    lat = gps.get("GPSLatitude")
+    lon = gps.get("GPSLongitude")
+    record["gps"] = {"latitude": lat, "longitude": lon} if lat and lon else _gps_fallback(path)
+    
+    # Without -b the thumbnail is reported as "(Binary data N bytes, ...)"
+    match = re.match(r"\(Binary data (\d+) bytes", str(exif.get("ThumbnailImage", "")))
+    data = str(thumb.get("ThumbnailImage", ""))
+    if match and (data or not thumbnails):
+        record["thumbnail"] = {"has_thumbnail": True, "size": int(match.group(1))}
+        if thumbnails:
+            record["thumbnail"]["data"] = data.split("base64:", 1)[-1]
+        return record
+    
+    try:
+        fallback = _thumbnail_fallback(path)
+    except:
+        record["thumbnail"] = {"has_thumbnail": False, "error": "Failed to extract"}
+        return record
+    record["thumbnail"] = {"has_thumbnail": bool(fallback)}
+    if fallback:
+        record["thumbnail"]["size"] = len(fallback)
+        if thumbnails:
+            record["thumbnail"]["data"] = base64.b64encode(fallback).decode("ascii")
+    return record
+
+def get_metadata_batch(
+    image_paths: Iterable[str],
+    thumbnails: bool = False,
+    batch_size: int = BATCH_SIZE
+) -> Iterator[dict]:
+    """
+    EXIF, GPS and thumbnail data of many files in one pass.
+    
+    Files are read through a pooled ExifTool worker, batch_size files per
+    command, and records are yielded in input order as each chunk
+    completes. Each record is
+    {"path", "exif", "gps", "thumbnail": {"has_thumbnail", "size"[, "data"]}}
+    with the same contents as get_exif_metadata, get_gps_coords and
+    analyze_thumbnail; "data" is the base64 thumbnail when thumbnails is set.
+    """
+    paths = list(image_paths)
+    use_exiftool = exiftool.available()
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start:start + batch_size]
+        exif, gps, thumb = {}, {}, {}
+        if use_exiftool:
+            try:
+                exif, gps, thumb = _read_exiftool_batch(list(dict.fromkeys(chunk)), thumbnails)
+            except Exception:
+                pass  # Fall back to PIL/piexif for the chunk
+        for path in chunk:
+            yield _batch_record(path, exif.get(path, {}), gps.get(path, {}), thumb.get(path, {}), thumbnails)
@@ -0,0 +1,214 @@
+"""
+Structured metadata of an image file from a single parse.
+
+The file is read once; PIL and piexif decode the EXIF block once, and the
+JPEG marker segments are walked once for XMP and the segment map. Models
+are cached by the SHA-256 of the file, so the EXIF, GPS and thumbnail
+fallbacks of the metadata routes share one parse per upload.
+"""
+import io
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from imagesics_core.forensic import jpeg_dct
+from imagesics_core.utils.result_cache import file_sha256
+
+CACHE_SIZE = 64
+
+IFD_NAMES = ("0th", "Exif", "GPS", "Interop", "1st")
+
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+
+_MARKER_NAMES = {
+    0xC4: "DHT", 0xCC: "DAC", 0xDA: "SOS", 0xDB: "DQT", 0xDD: "DRI",
+    0xDE: "DHP", 0xDF: "EXP", 0xFE: "COM",
+}
+
+# Identifiers at the start of common APPn payloads
+_APP_IDENTIFIERS = (
+    (b"JFIF\x00", "JFIF"),
+    (b"JFXX\x00", "JFXX"),
+    (b"Exif\x00\x00", "Exif"),
+    (XMP_HEADER, "XMP"),
+    (b"http://ns.adobe.com/xmp/extension/\x00", "Extended XMP"),
+    (b"ICC_PROFILE\x00", "ICC profile"),
+    (b"MPF\x00", "MPF"),
+    (b"Photoshop 3.0\x00", "Photoshop IRB"),
+    (b"Adobe", "Adobe"),
+    (b"Ducky", "Ducky"),
+)
+
+
+def _marker_name(marker: int) -> str:
+    if 0xE0 <= marker <= 0xEF:
+        return f"APP{marker - 0xE0}"
+    if 0xC0 <= marker <= 0xCF:
+        return _MARKER_NAMES.get(marker, f"SOF{marker - 0xC0}")
+    return _MARKER_NAMES.get(marker, f"0x{marker:02X}")
+
+
+class MetadataModel:
+    """
+    Metadata of one file.
+
+    Attributes:
+        digest: SHA-256 of the file.
+        format: PIL format name (e.g. "JPEG"), or None if not an image.
+        tags: Flat {tag: str(value)} from PIL's EXIF reader.
+        ifds: piexif IFDs ("0th", "Exif", "GPS", "Interop", "1st") of raw values.
+        thumbnails: Embedded thumbnails as (source, JPEG bytes).
+        maker_note: {"make", "size", "data"} of the EXIF MakerNote, or None.
+        xmp: XMP packet as text, or None.
+        segments: JPEG marker segments as {"marker", "name", "offset", "length"}
+            (offset of the marker, length of the payload).
+        error: Why the image or its EXIF block could not be read, or None.
+    """
+
+    def __init__(self, digest: str):
+        self.digest = digest
+        self.format: Optional[str] = None
+        self.tags: Dict[str, str] = {}
+        self.ifds: Dict[str, dict] = {name: {} for name in IFD_NAMES}
+        self.thumbnails: List[Tuple[str, bytes]] = []
+        self.maker_note: Optional[dict] = None
+        self.xmp: Optional[str] = None
+        self.segments: List[dict] = []
+        self.error: Optional[str] = None
+
+    def exif(self) -> dict:
+        """Readable {tag name: value} of all tags, as the EXIF route returns them."""
+        import piexif
+
+        exif_dict = dict(self.tags)
+        for ifd in ("0th", "Exif", "GPS", "1st"):
+            for tag, value in self.ifds[ifd].items():
+                tag_name = piexif.TAGS[ifd].get(tag, {}).get("name", str(tag))
+                exif_dict[tag_name] = str(value) if not isinstance(value, bytes) else value.decode('utf-8', errors='ignore')
+        return exif_dict
+
+    def gps(self) -> Optional[dict]:
+        """Decimal {"latitude", "longitude"}, or None without a complete GPS fix."""
+        import piexif
+
+        gps_data = self.ifds["GPS"]
+        keys = (piexif.GPSIFD.GPSLatitude, piexif.GPSIFD.GPSLatitudeRef,
+                piexif.GPSIFD.GPSLongitude, piexif.GPSIFD.GPSLongitudeRef)
+        if not all(k in gps_data for k in keys):
+            return None
+
+        def decimal(dms, ref, negative):
+            value = dms[0][0]/dms[0][1] + dms[1][0]/(dms[1][1]*60) + dms[2][0]/(dms[2][1]*3600)
+            return -value if ref.decode() == negative else value
+
+        return {
+            "latitude": decimal(gps_data[keys[0]], gps_data[keys[1]], 'S'),
+            "longitude": decimal(gps_data[keys[2]], gps_data[keys[3]], 'W'),
+        }
+
+    @property
+    def thumbnail(self) -> bytes:
+        """The EXIF thumbnail, or empty bytes."""
+        return next((data for source, data in self.thumbnails if source == "EXIF"), b"")
+
+    def to_dict(self) -> dict:
+        """JSON-friendly summary (binary payloads reduced to their sizes)."""
+        return {
+            "digest": self.digest,
+            "format": self.format,
+            "exif": self.exif(),
+            "gps": self.gps(),
+            "thumbnails": [{"source": source, "size": len(data)} for source, data in self.thumbnails],
+            "maker_note": {k: v for k, v in self.maker_note.items() if k != "data"} if self.maker_note else None,
+            "xmp": self.xmp,
+            "segments": self.segments,
+            "error": self.error,
+        }
+
+
+def _read_segments(model: MetadataModel, data: bytes) -> None:
+    try:
+        for marker, offset, length in jpeg_dct.iter_segments(data):
+            if marker is None or length == 2:
+                continue  # Scan data and standalone markers carry no metadata
+            name = _marker_name(marker)
+            payload = data[offset + 4:offset + length]
+            if name.startswith("APP"):
+                ident = next((label for prefix, label in _APP_IDENTIFIERS if payload.startswith(prefix)), None)
+                if ident:
+                    name = f"{name} ({ident})"
+                if ident == "XMP" and model.xmp is None:
+                    model.xmp = payload[len(XMP_HEADER):].decode("utf-8", errors="replace")
+            model.segments.append({"marker": f"FF{marker:02X}", "name": name, "offset": offset, "length": length - 4})
+    except ValueError:
+        pass  # Keep the segments read before the corruption
+
+
+def parse(data: bytes, digest: str = "") -> MetadataModel:
+    """Build the metadata model of a file's contents."""
+    from PIL import Image, UnidentifiedImageError
+    import piexif
+
+    model = MetadataModel(digest)
+    if data[:2] == b"\xff\xd8":
+        _read_segments(model, data)
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        model.format = img.format
+
+        if hasattr(img, '_getexif') and img._getexif():
+            model.tags = {str(tag_id): str(value) for tag_id, value in img._getexif().items()}
+
+        if model.xmp is None:
+            xmp = img.info.get("xmp") or img.info.get("XML:com.adobe.xmp")
+            if xmp:
+                model.xmp = xmp.decode("utf-8", errors="replace") if isinstance(xmp, bytes) else str(xmp)
+
+        if 'exif' in img.info:
+            exif_data = piexif.load(img.info['exif'])
+            for ifd in IFD_NAMES:
+                model.ifds[ifd] = exif_data.get(ifd) or {}
+            if exif_data.get('thumbnail'):
+                model.thumbnails.append(("EXIF", exif_data['thumbnail']))
+            maker_note = model.ifds["Exif"].get(piexif.ExifIFD.MakerNote)
+            if maker_note:
+                make = model.ifds["0th"].get(piexif.ImageIFD.Make, b"")
+                model.maker_note = {
+                    "make": make.decode(errors="ignore").strip("\x00 ") if isinstance(make, bytes) else str(make),
+                    "size": len(maker_note),
+                    "data": maker_note,
+                }
+    except UnidentifiedImageError:
+        model.error = "cannot identify image file"
+    except Exception as e:
+        model.error = str(e)
+    return model
+
+
+_cache: "OrderedDict[str, MetadataModel]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load(path: str) -> MetadataModel:
+    """The metadata model of a file, parsed once per content digest."""
+    digest = file_sha256(path)
+    with _cache_lock:
+        model = _cache.get(digest)
+        if model is not None:
+            _cache.move_to_end(digest)
+            return model
+
+    with open(path, "rb") as f:
+        model = parse(f.read(), digest)
+
+    with _cache_lock:
+        _cache[digest] = model
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return model
+
+
+def clear() -> None:
+    with _cache_lock:
+        _cache.clear()
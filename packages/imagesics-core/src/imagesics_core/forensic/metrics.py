@@ -6,6 +6,11 @@ import cv2 as cv
 import numpy as np
 from typing import Dict, Tuple
 
+from imagesics_core.utils import tiling
+
+# Peak working memory of compute_ssim per pixel
+SSIM_BYTES_PER_PIXEL = 96
+
 
 def compare_images(img1: np.ndarray, img2: np.ndarray) -> Dict[str, float]:
     """
@@ -29,8 +34,8 @@ def compare_images(img1: np.ndarray, img2: np.ndarray) -> Dict[str, float]:
     
     metrics = {}
     
-    # 1. Mean Squared Error (MSE)
-    mse = np.mean((img1.astype(float) - img2.astype(float)) ** 2)
+    # 1. Mean Squared Error (MSE), without float copies of the images
+    mse = cv.norm(img1, img2, cv.NORM_L2SQR) / img1.size
     metrics['mse'] = float(mse)
     
     # 2. Peak Signal-to-Noise Ratio (PSNR)
@@ -54,7 +59,7 @@ def compare_images(img1: np.ndarray, img2: np.ndarray) -> Dict[str, float]:
     metrics['histogram_correlation'] = float(hist_corr)
     
     # 6. Mean Absolute Error (MAE)
-    mae = np.mean(np.abs(img1.astype(float) - img2.astype(float)))
+    mae = cv.norm(img1, img2, cv.NORM_L1) / img1.size
     metrics['mae'] = float(mae)
     
     # 7. Overall similarity percentage (based on SSIM)
@@ -74,6 +79,19 @@ def compute_ssim(img1: np.ndarray, img2: np.ndarray) -> float:
     Returns:
         SSIM value between -1 and 1 (1 means identical)
     """
+    height, width = img1.shape[:2]
+    if not tiling.needs_tiling(img1.shape, SSIM_BYTES_PER_PIXEL):
+        return float(np.mean(_ssim_map(img1, img2)))
+    
+    # Sum the map tile by tile; the 11x11 window needs a 5 pixel halo
+    total = 0.0
+    side = tiling.tile_size(SSIM_BYTES_PER_PIXEL, halo=5)
+    for tile in tiling.iter_tiles(height, width, side, halo=5):
+        total += float(np.sum(_ssim_map(img1[tile.source], img2[tile.source])[tile.crop]))
+    return total / (height * width)
+
+
+def _ssim_map(img1: np.ndarray, img2: np.ndarray) -> np.ndarray:
     C1 = (0.01 * 255) ** 2
     C2 = (0.03 * 255) ** 2
     
@@ -94,10 +112,8 @@ def compute_ssim(img1: np.ndarray, img2: np.ndarray) -> float:
     sigma12 = cv.GaussianBlur(img1 * img2, (11, 11), 1.5) - mu1_mu2
     
     # SSIM formula
-    ssim_map = ((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) / \
-               ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2))
-    
-    return float(np.mean(ssim_map))
+    return ((2 * mu1_mu2 + C1) * (2 * sigma12 + C2)) / \
+           ((mu1_sq + mu2_sq + C1) * (sigma1_sq + sigma2_sq + C2))
 
 
 def compute_ncc(img1: np.ndarray, img2: np.ndarray) -> float:
@@ -111,10 +127,20 @@ def compute_ncc(img1: np.ndarray, img2: np.ndarray) -> float:
     Returns:
         NCC value between -1 and 1
     """
-    img1_norm = (img1 - np.mean(img1)) / (np.std(img1) + 1e-10)
-    img2_norm = (img2 - np.mean(img2)) / (np.std(img2) + 1e-10)
-    
-    ncc = np.mean(img1_norm * img2_norm)
+    # Accumulated over row bands to avoid float copies of whole images
+    n = img1.size
+    mean1, mean2 = float(np.mean(img1)), float(np.mean(img2))
+    sum12 = sq1 = sq2 = 0.0
+    band = max(1, tiling.tile_size(24) ** 2 // max(1, img1[:1].size))
+    for y in range(0, img1.shape[0], band):
+        a = img1[y:y + band].astype(np.float64) - mean1
+        b = img2[y:y + band].astype(np.float64) - mean2
+        sum12 += float(np.sum(a * b))
+        sq1 += float(np.sum(a * a))
+        sq2 += float(np.sum(b * b))
+    
+    std1, std2 = np.sqrt(sq1 / n), np.sqrt(sq2 / n)
+    ncc = sum12 / n / ((std1 + 1e-10) * (std2 + 1e-10))
     return float(np.clip(ncc, -1, 1))
 
 
@@ -1,22 +1,15 @@
 import cv2 as cv
 import numpy as np
+from typing import Optional
 from imagesics_core.utils.processing import equalize_img, create_lut
+from imagesics_core.utils import tiling
 
-def perform_noise_separation(
-    image: np.ndarray,
-    mode: str = "Median",
-    radius: int = 1,
-    sigma: int = 3,
-    levels: int = 32,
-    grayscale: bool = False,
-    show_denoised: bool = False
-) -> np.ndarray:
-    
-    if grayscale:
-        original = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-    else:
-        original = image
-        
+NOISE_MODES = ("Median", "Gaussian", "BoxBlur", "Bilateral", "NonLocal")
+# Peak working memory per pixel of a BGR image
+NOISE_BYTES_PER_PIXEL = 16
+PRNU_BYTES_PER_PIXEL = 16
+
+def _denoise(original: np.ndarray, mode: str, radius: int, sigma: int) -> Optional[np.ndarray]:
     kernel = radius * 2 + 1
     
     denoised = None
@@ -33,14 +26,81 @@ def perform_noise_separation(
             denoised = cv.fastNlMeansDenoising(original, None, kernel)
         else:
             denoised = cv.fastNlMeansDenoisingColored(original, None, kernel, kernel)
-            
-    if denoised is None:
+    return denoised
+
+def _halo(mode: str, radius: int) -> int:
+    # Non-local means compares 7x7 patches within a 21x21 window
+    return 13 if mode == "NonLocal" else radius
+
+def noise_map(
+    image: np.ndarray,
+    mode: str = "Median",
+    radius: int = 1,
+    sigma: int = 3,
+    grayscale: bool = False
+) -> np.ndarray:
+    """
+    Raw noise: absolute difference between the image (or its grayscale
+    version) and its denoised version, as uint8.
+    """
+    if mode not in NOISE_MODES:
+        raise ValueError(f"Unknown noise mode: {mode}")
+    
+    def residual(tile: np.ndarray) -> np.ndarray:
+        original = cv.cvtColor(tile, cv.COLOR_BGR2GRAY) if grayscale else tile
+        return cv.absdiff(original, _denoise(original, mode, radius, sigma))
+    
+    return tiling.process_tiled(image, residual, NOISE_BYTES_PER_PIXEL, halo=_halo(mode, radius))
+
+def perform_noise_separation(
+    image: np.ndarray,
+    mode: str = "Median",
+    radius: int = 1,
+    sigma: int = 3,
+    levels: int = 32,
+    grayscale: bool = False,
+    show_denoised: bool = False,
+    noise: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Noise (or denoised image) for display.
+    
+    noise may supply the precomputed noise_map() of the image with the
+    same mode, radius, sigma and grayscale.
+    """
+    if mode not in NOISE_MODES:
         return image
+    
+    if noise is None and tiling.needs_tiling(image.shape, NOISE_BYTES_PER_PIXEL):
+        # Histogram equalization is global: tile the raw noise (identity
+        # LUT at levels=255) and equalize the assembled result
+        equalize = levels == 0 and not show_denoised
+        result = tiling.process_tiled(
+            image,
+            lambda tile: perform_noise_separation(
+                tile, mode, radius, sigma, 255 if equalize else levels, grayscale, show_denoised
+            ),
+            NOISE_BYTES_PER_PIXEL,
+            halo=_halo(mode, radius)
+        )
+        return equalize_img(result) if equalize else result
+    
+    if grayscale:
+        original = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    else:
+        original = image
+        
+    denoised = None
+    if noise is None or show_denoised:
+        denoised = _denoise(original, mode, radius, sigma)
+        if denoised is None:
+            return image
 
     if show_denoised:
         result = denoised
     else:
-        noise = cv.absdiff(original, denoised)
+        if noise is None:
+            noise = cv.absdiff(original, denoised)
         if levels == 0:
             if len(noise.shape) == 2:
                 result = cv.equalizeHist(noise)
@@ -55,3 +115,34 @@ def perform_noise_separation(
          result = cv.cvtColor(result, cv.COLOR_GRAY2BGR)
 
     return result
+
+def prnu_map(image: np.ndarray, gray: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Raw PRNU estimate: float32 high-pass residual of the grayscale image.
+    """
+    if gray is None:
+        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    
+    def residual(tile: np.ndarray) -> np.ndarray:
+        tile = tile.astype(np.float32)
+        # Denoise using Gaussian blur and extract the noise residual
+        return tile - cv.GaussianBlur(tile, (5, 5), 0)
+    
+    return tiling.process_tiled(gray, residual, PRNU_BYTES_PER_PIXEL, halo=2)
+
+def compute_prnu(
+    image: np.ndarray,
+    gray: Optional[np.ndarray] = None,
+    prnu: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Simplified PRNU (sensor pattern noise) extraction: high-pass residual
+    of the grayscale image, colormapped for display.
+    prnu: precomputed prnu_map() of the image.
+    """
+    if prnu is None:
+        prnu = prnu_map(image, gray)
+    
+    # Normalize for visualization
+    prnu_norm = cv.normalize(prnu, None, 0, 255, cv.NORM_MINMAX).astype(np.uint8)
+    return cv.applyColorMap(prnu_norm, cv.COLORMAP_JET)
@@ -0,0 +1,322 @@
+"""
+Persistent perceptual-hash index for local similar-image search.
+
+Hashes are kept in a BK-tree keyed on Hamming distance so that a radius
+query only visits the branches that can contain a match, and are stored
+on disk as an append-only JSON-lines log. Several processes (e.g. server
+workers) can share one log: each replays the lines appended since its
+last read before searching. Once superseded entries and removals
+outnumber the live ones, the log is rewritten with only the live entries;
+readers notice the new file and reload it.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2 as cv
+
+try:
+    import fcntl
+except ImportError:  # Windows: the log is not locked across processes
+    fcntl = None
+
+HASH_BITS = 64
+# Dead log lines tolerated regardless of the live count
+COMPACT_MIN = 64
+IMAGE_EXTENSIONS = ('.jpg', '.png', '.jpeg', '.webp')
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def compute_phash(image_path: str) -> Optional[int]:
+    """
+    Compute the 64-bit perceptual hash of an image file.
+
+    Returns None if the file cannot be decoded.
+    """
+    img = cv.imread(str(image_path))
+    if img is None:
+        return None
+    return image_phash(img)
+
+
+def image_phash(image) -> int:
+    """64-bit perceptual hash of a decoded BGR image."""
+    from PIL import Image
+    import imagehash
+
+    pil = Image.fromarray(cv.cvtColor(image, cv.COLOR_BGR2RGB))
+    return int(str(imagehash.phash(pil)), 16)
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    def __init__(self):
+        # Node layout: [hash, names, {distance: child}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, name: str) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [name], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].append(name)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [name], {}]
+                return
+            node = child
+
+    def discard(self, value: int, name: str) -> None:
+        """Remove a name; the node itself stays in place for routing."""
+        node = self._root
+        while node is not None:
+            d = hamming(value, node[0])
+            if d == 0:
+                if name in node[1]:
+                    node[1].remove(name)
+                    self._size -= 1
+                return
+            node = node[2].get(d)
+
+    def search(self, value: int, radius: int) -> List[Tuple[str, int]]:
+        """Return (name, distance) for every entry within radius."""
+        results = []
+        if self._root is None:
+            return results
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                results.extend((name, d) for name in node[1])
+            lo, hi = d - radius, d + radius
+            for dist, child in node[2].items():
+                if lo <= dist <= hi:
+                    stack.append(child)
+        return results
+
+
+class PHashIndex:
+    """
+    Perceptual-hash index over the files of an uploads directory.
+
+    Args:
+        index_path: JSON-lines log the index is persisted to.
+        uploads_dir: Directory whose images are indexed.
+    """
+
+    def __init__(self, index_path: Path, uploads_dir: Path):
+        self.index_path = Path(index_path)
+        self.uploads_dir = Path(uploads_dir)
+        self._hashes: Dict[str, int] = {}
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        # Byte offset of the log up to which entries have been applied,
+        # the number of lines applied, and the inode they were read from
+        self._offset = 0
+        self._lines = 0
+        self._inode: Optional[int] = None
+        self._synced = False
+        with self._lock:
+            self._replay()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._hashes
+
+    def _apply(self, name: str, value: Optional[int]) -> bool:
+        """Set (or with None remove) a name's hash in memory; False if unchanged."""
+        old = self._hashes.get(name)
+        if old == value:
+            return False
+        if old is not None:
+            self._tree.discard(old, name)
+        if value is None:
+            del self._hashes[name]
+        else:
+            self._hashes[name] = value
+            self._tree.add(value, name)
+        return True
+
+    def _replay(self) -> None:
+        """Apply log entries appended since the last replay. Needs self._lock."""
+        try:
+            with open(self.index_path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._inode:
+                    if self._inode is not None:
+                        # Compacted by another process: reload from the start
+                        self._hashes = {}
+                        self._tree = BKTree()
+                        self._offset = 0
+                        self._lines = 0
+                    self._inode = inode
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line without its newline is still being written by another process
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                value = None if entry.get("removed") else int(entry["phash"], 16)
+            except (ValueError, KeyError):
+                continue  # Torn write from an interrupted append
+            self._apply(entry["name"], value)
+            self._lines += 1
+        self._offset += end
+
+    def _open_locked(self, mode: str):
+        """Open the log holding an exclusive lock on the current file."""
+        while True:
+            f = open(self.index_path, mode)
+            if fcntl is None:
+                return f
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.index_path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()  # Replaced while waiting for the lock
+
+    def _append(self, entry: dict) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._open_locked("a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _compact(self) -> None:
+        """Rewrite the log with only the live entries. Needs self._lock."""
+        if not self.index_path.exists():
+            return
+        with self._open_locked("rb"):
+            # Appends wait for the lock, so nothing is lost past this replay
+            self._replay()
+            tmp = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w") as out:
+                for name, value in self._hashes.items():
+                    out.write(json.dumps({"name": name, "phash": f"{value:016x}"}) + "\n")
+            os.replace(tmp, self.index_path)
+            st = os.stat(self.index_path)
+            self._inode, self._offset, self._lines = st.st_ino, st.st_size, len(self._hashes)
+
+    def _settle(self) -> None:
+        """Read back the log and compact it if mostly dead. Needs self._lock."""
+        self._replay()
+        dead = self._lines - len(self._hashes)
+        if dead > max(len(self._hashes), COMPACT_MIN):
+            self._compact()
+
+    def get(self, name: str) -> Optional[int]:
+        return self._hashes.get(name)
+
+    def add(self, name: str, value: int) -> None:
+        """Insert or replace the hash stored for a file name."""
+        with self._lock:
+            if self._apply(name, value):
+                self._append({"name": name, "phash": f"{value:016x}"})
+                self._settle()
+
+    def add_file(self, path: str) -> Optional[int]:
+        """Hash an image file and add it to the index."""
+        path = Path(path)
+        if path.suffix.lower() not in IMAGE_EXTENSIONS:
+            return None
+        value = compute_phash(str(path))
+        if value is not None:
+            self.add(path.name, value)
+        return value
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            if self._apply(name, None):
+                self._append({"name": name, "removed": True})
+                self._settle()
+
+    def sync(self) -> int:
+        """
+        Index files present in the uploads directory but missing from the
+        index (e.g. uploaded before the index existed), then compact the
+        log if it holds dead entries. Returns the number of files added.
+        """
+        if not self.uploads_dir.exists():
+            return 0
+        added = 0
+        with self._lock:
+            self._replay()
+        for entry in os.scandir(self.uploads_dir):
+            if not entry.is_file() or entry.name in self._hashes:
+                continue
+            try:
+                if self.add_file(entry.path) is not None:
+                    added += 1
+            except Exception:
+                continue
+        with self._lock:
+            self._replay()
+            if self._lines > len(self._hashes):
+                self._compact()
+        return added
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[str, int]]:
+        """
+        Return (name, distance) pairs within max_distance of value.
+
+        Entries added by other processes since the last query are picked up
+        first; entries whose file has disappeared from disk are dropped.
+        """
+        with self._lock:
+            self._replay()
+            matches = self._tree.search(value, max_distance)
+        results = []
+        for name, distance in matches:
+            if not (self.uploads_dir / name).is_file():
+                self.remove(name)
+                continue
+            results.append((name, distance))
+        return results
+
+
+_indexes: Dict[Tuple[str, str], PHashIndex] = {}
+_indexes_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def get_index(index_path: Path, uploads_dir: Path, sync: bool = True) -> PHashIndex:
+    """
+    Return the process-wide index for a storage location, loading it once.
+
+    With sync, files missing from the index are hashed on the first such
+    call of the process; callers that only add entries (uploads) pass
+    False so they never wait for a scan of the whole directory.
+    """
+    key = (str(index_path), str(uploads_dir))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = PHashIndex(index_path, uploads_dir)
+    if sync and not index._synced:
+        with _sync_lock:
+            if not index._synced:
+                index.sync()
+                index._synced = True
+    return index
@@ -1,44 +1,88 @@
 import cv2
 import numpy as np
 from scipy.stats import skew, kurtosis
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from imagesics_core.utils import image_cache, tiling
+
+# Percentiles reported by compute_pixel_stats
+PERCENTILES = (1, 5, 25, 75, 95, 99)
+
+def _calc_histograms(image: np.ndarray) -> np.ndarray:
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    return np.stack([
+        cv2.calcHist([image], [c], None, [256], [0, 256])[:, 0] for c in range(channels)
+    ]).astype(np.int64)
+
+def channel_histograms(image: np.ndarray) -> np.ndarray:
+    """
+    256-bin histogram of every channel of a uint8 image, shape
+    (channels, 256); memoized for read-only (cached) images.
+    """
+    return image_cache.derived(image, "channel_histograms", _calc_histograms)
+
+def gray_histogram(image: np.ndarray) -> np.ndarray:
+    """256-bin histogram of the grayscale version of a BGR image."""
+    return image_cache.derived(
+        image, "gray_histogram",
+        lambda im: _calc_histograms(cv2.cvtColor(im, cv2.COLOR_BGR2GRAY))[0]
+    )
+
+def _rank_values(cumulative: np.ndarray, ranks: np.ndarray) -> np.ndarray:
+    """Values at fractional ranks of sorted data, interpolated like np.percentile."""
+    lower = np.floor(ranks).astype(np.int64)
+    upper = np.minimum(lower + 1, cumulative[-1] - 1)
+    values_lower = np.searchsorted(cumulative, lower, side="right")
+    values_upper = np.searchsorted(cumulative, upper, side="right")
+    return values_lower + (ranks - lower) * (values_upper - values_lower)
+
+def histogram_stats(hist: np.ndarray, percentiles=PERCENTILES) -> Dict[str, Any]:
+    """
+    Min, max, mean, standard deviation, median, entropy and percentiles
+    of the data a 256-bin histogram counts, equal to the NumPy functions
+    applied to the data itself.
+    """
+    count = int(hist.sum())
+    if count == 0:
+        raise ValueError("Empty histogram")
+    levels = np.arange(hist.size, dtype=np.float64)
+    nonzero = np.flatnonzero(hist)
+    mean = float(levels @ hist / count)
+    variance = float(((levels - mean) ** 2) @ hist / count)
+    p = hist[nonzero] / count
+    
+    cumulative = np.cumsum(hist)
+    ranks = np.array([50] + list(percentiles), dtype=np.float64) / 100 * (count - 1)
+    values = _rank_values(cumulative, ranks)
+    return {
+        "min": int(nonzero[0]),
+        "max": int(nonzero[-1]),
+        "mean": mean,
+        "std_dev": variance ** 0.5,
+        "median": float(values[0]),
+        "entropy": float(-(p * np.log2(p)).sum()),
+        "percentiles": {str(q): float(v) for q, v in zip(percentiles, values[1:])},
+    }
 
 def compute_pixel_stats(image: np.ndarray) -> Dict[str, Any]:
     """
     Compute detailed pixel statistics for the image.
+    
+    All statistics come from one histogram per channel, which is shared
+    with the histogram tool for cached images.
     """
     if len(image.shape) == 3:
-        channels = cv2.split(image)
         colors = ['Blue', 'Green', 'Red']
     else:
-        channels = [image]
         colors = ['Gray']
-        
-    stats = {}
     
-    for i, c in enumerate(channels):
-        flat = c.flatten()
-        stats[colors[i]] = {
-            "min": int(np.min(flat)),
-            "max": int(np.max(flat)),
-            "mean": float(np.mean(flat)),
-            "std_dev": float(np.std(flat)),
-            "median": float(np.median(flat)),
-            "entropy": float(_entropy(flat))
-        }
-        
-    return stats
-
-def _entropy(signal):
-    """lensignal=signal.size"""
-    lensignal = signal.size
-    sysmbols = np.unique(signal)
-    probability = [np.size(signal[signal == i]) / (1.0 * lensignal) for i in sysmbols]
-    return np.sum([p * np.log2(1.0 / p) for p in probability])
+    hists = channel_histograms(image)
+    return {color: histogram_stats(hist) for color, hist in zip(colors, hists)}
 
-def compute_minmax_deviation(image: np.ndarray, window: int = 3) -> np.ndarray:
+def minmax_map(image: np.ndarray, window: int = 3) -> np.ndarray:
     """
-    Compute Min/Max deviation map.
+    Raw Min/Max deviation: local max - local min of the grayscale image
+    over a window x window neighbourhood (uint8).
     """
     if len(image.shape) == 3:
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -46,12 +90,27 @@ def compute_minmax_deviation(image: np.ndarray, window: int = 3) -> np.ndarray:
         gray = image
         
     kernel = np.ones((window, window), np.uint8)
-    local_min = cv2.erode(gray, kernel)
-    local_max = cv2.dilate(gray, kernel)
     
-    # Deviation = Max - Min
-    dev = cv2.absdiff(local_max, local_min)
-    return cv2.applyColorMap(dev, cv2.COLORMAP_JET)
+    def deviation(tile: np.ndarray) -> np.ndarray:
+        local_min = cv2.erode(tile, kernel)
+        local_max = cv2.dilate(tile, kernel)
+        # Deviation = Max - Min
+        return cv2.absdiff(local_max, local_min)
+    
+    return tiling.process_tiled(gray, deviation, 8, halo=window // 2)
+
+def compute_minmax_deviation(
+    image: np.ndarray,
+    window: int = 3,
+    deviation: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Compute Min/Max deviation map.
+    deviation: precomputed minmax_map() of the image.
+    """
+    if deviation is None:
+        deviation = minmax_map(image, window)
+    return cv2.applyColorMap(deviation, cv2.COLORMAP_JET)
 
 def get_bit_plane(image: np.ndarray, plane: int) -> np.ndarray:
     """
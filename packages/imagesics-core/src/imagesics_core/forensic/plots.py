@@ -1,12 +1,13 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import io
 
 def compute_rgb_scatter(image: np.ndarray, color_space: str = 'RGB') -> bytes:
     """
     Compute 2D scatter plot of pixels.
     """
+    import matplotlib.pyplot as plt
+
     # Downsample for performance
     small = cv2.resize(image, (0,0), fx=0.25, fy=0.25)
     
@@ -0,0 +1,175 @@
+"""
+Batched JPEG recompression sweeps.
+
+A recompression curve is the mean absolute difference between an image and
+its JPEG round-trip at each quality. Curves are computed on a thread pool
+(OpenCV releases the GIL while encoding and decoding) and memoized per
+image, so quality estimation, loss curves and multiple-compression plots
+share one set of encodes.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+MEMO_SIZE = 16
+
+_memo: "OrderedDict[str, Dict[int, float]]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    return cv.cvtColor(image, cv.COLOR_BGR2GRAY) if len(image.shape) > 2 else image
+
+
+def centre_crop(gray: np.ndarray, side: int) -> np.ndarray:
+    """
+    Centre crop of at most side x side pixels whose origin and size are
+    multiples of 8, so its blocks are blocks of the original JPEG grid.
+    """
+    h, w = gray.shape[:2]
+    ch, cw = max(8, min(h, side) // 8 * 8), max(8, min(w, side) // 8 * 8)
+    if ch >= h and cw >= w:
+        return gray
+    y, x = (h - ch) // 16 * 8, (w - cw) // 16 * 8
+    return gray[y:y + ch, x:x + cw]
+
+
+def image_key(gray: np.ndarray) -> str:
+    """Content key of a grayscale image."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(gray.shape).encode())
+    h.update(np.ascontiguousarray(gray).data)
+    return h.hexdigest()
+
+
+def recompression_error(gray: np.ndarray, quality: int) -> float:
+    """Mean absolute difference between gray and its JPEG round-trip."""
+    _, buffer = cv.imencode(".jpg", gray, [cv.IMWRITE_JPEG_QUALITY, int(quality)])
+    decoded = cv.imdecode(buffer, cv.IMREAD_GRAYSCALE)
+    return cv.mean(cv.absdiff(gray, decoded))[0]
+
+
+def sweep(
+    gray: np.ndarray,
+    qualities: Iterable[int],
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[float], None]] = None,
+    key: Optional[str] = None
+) -> np.ndarray:
+    """
+    Recompression error of a grayscale image at each quality.
+
+    Qualities already computed for the same image are served from the
+    memo; the rest are encoded in parallel.
+
+    Args:
+        gray: Grayscale uint8 image.
+        qualities: JPEG qualities (0-100).
+        max_workers: Encoder threads (default: DEFAULT_WORKERS).
+        progress: Called with the completed fraction.
+        key: Precomputed image_key(gray).
+
+    Returns:
+        float array of errors, in the order of qualities.
+    """
+    qualities = [int(q) for q in qualities]
+    key = key or image_key(gray)
+    with _memo_lock:
+        known = dict(_memo.get(key, {}))
+    missing = sorted(set(qualities) - set(known))
+
+    if missing:
+        done = 0
+        with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_WORKERS) as pool:
+            for q, err in zip(missing, pool.map(lambda q: recompression_error(gray, q), missing)):
+                known[q] = err
+                done += 1
+                if progress is not None:
+                    progress(done / len(missing))
+        with _memo_lock:
+            _memo.setdefault(key, {}).update(known)
+            _memo.move_to_end(key)
+            while len(_memo) > MEMO_SIZE:
+                _memo.popitem(last=False)
+
+    return np.array([known[q] for q in qualities], dtype=np.float64)
+
+
+def dip_depths(errors: Dict[int, float]) -> Dict[int, float]:
+    """
+    Error of every local minimum of a {quality: error} curve relative to
+    the mean of its neighbouring qualities; small values are deep dips.
+    """
+    qualities = sorted(errors)
+    values = [errors[q] for q in qualities]
+    depths = {}
+    for k, q in enumerate(qualities):
+        neighbours = values[max(0, k - 1):k] + values[k + 1:k + 2]
+        if neighbours and all(values[k] <= v for v in neighbours):
+            depths[q] = values[k] / max(float(np.mean(neighbours)), 1e-12)
+    return depths
+
+
+def coarse_to_fine(
+    gray: np.ndarray,
+    low: int = 1,
+    high: int = 100,
+    step: int = 10,
+    candidates: int = 2,
+    max_workers: Optional[int] = None,
+    progress: Optional[Callable[[float], None]] = None,
+    dense_below: int = 0
+) -> Tuple[int, Dict[int, float]]:
+    """
+    Quality in [low, high] at the deepest dip of the recompression error.
+
+    Recompressing at the original quality leaves an error far below that
+    of the neighbouring qualities, while the error also falls steadily
+    towards 100, so dips are ranked by dip_depths() rather than by their
+    error. The range is sampled every `step` qualities, then every quality
+    within `step` of the `candidates` deepest coarse dips is evaluated.
+    With step=1 this is an exhaustive search.
+
+    Qualities below dense_below are all sampled in the coarse pass: under
+    50 the libjpeg table scale (5000 / quality) changes by more than a
+    quantization step per quality, so the dip is a single quality wide.
+
+    Returns:
+        (best quality, {quality: error} of every quality evaluated)
+    """
+    def report(start: float, span: float):
+        if progress is None:
+            return None
+        return lambda done: progress(start + span * done)
+
+    key = image_key(gray)
+    coarse = sorted(set(range(low, high + 1, max(1, step))) | {high}
+                    | set(range(low, min(dense_below, high + 1))))
+    refine = step > 1 and len(coarse) > 1
+    errors = dict(zip(coarse, sweep(gray, coarse, max_workers, report(0.0, 0.5 if refine else 1.0), key=key)))
+
+    if refine:
+        depths = dip_depths(errors)
+        seeds = sorted(depths, key=depths.get)[:candidates]
+        fine = sorted({
+            q for s in seeds
+            for q in range(max(low, s - step + 1), min(high, s + step - 1) + 1)
+        } - set(errors))
+        errors.update(zip(fine, sweep(gray, fine, max_workers, report(0.5, 0.5), key=key)))
+
+    errors = dict(sorted(errors.items()))
+    depths = dip_depths(errors) or {q: 1.0 for q in errors}
+    best = min(depths, key=lambda q: (depths[q], errors[q], q))
+    return best, errors
+
+
+def clear() -> None:
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,229 @@
+"""
+Single-pass forensic report.
+
+Runs a set of tools against one decoded image. Intermediates several
+tools need (grayscale, float conversion, JPEG round-trips, FFT, Sobel
+gradients) are computed once per report by an AnalysisContext and shared;
+independent tools run in parallel threads.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import cv2 as cv
+import numpy as np
+
+from imagesics_core.forensic import (
+    ela, cloning, noise, histogram, ghost_maps, pixel_analysis, filters,
+    transforms, wavelets, jpeg_quality, various
+)
+from imagesics_core.forensic.ghost_maps import GhostMapRequest
+from imagesics_core.forensic.jpeg import compress_jpg
+from imagesics_core.forensic.resampling import ResamplingRequest, compute_resampling_analysis
+
+# pyplot keeps global state and is not thread-safe; only the tools that
+# draw real plots need it, the image panels are composed by utils.render
+PLOT_LOCK = threading.Lock()
+
+
+class AnalysisContext:
+    """
+    Lazily computed, memoized intermediates of one image.
+
+    Each intermediate is computed by the first tool that asks for it;
+    concurrent requests for the same one wait for that computation.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._memo: Dict[Any, Any] = {}
+        self._locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._memo:
+                value = compute()
+                if isinstance(value, np.ndarray):
+                    value.flags.writeable = False
+                self._memo[key] = value
+            return self._memo[key]
+
+    @property
+    def gray(self) -> np.ndarray:
+        if len(self.image.shape) == 2:
+            return self.image
+        return self._get("gray", lambda: cv.cvtColor(self.image, cv.COLOR_BGR2GRAY))
+
+    @property
+    def normalized(self) -> np.ndarray:
+        """float32 image scaled to [0, 1]."""
+        return self._get("normalized", lambda: self.image.astype(np.float32) / 255)
+
+    def jpeg(self, quality: int) -> np.ndarray:
+        """JPEG round-trip of the image at a quality."""
+        return self._get(("jpeg", quality), lambda: compress_jpg(self.image, quality))
+
+    @property
+    def spectrum(self) -> np.ndarray:
+        """Centred 2D FFT of the grayscale image."""
+        return self._get("spectrum", lambda: np.fft.fftshift(np.fft.fft2(self.gray)))
+
+    @property
+    def gradients(self):
+        """(Sobel x, Sobel y) of the grayscale image."""
+        return self._get("gradients", lambda: (
+            cv.Sobel(self.gray, cv.CV_64F, 1, 0, ksize=3),
+            cv.Sobel(self.gray, cv.CV_64F, 0, 1, ksize=3),
+        ))
+
+
+# ============================================================================
+# REPORT TOOLS
+# Each takes (context, params) and returns a dict whose "result" entry is
+# an image array or encoded image bytes; other entries are JSON data.
+# ============================================================================
+
+def _ela(ctx: AnalysisContext, params: dict) -> dict:
+    quality = int(params.pop("quality", 75))
+    return {"result": ela.perform_ela(
+        ctx.image, quality=quality, compressed=ctx.jpeg(quality),
+        normalized=ctx.normalized, **params
+    )}
+
+
+def _ghost(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": ghost_maps.compute_ghost_maps(
+        ctx.image, GhostMapRequest(**params), recompress=ctx.jpeg
+    )}
+
+
+def _quality(ctx: AnalysisContext, params: dict) -> dict:
+    # Recompression errors are memoized per image by quality_sweep
+    with PLOT_LOCK:
+        result = jpeg_quality.compute_jpeg_quality_estimation(ctx.image, gray=ctx.gray)
+    return {"result": result["plot"], "quality": result["quality"]}
+
+
+def _compression(ctx: AnalysisContext, params: dict) -> dict:
+    with PLOT_LOCK:
+        return {"result": jpeg_quality.compute_multiple_compression(ctx.image, gray=ctx.gray)}
+
+
+def _noise(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": noise.perform_noise_separation(ctx.image, **params)}
+
+
+def _prnu(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": noise.compute_prnu(ctx.image, gray=ctx.gray)}
+
+
+def _minmax(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": pixel_analysis.compute_minmax_deviation(ctx.gray)}
+
+
+def _bitplane(ctx: AnalysisContext, params: dict) -> dict:
+    plane = pixel_analysis.get_bit_plane(ctx.gray, int(params.get("bit", 0)))
+    return {"result": cv.cvtColor(plane, cv.COLOR_GRAY2BGR)}
+
+
+def _luminance(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": filters.compute_luminance_gradient(ctx.image, gradients=ctx.gradients)}
+
+
+def _echo(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": filters.apply_echo_edge(ctx.image)}
+
+
+def _frequency(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": transforms.compute_frequency_split(ctx.image, spectrum=ctx.spectrum)}
+
+
+def _wavelet(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": wavelets.compute_wavelet_analysis(ctx.image, **params)}
+
+
+def _histogram(ctx: AnalysisContext, params: dict) -> dict:
+    return {"histograms": histogram.compute_all_histograms(ctx.image)}
+
+
+def _stats(ctx: AnalysisContext, params: dict) -> dict:
+    return {"stats": pixel_analysis.compute_pixel_stats(ctx.image)}
+
+
+def _copymove(ctx: AnalysisContext, params: dict) -> dict:
+    result, stats = cloning.perform_cloning_analysis(ctx.image, **params)
+    return {"result": result, "stats": stats.dict()}
+
+
+def _resampling(ctx: AnalysisContext, params: dict) -> dict:
+    options = ResamplingRequest(**{"upsample": False, **params})
+    return {"result": compute_resampling_analysis(ctx.image, options)}
+
+
+def _illuminant(ctx: AnalysisContext, params: dict) -> dict:
+    return {"result": various.estimate_illuminant_map(ctx.image)}
+
+
+def _dead_hot_pixels(ctx: AnalysisContext, params: dict) -> dict:
+    result, stats = various.detect_dead_hot_pixels(ctx.image, **params)
+    return {"result": result, "stats": stats}
+
+
+REPORT_TOOLS: Dict[str, Callable[[AnalysisContext, dict], dict]] = {
+    "ela": _ela,
+    "ghost": _ghost,
+    "quality": _quality,
+    "compression": _compression,
+    "noise": _noise,
+    "prnu": _prnu,
+    "minmax": _minmax,
+    "bitplane": _bitplane,
+    "luminance": _luminance,
+    "echo": _echo,
+    "frequency": _frequency,
+    "wavelet": _wavelet,
+    "histogram": _histogram,
+    "stats": _stats,
+    "copymove": _copymove,
+    "resampling": _resampling,
+    "illuminant": _illuminant,
+    "dead_hot_pixels": _dead_hot_pixels,
+}
+
+
+def run_report(
+    image: np.ndarray,
+    tools: Optional[Iterable[str]] = None,
+    params: Optional[Dict[str, dict]] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, dict]:
+    """
+    Run the named tools (default: all) against one image.
+
+    Returns a mapping of tool name to its output dict, with the tool's
+    wall time under "elapsed", or {"error": message} if it failed.
+    """
+    names = list(tools) if tools is not None else list(REPORT_TOOLS)
+    unknown = [n for n in names if n not in REPORT_TOOLS]
+    if unknown:
+        raise ValueError(f"Unknown report tools: {', '.join(unknown)}")
+    params = params or {}
+    ctx = AnalysisContext(image)
+
+    def run(name: str) -> dict:
+        start = time.perf_counter()
+        try:
+            output = REPORT_TOOLS[name](ctx, dict(params.get(name, {})))
+        except Exception as e:
+            return {"error": str(e)}
+        output["elapsed"] = round(time.perf_counter() - start, 4)
+        return output
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(names, pool.map(run, names)))
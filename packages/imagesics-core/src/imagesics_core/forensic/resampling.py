@@ -1,14 +1,45 @@
+"""
+Resampling detection with an expectation-maximization (EM) linear
+predictor in the manner of Popescu and Farid.
+
+Every pixel is predicted from its 3x3 (or 5x5) neighbours; pixels that
+the predictor explains well get a high probability in the p-map, and
+interpolated images show up as periodic patterns in the p-map spectrum.
+
+The image is divided into BLOCK x BLOCK blocks, each with its own
+predictor fit over a window of the block and its eight neighbours, so
+windows overlap and the predictor follows local content. The weighted
+normal equations of a block are accumulated from the neighbour products
+of one block row at a time, box-summed over the 3x3 block windows and
+solved for all windows in one batch; block rows are processed on a
+thread pool. No neighbour matrix of the whole image is built, so the
+p-map covers the full image.
+
+Regions of interest (polygons or rectangles) are analysed on their
+bounding boxes only, with pixels outside the polygon given zero weight,
+so the cost follows the selected area; several regions run in parallel.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Tuple, Optional
+
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import io
-from typing import List, Tuple, Optional
 from pydantic import BaseModel
 
+from imagesics_core.utils.render import Panel, render
+
+# Side of the blocks that share a predictor; windows span 3x3 blocks
+BLOCK = 64
+EM_ITERATIONS = 20
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
 class ResamplingRequest(BaseModel):
     filter_5x5: bool = False
-    # ROI points (x,y)
+    # ROI points (x,y): a polygon, or two opposite corners of a rectangle
     selected_points: List[Tuple[int, int]] = [] 
+    # Further ROIs in the same form; every ROI gets its own p-map
+    regions: List[List[Tuple[int, int]]] = []
     
     # Fourier options
     compute_fourier: bool = True
@@ -19,188 +50,303 @@ class ResamplingRequest(BaseModel):
     gamma: float = 4.0
     rescale: bool = True
 
-def build_matrices_for_processing_3x3(I):
-    k = 0
-    rows = I.shape[0] - 2
-    cols = I.shape[1] - 2
-    F = np.zeros((rows * cols, 8))
-    f = np.zeros(rows * cols)
-    
-    # Vectorized approach is much harder for the specific neighbor selection relative to loop
-    # Sticking to loop for correctness port, but optimized slightly might mean just clean python
-    # For performance, this really should be C++ or Numba. 
-    # Python Loop for 3x3 over large image is SLOW.
-    # We will use the original implementation logic but warn about speed.
-    
-    # Use generic sliding window view?
-    # View as windows of 3x3
-    # I_windows = np.lib.stride_tricks.sliding_window_view(I, (3,3))
-    # Shape: (Rows-2, Cols-2, 3, 3)
-    # F columns are: (0,0), (0,1), (0,2), (1,0), (1,2), (2,0), (2,1), (2,2)
-    # f is (1,1)
-    
-    # Let's try to optimize:
-    # TopRow: I[:-2, :-2], I[:-2, 1:-1], I[:-2, 2:]
-    # MidRow: I[1:-1, :-2], [SKIP CENTER], I[1:-1, 2:]
-    # BotRow: I[2:, :-2], I[2:, 1:-1], I[2:, 2:]
-    
-    y_end, x_end = I.shape[0], I.shape[1]
-    
-    fn = []
-    # Row 0 local
-    fn.append(I[0:y_end-2, 0:x_end-2].flatten()) # 0,0
-    fn.append(I[0:y_end-2, 1:x_end-1].flatten()) # 0,1
-    fn.append(I[0:y_end-2, 2:x_end  ].flatten()) # 0,2
-    # Row 1 local
-    fn.append(I[1:y_end-1, 0:x_end-2].flatten()) # 1,0
-    # Center skipped
-    fn.append(I[1:y_end-1, 2:x_end  ].flatten()) # 1,2
-    # Row 2 local
-    fn.append(I[2:y_end  , 0:x_end-2].flatten()) # 2,0
-    fn.append(I[2:y_end  , 1:x_end-1].flatten()) # 2,1
-    fn.append(I[2:y_end  , 2:x_end  ].flatten()) # 2,2
-    
-    F = np.column_stack(fn)
-    f = I[1:y_end-1, 1:x_end-1].flatten()
-    
-    return F, f
+def neighbour_offsets(radius: int) -> List[Tuple[int, int]]:
+    """(dy, dx) of the predictor inputs: the (2r+1)^2 window minus its centre."""
+    side = 2 * radius + 1
+    return [(dy, dx) for dy in range(side) for dx in range(side) if (dy, dx) != (radius, radius)]
 
-def compute_probability_map_3x3(process_part):
-    a = np.random.rand(8)
-    a = a / a.sum()
-    s = 0.005
-    d = 0.1
-    F, f = build_matrices_for_processing_3x3(process_part)
-    
-    w = np.zeros(F.shape[0])
-    
-    # This iterative EM-like algorithm is heavy.
-    # Reduced to 20 iterations for web performance.
-    for c in range(20):  # Reduced from 50 for faster processing
-        # Compute r = |f - F*a|
-        r = np.abs(f - F @ a)
-        
-        # Update w
-        # g = exp(-(r^2)/s)
-        # w = g / (g + d)
-        r2 = r ** 2
-        g = np.exp(-r2 / s)
-        w = g / (g + d)
-        
-        # Update s
-        # s2 = sum(w * r^2)
-        s2 = np.sum(w * r2)
-        s = s2 / w.sum()
-        if s < 1e-9: s = 1e-9
-        
-        # Update a
-        # a2 = inv(F.T @ W @ F) @ F.T @ W @ f
-        # Where W is diag(w*w) ? Original: F.T * w * w @ F
-        # Original: np.linalg.inv(F.T * w * w @ F) @ F.T * w * w @ f
-        # Note: w*w is element wise square of weights?
-        # Yes, original code: w * w.
-        
-        # Weighted Least Squares
-        # F_weighted = F * w[:, None]
-        # f_weighted = f * w
-        # But wait, original code is `F.T * w * w @ F`. This implies weighting by w^2?
-        # Let's trust original code structure.
-        w2 = w * w
-        # Broadcasting w2 to rows for F.T mult?
-        # F.T is (8, N). w is (N,). F.T * w -> (8, N) * (N,) -> works in numpy?
-        # Numpy broadcasting: (8, N) * (N,) -> Matches last dim. Yes.
-        
-        FT_W2 = F.T * w2
-        LHS = FT_W2 @ F
-        RHS = FT_W2 @ f
-        
-        try:
-            a2 = np.linalg.solve(LHS, RHS)
-        except np.linalg.LinAlgError:
-            break
-            
-        if np.linalg.norm(a - a2) < 0.01:
-            a = a2
-            break
-        a = a2
-        
-    return w.reshape(process_part.shape[0] - 2, process_part.shape[1] - 2)
+def _box3(values: np.ndarray) -> np.ndarray:
+    """Sum over each block's 3x3 block neighbourhood (zero outside)."""
+    ky, kx = values.shape[:2]
+    padded = np.pad(values, ((1, 1), (1, 1)) + ((0, 0),) * (values.ndim - 2))
+    total = np.zeros_like(values)
+    for dy in range(3):
+        for dx in range(3):
+            total += padded[dy:dy + ky, dx:dx + kx]
+    return total
 
-def compute_resampling_analysis(image: np.ndarray, params: ResamplingRequest) -> bytes:
+class _BlockRows:
     """
-    Perform probability map and fourier analysis. Returns plotted result image.
+    Predictor inputs of a padded image, one block row at a time.
+
+    rows(y, cols) returns the neighbours (len(cols), n, BLOCK^2), centres
+    and valid mask (len(cols), BLOCK^2) of the given blocks of block row
+    y, laid out block by block.
     """
+
+    def __init__(self, gray: np.ndarray, radius: int, mask: Optional[np.ndarray] = None):
+        self.radius = radius
+        self.height, self.width = gray.shape[0] - 2 * radius, gray.shape[1] - 2 * radius
+        self.ky = -(-self.height // BLOCK)
+        self.kx = -(-self.width // BLOCK)
+        # Pad the interior to whole blocks; padded pixels get zero weight
+        self.gray = np.pad(gray, ((0, self.ky * BLOCK - self.height), (0, self.kx * BLOCK - self.width)),
+                           mode="edge")
+        self.offsets = neighbour_offsets(radius)
+        self.valid = np.zeros((self.ky * BLOCK, self.kx * BLOCK), dtype=np.float32)
+        self.valid[:self.height, :self.width] = 1 if mask is None else mask
+
+    def _blocks(self, rows: np.ndarray) -> np.ndarray:
+        # (BLOCK, kx * BLOCK) -> (kx, BLOCK, BLOCK)
+        return rows.reshape(BLOCK, self.kx, BLOCK).transpose(1, 0, 2)
+
+    def rows(self, y: int, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        y0, width = y * BLOCK, self.kx * BLOCK
+        neighbours = np.empty((len(cols), len(self.offsets), BLOCK, BLOCK), dtype=np.float32)
+        for k, (dy, dx) in enumerate(self.offsets):
+            neighbours[:, k] = self._blocks(self.gray[y0 + dy:y0 + dy + BLOCK, dx:dx + width])[cols]
+        r = self.radius
+        centre = self._blocks(self.gray[y0 + r:y0 + r + BLOCK, r:r + width])[cols].reshape(len(cols), -1)
+        valid = self._blocks(self.valid[y0:y0 + BLOCK])[cols].reshape(len(cols), -1)
+        return neighbours.reshape(len(cols), len(self.offsets), -1), centre, valid
+
+    def unblock(self, values: np.ndarray) -> np.ndarray:
+        """(ky, kx, BLOCK^2) block values -> interior-sized map."""
+        image = values.reshape(self.ky, self.kx, BLOCK, BLOCK).transpose(0, 2, 1, 3)
+        return image.reshape(self.ky * BLOCK, self.kx * BLOCK)[:self.height, :self.width]
+
+def _em_step(inputs: _BlockRows, y: int, cols: np.ndarray, a: np.ndarray, s: np.ndarray, d: float):
+    """
+    Weights of the given blocks of block row y under their predictors,
+    and the block sums of the weighted normal equations and of the
+    variance update.
+    """
+    neighbours, centre, valid = inputs.rows(y, cols)
+    r2 = centre - np.matmul(a[:, None, :], neighbours)[:, 0]
+    r2 *= r2
+    g = np.exp(r2 * (-1 / s)[:, None])
+    w = g / (g + d)
+    w *= valid
+    weighted = neighbours * (w * w)[:, None, :]
+    lhs = np.matmul(weighted, neighbours.transpose(0, 2, 1))
+    rhs = np.matmul(weighted, centre[:, :, None])[:, :, 0]
+    return w, lhs, rhs, w.sum(axis=1), (w * r2).sum(axis=1)
+
+def compute_probability_map(
+    gray: np.ndarray,
+    radius: int = 1,
+    progress: Optional[Callable[[float], None]] = None,
+    max_workers: Optional[int] = None,
+    mask: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    EM p-map of a grayscale image scaled to [0, 1].
+
+    Args:
+        gray: 2-D float image in [0, 1].
+        radius: 1 predicts from the 3x3 neighbourhood, 2 from the 5x5.
+        progress: Called with the fraction of EM iterations done.
+        max_workers: Threads processing block rows (default DEFAULT_WORKERS).
+        mask: Interior-sized map of the pixels to analyse; the others
+            are left out of the fits and get probability 0.
+
+    Returns:
+        Probability map of the interior, (h - 2r, w - 2r) float32.
+    """
+    inputs = _BlockRows(np.asarray(gray, dtype=np.float32), radius, mask)
+    ky, kx, n = inputs.ky, inputs.kx, len(inputs.offsets)
+    a = np.full((ky, kx, n), 1.0 / n, dtype=np.float32)
+    s = np.full((ky, kx), 0.005, dtype=np.float32)
+    d = 0.1
+    weights = np.zeros((ky, kx, BLOCK * BLOCK), dtype=np.float32)
+    lhs = np.zeros((ky, kx, n, n), dtype=np.float32)
+    rhs = np.zeros((ky, kx, n), dtype=np.float32)
+    sum_w = np.zeros((ky, kx), dtype=np.float32)
+    sum_wr2 = np.zeros((ky, kx), dtype=np.float32)
+    active = np.ones((ky, kx), dtype=bool)
+
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_WORKERS) as pool:
+        for c in range(EM_ITERATIONS):
+            if progress is not None:
+                progress(c / EM_ITERATIONS)
+            # A converged block keeps its predictor and variance, so its
+            # weights and sums stay as they were; only active blocks are redone
+            todo = [(y, np.flatnonzero(active[y])) for y in range(ky) if active[y].any()]
+            steps = pool.map(lambda job: _em_step(inputs, *job, a[job], s[job], d), todo)
+            for job, (w, block_lhs, block_rhs, block_w, block_wr2) in zip(todo, steps):
+                weights[job], lhs[job], rhs[job] = w, block_lhs, block_rhs
+                sum_w[job], sum_wr2[job] = block_w, block_wr2
+
+            # Window sums over each block and its neighbours
+            s2 = _box3(sum_wr2) / np.maximum(_box3(sum_w), 1e-12)
+            s = np.where(active, np.maximum(s2, 1e-9), s).astype(np.float32)
+            system, target = _box3(lhs).astype(np.float64), _box3(rhs).astype(np.float64)
+            # Flat windows give singular systems; a tiny ridge keeps them solvable
+            ridge = 1e-9 * np.trace(system, axis1=-2, axis2=-1) + 1e-12
+            system += ridge[..., None, None] * np.eye(n)
+            a2 = np.linalg.solve(system, target[..., None])[..., 0].astype(np.float32)
+
+            # Windows stop updating once their predictor has converged
+            moved = np.linalg.norm(a - a2, axis=-1) >= 0.01
+            a = np.where(active[..., None], a2, a)
+            active &= moved
+            if not active.any():
+                break
+
+    return inputs.unblock(weights)
+
+def _gray(image: np.ndarray) -> np.ndarray:
     # Grayscale
     if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+def _normalize(gray: np.ndarray, low: float, high: float) -> np.ndarray:
+    # Normalize 0-1
+    return (gray - low) / (high - low + 1e-5)
+
+def _spectrum(prob_map: np.ndarray, params: ResamplingRequest) -> Optional[np.ndarray]:
+    """Normalized Fourier magnitude of a p-map, or None if not requested."""
+    if not params.compute_fourier:
+        return None
+    # Hanning
+    if params.hanning:
+         hanning_window = np.hanning(prob_map.shape[0])[:, None] * np.hanning(prob_map.shape[1])
+         windowed = (prob_map * hanning_window).astype(np.float32)
     else:
-        gray = image
+         windowed = prob_map
+         
+    if params.upsample:
+        upsampled = cv2.pyrUp(windowed)
+    else:
+        upsampled = windowed
         
-    # Normalize 0-1
-    gray = (gray - gray.min()) / (gray.max() - gray.min() + 1e-5)
+    # cv2.dft in float32 is several times faster than np.fft on
+    # full-resolution maps
+    dft = cv2.dft(np.ascontiguousarray(upsampled, dtype=np.float32), flags=cv2.DFT_COMPLEX_OUTPUT)
+    magnitude = np.fft.fftshift(cv2.magnitude(dft[:, :, 0], dft[:, :, 1]))
     
-    # Region selection not implemented in backend-only for now, 
-    # we assume full image if no points, or backend handles cropping if points provided?
-    # For simplification, we process the whole image or the center crop if too large.
-    # To avoid timeout: if > 1000px, crop center 512x512?
-    
-    start_y, start_x = 0, 0
-    h, w = gray.shape
-    if h > 512 or w > 512:
-        # Crop to center 512x512 for faster processing
-        cy, cx = h // 2, w // 2
-        gray = gray[max(0, cy-256):min(h, cy+256), max(0, cx-256):min(w, cx+256)]
+    # Highpass?
+    if params.highpass_1:
+        rh, rw = magnitude.shape
+        cy, cx = rh // 2, rw // 2
+        rad = int(0.1 * min(rh, rw) / 2)
+        Y, X = np.ogrid[-rad:rad + 1, -rad:rad + 1]
+        disc = magnitude[cy - rad:cy + rad + 1, cx - rad:cx + rad + 1]
+        disc[X ** 2 + Y ** 2 <= rad ** 2] = 0
+        
+    # Gamma
+    # Scale 0-1
+    magnitude = (magnitude - magnitude.min()) / (magnitude.max() - magnitude.min() + 1e-9)
+    return np.power(magnitude, params.gamma)
+
+def resampling_maps(
+    image: np.ndarray,
+    params: ResamplingRequest,
+    progress: Optional[Callable[[float], None]] = None
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Raw resampling maps: the probability map (p-map) and, when
+    params.compute_fourier is set, the normalized magnitude of its
+    Fourier spectrum (None otherwise).
+    """
+    gray = _gray(image)
+    gray = _normalize(gray, gray.min(), gray.max())
     
     # Probability MAP
-    prob_map = compute_probability_map_3x3(gray)
-    
-    # Fourier
-    if params.compute_fourier:
-        # Hanning
-        if params.hanning:
-             hanning_window = np.hanning(prob_map.shape[0])[:, None] * np.hanning(prob_map.shape[1])
-             windowed = prob_map * hanning_window
-        else:
-             windowed = prob_map
-             
-        if params.upsample:
-            upsampled = cv2.pyrUp(windowed)
-        else:
-            upsampled = windowed
-            
-        dft = np.fft.fft2(upsampled)
-        fourier = np.fft.fftshift(dft)
-        
-        # Highpass?
-        if params.highpass_1:
-            rh, rw = fourier.shape
-            cy, cx = rh // 2, rw // 2
-            rad = int(0.1 * min(rh, rw) / 2)
-            Y, X = np.ogrid[:rh, :rw]
-            mask = (X - cx)**2 + (Y - cy)**2 <= rad**2
-            fourier[mask] = 0
-            
-        magnitude = np.abs(fourier)
-        # Gamma
-        # Scale 0-1
-        magnitude = (magnitude - magnitude.min()) / (magnitude.max() - magnitude.min() + 1e-9)
-        magnitude = np.power(magnitude, params.gamma)
+    prob_map = compute_probability_map(gray, 2 if params.filter_5x5 else 1, progress)
+    return prob_map, _spectrum(prob_map, params)
+
+class RegionMaps:
+    """
+    Resampling maps of one region of interest.
+
+    Attributes:
+        points: The region's polygon or rectangle corners, (x, y).
+        bbox: (x0, y0, x1, y1) image area covered by the p-map, x1 and
+            y1 exclusive.
+        p_map: Probability map of the bounding box; 0 outside the polygon.
+        magnitude: Normalized Fourier magnitude of p_map, or None.
+    """
+
+    def __init__(self, points: List[Tuple[int, int]], bbox: Tuple[int, int, int, int],
+                 p_map: np.ndarray, magnitude: Optional[np.ndarray]):
+        self.points = points
+        self.bbox = bbox
+        self.p_map = p_map
+        self.magnitude = magnitude
+
+def regions_of(params: ResamplingRequest) -> List[List[Tuple[int, int]]]:
+    """The ROIs of a request: selected_points first, then regions."""
+    regions = [params.selected_points] if params.selected_points else []
+    return regions + [points for points in params.regions if points]
+
+def _region_maps(gray: np.ndarray, value_range: Tuple[float, float], points: List[Tuple[int, int]],
+                 number: int, params: ResamplingRequest) -> RegionMaps:
+    """Maps of one ROI of a grayscale image with the given min and max."""
+    radius = 2 if params.filter_5x5 else 1
+    if len(points) < 2:
+        raise ValueError(f"Region {number} needs a polygon or two rectangle corners")
+    corners = np.array(points, dtype=np.int32)
+    h, w = gray.shape
+    # Bounding box of the p-map, widened by the predictor radius for the crop
+    x0, y0 = np.maximum(corners.min(axis=0), radius)
+    x1, y1 = np.minimum(corners.max(axis=0) + 1, (w - radius, h - radius))
+    if x1 - x0 < 1 or y1 - y0 < 1:
+        raise ValueError(f"Region {number} is outside the image or too small")
+
+    # Scaled like the whole image so ROI and full-image p-maps agree
+    crop = _normalize(gray[y0 - radius:y1 + radius, x0 - radius:x1 + radius], *value_range)
+    mask = None
+    if len(points) > 2:
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [corners - (x0, y0)], 1)
+    p_map = compute_probability_map(crop, radius, max_workers=1, mask=mask)
+    return RegionMaps(points, (int(x0), int(y0), int(x1), int(y1)), p_map, _spectrum(p_map, params))
+
+def resampling_region_maps(
+    image: np.ndarray,
+    params: ResamplingRequest,
+    progress: Optional[Callable[[float], None]] = None,
+    max_workers: Optional[int] = None
+) -> List[RegionMaps]:
+    """
+    Resampling maps of every ROI of the request, computed in parallel.
+
+    Only each ROI's bounding box is processed; polygons mask the pixels
+    outside them. Raises ValueError for degenerate or out-of-image ROIs.
+    """
+    regions = regions_of(params)
+    gray = _gray(image)
+    value_range = (float(gray.min()), float(gray.max()))
+    results: List[Optional[RegionMaps]] = [None] * len(regions)
+    with ThreadPoolExecutor(max_workers=max_workers or DEFAULT_WORKERS) as pool:
+        futures = {pool.submit(_region_maps, gray, value_range, points, n + 1, params): n
+                   for n, points in enumerate(regions)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(done / len(regions))
+    return results
+
+def compute_resampling_analysis(
+    image: np.ndarray,
+    params: ResamplingRequest,
+    progress: Optional[Callable[[float], None]] = None,
+    maps: Optional[Tuple[np.ndarray, Optional[np.ndarray]]] = None,
+    regions: Optional[List[RegionMaps]] = None
+) -> bytes:
+    """
+    Perform probability map and fourier analysis. Returns plotted result image.
+    With ROIs in params, only they are analysed, one row of panels each.
+    maps: precomputed resampling_maps() of the image.
+    regions: precomputed resampling_region_maps() of the image.
+    """
+    if regions is None and regions_of(params):
+        regions = resampling_region_maps(image, params, progress)
+    if regions is not None:
+        panels = []
+        for n, roi in enumerate(regions, 1):
+            x0, y0, x1, y1 = roi.bbox
+            panels.append(Panel(roi.p_map, f"ROI {n} p-map\n({x0}, {y0}) - ({x1}, {y1})", vmin=0, vmax=1))
+            if roi.magnitude is not None:
+                panels.append(Panel(roi.magnitude, f"ROI {n} Fourier of p-map", vmin=0, vmax=1))
+        return render(panels, cols=2 if params.compute_fourier else None)
+
+    prob_map, magnitude = resampling_maps(image, params, progress) if maps is None else maps
     
     # Plot
-    fig = plt.figure(figsize=(10, 5))
-    ax1 = plt.subplot(1, 2, 1)
-    ax1.imshow(prob_map, cmap="gray", vmin=0, vmax=1)
-    ax1.set_title("Probability Map (p-map)")
-    ax1.axis("off")
-    
-    if params.compute_fourier:
-        ax2 = plt.subplot(1, 2, 2)
-        ax2.imshow(magnitude, cmap="gray", vmin=0, vmax=1)
-        ax2.set_title("Fourier of p-map")
-        ax2.axis("off")
-        
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150)
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    panels = [Panel(prob_map, "Probability Map (p-map)", vmin=0, vmax=1)]
+    if magnitude is not None:
+        panels.append(Panel(magnitude, "Fourier of p-map", vmin=0, vmax=1))
+    return render(panels)
@@ -1,20 +1,33 @@
+"""
+Autostereogram decoding.
+
+A stereogram repeats its pattern horizontally with a period that varies
+with the hidden depth. detect_offset() finds the dominant period of the
+whole image; row_periods() finds the best period of every row at once
+from FFT autocorrelations, and depth_map() compares each pixel with its
+partner one period away.
+"""
 import cv2
 import numpy as np
+from typing import Optional, Tuple
 
-def compute_stereogram(image: np.ndarray, mode: str = 'pattern') -> bytes:
+from imagesics_core.utils.render import Panel, render
+
+# Period search range of row_periods() (the upper bound is also capped
+# at a quarter of the width unless detect_offset() finds a longer period)
+MIN_SHIFT = 10
+MAX_SHIFT = 100
+# Working memory of one block of rows in row_periods()
+CHUNK_BYTES = 64 << 20
+
+def detect_offset(gray: np.ndarray, start: int = MIN_SHIFT) -> Optional[int]:
     """
-    Detects stereogram hidden depth/pattern.
-    Modes: pattern, silhouette, depth, shaded
+    Dominant horizontal repetition period of a grayscale stereogram, or
+    None if there is no clear one.
     """
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-        
-    # Auto-detect offset using correlation
-    small = cv2.resize(gray, (0,0), fx=0.5, fy=1.0) 
+    # Halve the height only, so the offset is valid for the full image
+    small = cv2.resize(gray, (0, 0), fx=1.0, fy=0.5)
     # Logic from sherloq: check mean diff for shifts
-    start = 10
     end = small.shape[1] // 3
     
     diffs = []
@@ -22,23 +35,142 @@ def compute_stereogram(image: np.ndarray, mode: str = 'pattern') -> bytes:
         # Shift and diff
         d = cv2.absdiff(small[:, i:], small[:, :-i])
         diffs.append(cv2.mean(d)[0])
+    if len(diffs) < 2:
+        return None
         
     diffs = np.array(diffs, dtype=np.float32)
     
-    # 2nd derivative to find peak change? Sherloq used ediff1d and minmax
+    # The difference drops sharply at the period
     ediff = np.ediff1d(diffs)
     _, maximum, _, argmax = cv2.minMaxLoc(ediff)
     
     if maximum < 2:
+        return None
+    return argmax[1] + start
+
+def row_periods(
+    gray: np.ndarray,
+    min_shift: int = MIN_SHIFT,
+    max_shift: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best repetition period of every row.
+    
+    For each row and each shift in [min_shift, max_shift), the Pearson
+    correlation of the row with itself shifted is computed from an FFT
+    autocorrelation (the cross terms) and prefix sums (the means and
+    variances of the overlapping parts), for a block of rows at a time.
+    
+    Returns:
+        (shift per row, its correlation): shift is 0 for rows without a
+        positively correlated shift.
+    """
+    h, w = gray.shape
+    if max_shift is None:
+        max_shift = min(w // 4, MAX_SHIFT)
+    shifts = np.arange(min_shift, min(max_shift, w))
+    best = np.zeros(h, dtype=np.int32)
+    best_corr = np.zeros(h, dtype=np.float32)
+    if len(shifts) == 0:
+        return best, best_corr
+    
+    # Zero padding to >= 2w makes the circular correlation linear
+    n_fft = cv2.getOptimalDFTSize(2 * w)
+    block = max(1, CHUNK_BYTES // (n_fft * 32))
+    n = (w - shifts).astype(np.float64)
+    
+    for y0 in range(0, h, block):
+        rows = gray[y0:y0 + block].astype(np.float64)
+        rows -= rows.mean(axis=1, keepdims=True)
+        spectrum = np.fft.rfft(rows, n_fft, axis=1)
+        cross = np.fft.irfft(spectrum * spectrum.conj(), n_fft, axis=1)[:, shifts]
+        
+        zero = np.zeros((len(rows), 1))
+        c1 = np.hstack([zero, np.cumsum(rows, axis=1)])
+        c2 = np.hstack([zero, np.cumsum(rows * rows, axis=1)])
+        # Sums over row[:w - s] and row[s:]
+        sum_a, sum_b = c1[:, w - shifts], c1[:, w:] - c1[:, shifts]
+        sq_a, sq_b = c2[:, w - shifts], c2[:, w:] - c2[:, shifts]
+        
+        cov = cross - sum_a * sum_b / n
+        var = (sq_a - sum_a * sum_a / n) * (sq_b - sum_b * sum_b / n)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.sqrt(var)
+        # Constant parts have no defined correlation
+        corr[var <= 1e-9] = -np.inf
+        
+        index = np.argmax(corr, axis=1)
+        peak = corr[np.arange(len(rows)), index]
+        found = peak > 0
+        best[y0:y0 + len(rows)] = np.where(found, shifts[index], 0)
+        best_corr[y0:y0 + len(rows)] = np.where(found, peak, 0)
+    return best, best_corr
+
+def depth_map(gray: np.ndarray, shifts: np.ndarray) -> np.ndarray:
+    """
+    Absolute difference (float32) between each pixel and the pixel one
+    row period to its right; 0 where there is no partner.
+    """
+    h, w = gray.shape
+    partner = np.arange(w, dtype=np.int32)[None, :] + shifts.astype(np.int32)[:, None]
+    valid = (partner < w) & (shifts[:, None] > 0)
+    values = np.take_along_axis(gray, np.minimum(partner, w - 1), axis=1)
+    depth = cv2.absdiff(gray, values).astype(np.float32)
+    depth[~valid] = 0
+    return depth
+
+def decode_stereogram(image: np.ndarray) -> bytes:
+    """
+    Decode autostereogram to reveal hidden 3D image.
+    
+    Args:
+        image: Input stereogram image
+    
+    Returns:
+        Bytes of the original next to the decoded depth map
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    w = gray.shape[1]
+    
+    # Search past the default range when the image repeats more slowly
+    max_shift = min(w // 4, MAX_SHIFT)
+    offset = detect_offset(gray)
+    if offset is not None:
+        max_shift = min(w // 2, max(max_shift, offset + offset // 4 + 1))
+    
+    shifts, _ = row_periods(gray, MIN_SHIFT, max_shift)
+    depth = depth_map(gray, shifts)
+    
+    # Normalize depth map
+    if depth.max() > 0:
+        depth = (depth / depth.max() * 255).astype(np.uint8)
+    else:
+        depth = depth.astype(np.uint8)
+    
+    # Apply colormap for better visualization
+    depth_colored = cv2.applyColorMap(depth, cv2.COLORMAP_JET)
+    
+    return render([
+        Panel(image, 'Original Stereogram'),
+        Panel(depth_colored, 'Decoded Depth Map'),
+    ])
+
+def compute_stereogram(image: np.ndarray, mode: str = 'pattern') -> bytes:
+    """
+    Detects stereogram hidden depth/pattern.
+    Modes: pattern, silhouette, depth, shaded
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+        
+    # Auto-detect offset using correlation
+    offset = detect_offset(gray)
+    if offset is None:
         # Failed to detect
-        # Return error image or original?
         return b""
         
-    offset = argmax[1] + start
-    # Apply to original (width is 2x small, but offset on small needs double? No, resize was (1, 0.5) => Wait.
-    # cv.resize(gray, None, None, 1, 0.5) -> fx=1, fy=0.5. So width is SAME. Height is half.
-    # So offset is valid for X.
-    
     a = image[:, offset:]
     b = image[:, :-offset]
     
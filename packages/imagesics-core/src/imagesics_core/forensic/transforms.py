@@ -1,8 +1,8 @@
 import cv2
 import numpy as np
+from typing import Optional
 from sklearn.decomposition import PCA
 import io
-import matplotlib.pyplot as plt
 
 def get_channel(image: np.ndarray, space: str, channel: int) -> np.ndarray:
     """
@@ -63,17 +63,20 @@ def compute_pca(image: np.ndarray) -> bytes:
     _, enc = cv2.imencode(".jpg", pca_img)
     return enc.tobytes()
 
-def compute_frequency_split(image: np.ndarray) -> bytes:
+def compute_frequency_split(image: np.ndarray, spectrum: Optional[np.ndarray] = None) -> bytes:
     """
     Visualize FFT magnitude.
+    spectrum: precomputed fftshift(fft2(gray)) of the image.
     """
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
+    if spectrum is None:
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image
         
-    f = np.fft.fft2(gray)
-    fshift = np.fft.fftshift(f)
+        f = np.fft.fft2(gray)
+        spectrum = np.fft.fftshift(f)
+    fshift = spectrum
     magnitude_spectrum = 20 * np.log(np.abs(fshift) + 1)
     
     # Normalize
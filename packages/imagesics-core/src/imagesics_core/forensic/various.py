@@ -3,10 +3,11 @@ Various forensic analysis tools.
 """
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import io
 from typing import Tuple, Dict
 
+from imagesics_core.forensic import stereogram
+from imagesics_core.utils.render import Panel, render
+
 def apply_median_filter(image: np.ndarray, kernel_size: int = 5) -> bytes:
     """
     Apply median filtering for noise reduction.
@@ -26,31 +27,10 @@ def apply_median_filter(image: np.ndarray, kernel_size: int = 5) -> bytes:
     filtered = cv2.medianBlur(image, kernel_size)
     
     # Create side-by-side comparison
-    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
-    
-    # Original
-    if len(image.shape) == 3:
-        axes[0].imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    else:
-        axes[0].imshow(image, cmap='gray')
-    axes[0].set_title(f'Original Image')
-    axes[0].axis('off')
-    
-    # Filtered
-    if len(filtered.shape) == 3:
-        axes[1].imshow(cv2.cvtColor(filtered, cv2.COLOR_BGR2RGB))
-    else:
-        axes[1].imshow(filtered, cmap='gray')
-    axes[1].set_title(f'Median Filtered (kernel={kernel_size})')
-    axes[1].axis('off')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150, bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return render([
+        Panel(image, 'Original Image'),
+        Panel(filtered, f'Median Filtered (kernel={kernel_size})'),
+    ])
 
 
 def estimate_illuminant_map(image: np.ndarray) -> bytes:
@@ -90,41 +70,19 @@ def estimate_illuminant_map(image: np.ndarray) -> bytes:
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     illumination = cv2.GaussianBlur(gray, (51, 51), 0)
     
-    # Visualization
-    fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-    
-    # Original
-    axes[0, 0].imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    axes[0, 0].set_title('Original Image')
-    axes[0, 0].axis('off')
-    
-    # White balanced
-    axes[0, 1].imshow(cv2.cvtColor((balanced * 255).astype(np.uint8), cv2.COLOR_BGR2RGB))
-    axes[0, 1].set_title('White Balanced')
-    axes[0, 1].axis('off')
-    
-    # Illumination map
-    im = axes[1, 0].imshow(illumination, cmap='hot')
-    axes[1, 0].set_title('Illumination Map')
-    axes[1, 0].axis('off')
-    plt.colorbar(im, ax=axes[1, 0])
-    
     # Illuminant color
     illuminant_color = np.ones((100, 100, 3), dtype=np.uint8)
     illuminant_color[:, :, 0] = int(avg_b * 255)
     illuminant_color[:, :, 1] = int(avg_g * 255)
     illuminant_color[:, :, 2] = int(avg_r * 255)
-    axes[1, 1].imshow(cv2.cvtColor(illuminant_color, cv2.COLOR_BGR2RGB))
-    axes[1, 1].set_title(f'Estimated Illuminant\nRGB: ({int(avg_r*255)}, {int(avg_g*255)}, {int(avg_b*255)})')
-    axes[1, 1].axis('off')
     
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150, bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    # Visualization
+    return render([
+        Panel(image, 'Original Image'),
+        Panel((balanced * 255).astype(np.uint8), 'White Balanced'),
+        Panel(illumination, 'Illumination Map', colormap=cv2.COLORMAP_HOT, colorbar=True),
+        Panel(illuminant_color, f'Estimated Illuminant\nRGB: ({int(avg_r*255)}, {int(avg_g*255)}, {int(avg_b*255)})'),
+    ], cols=2)
 
 
 def detect_dead_hot_pixels(image: np.ndarray, threshold: float = 50.0) -> Tuple[bytes, Dict]:
@@ -164,28 +122,11 @@ def detect_dead_hot_pixels(image: np.ndarray, threshold: float = 50.0) -> Tuple[
     # Mark hot pixels in red
     result[hot_mask] = [0, 0, 255]  # Red
     
-    # Create figure
-    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
-    
-    # Original
-    if len(image.shape) == 3:
-        axes[0].imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    else:
-        axes[0].imshow(image, cmap='gray')
-    axes[0].set_title('Original Image')
-    axes[0].axis('off')
-    
-    # Marked
-    axes[1].imshow(cv2.cvtColor(result, cv2.COLOR_BGR2RGB))
-    axes[1].set_title(f'Dead/Hot Pixels Detected\nDead: {dead_count} (blue) | Hot: {hot_count} (red)')
-    axes[1].axis('off')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150, bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
+    # Create visualization
+    visualization = render([
+        Panel(image, 'Original Image'),
+        Panel(result, f'Dead/Hot Pixels Detected\nDead: {dead_count} (blue) | Hot: {hot_count} (red)'),
+    ])
     
     stats = {
         "dead_pixels": int(dead_count),
@@ -195,7 +136,7 @@ def detect_dead_hot_pixels(image: np.ndarray, threshold: float = 50.0) -> Tuple[
         "hot_percentage": float(hot_count / total_pixels * 100)
     }
     
-    return buf.getvalue(), stats
+    return visualization, stats
 
 
 def decode_stereogram(image: np.ndarray) -> bytes:
@@ -208,72 +149,4 @@ def decode_stereogram(image: np.ndarray) -> bytes:
     Returns:
         Bytes of decoded depth map
     """
-    # Convert to grayscale
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-    
-    h, w = gray.shape
-    
-    # Try to detect repeating pattern
-    # Use autocorrelation to find pattern width
-    depth_map = np.zeros_like(gray, dtype=np.float32)
-    
-    # Simple pattern detection: look for horizontal repetition
-    for y in range(h):
-        row = gray[y, :]
-        
-        # Try different shift amounts
-        best_shift = 0
-        best_correlation = 0
-        
-        for shift in range(10, min(w // 4, 100)):
-            if w - shift < shift:
-                break
-            
-            # Compute correlation
-            corr = np.corrcoef(row[:-shift], row[shift:])[0, 1]
-            
-            if not np.isnan(corr) and corr > best_correlation:
-                best_correlation = corr
-                best_shift = shift
-        
-        # Create depth map based on shift
-        if best_shift > 0:
-            for x in range(w - best_shift):
-                diff = abs(int(row[x]) - int(row[x + best_shift]))
-                depth_map[y, x] = diff
-    
-    # Normalize depth map
-    if depth_map.max() > 0:
-        depth_map = (depth_map / depth_map.max() * 255).astype(np.uint8)
-    else:
-        depth_map = depth_map.astype(np.uint8)
-    
-    # Apply colormap for better visualization
-    depth_colored = cv2.applyColorMap(depth_map, cv2.COLORMAP_JET)
-    
-    # Create visualization
-    fig, axes = plt.subplots(1, 2, figsize=(14, 6))
-    
-    # Original stereogram
-    if len(image.shape) == 3:
-        axes[0].imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    else:
-        axes[0].imshow(image, cmap='gray')
-    axes[0].set_title('Original Stereogram')
-    axes[0].axis('off')
-    
-    # Decoded depth map
-    axes[1].imshow(cv2.cvtColor(depth_colored, cv2.COLOR_BGR2RGB))
-    axes[1].set_title('Decoded Depth Map')
-    axes[1].axis('off')
-    
-    plt.tight_layout()
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='jpg', dpi=150, bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return buf.getvalue()
+    return stereogram.decode_stereogram(image)
@@ -2,7 +2,6 @@ import cv2
 import numpy as np
 import pywt
 import io
-import matplotlib.pyplot as plt
 
 def compute_wavelet_analysis(image: np.ndarray, wavelet: str = 'db1', mode: str = 'periodization') -> bytes:
     """
@@ -0,0 +1,238 @@
+"""
+Pool of long-lived ExifTool processes.
+
+Starting ExifTool costs a Perl interpreter launch per call. The workers
+here run ``exiftool -stay_open`` through the vendored PyExifTool and are
+reused across requests. Each worker serves one caller at a time; a
+worker that crashes or produces no output for the timeout is killed
+and restarted on its next use.
+"""
+import atexit
+import importlib.util
+import itertools
+import json
+import os
+import queue
+import select
+import subprocess
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from imagesics_core.config.paths import THIRD_PARTY_DIR, get_exiftool_path
+
+DEFAULT_WORKERS = int(os.environ.get("IMAGESICS_EXIFTOOL_WORKERS", 2))
+DEFAULT_TIMEOUT = float(os.environ.get("IMAGESICS_EXIFTOOL_TIMEOUT", 10))
+
+_pyexiftool = None
+
+
+def _load_pyexiftool():
+    """Import the vendored PyExifTool module from the third party directory."""
+    global _pyexiftool
+    if _pyexiftool is None:
+        path = Path(THIRD_PARTY_DIR) / "pyexiftool" / "exiftool.py"
+        spec = importlib.util.spec_from_file_location("pyexiftool", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _pyexiftool = module
+    return _pyexiftool
+
+
+class ExifToolError(RuntimeError):
+    """The ExifTool process failed, exited or timed out."""
+
+
+def _worker_class():
+    base = _load_pyexiftool().ExifTool
+
+    class Worker(base):
+        """
+        PyExifTool instance without common arguments and with a read timeout.
+
+        Each command ends with a numbered -execute, so the end of its output
+        is recognised even in binary (-b) output. The timeout bounds the
+        wait for each piece of output, so long batches do not expire while
+        ExifTool is still producing results.
+        """
+
+        _counter = itertools.count(1)
+        timeout = DEFAULT_TIMEOUT
+
+        def start(self):
+            if self.running:
+                return
+            self._process = subprocess.Popen(
+                [self.executable, "-stay_open", "True", "-@", "-"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            self.running = True
+
+        def kill(self):
+            if not self.running:
+                return
+            self._process.kill()
+            self._process.wait()
+            del self._process
+            self.running = False
+
+        def terminate(self):
+            try:
+                super().terminate()
+            except (OSError, ValueError):
+                self.kill()
+
+        def execute(self, *params, timeout: Optional[float] = None):
+            timeout = timeout or self.timeout
+            if not self.running:
+                raise ValueError("ExifTool instance not running.")
+            number = next(self._counter)
+            sentinel = b"{ready%d}" % number
+            try:
+                self._process.stdin.write(b"\n".join(params + (b"-execute%d\n" % number,)))
+                self._process.stdin.flush()
+            except OSError as e:
+                raise ExifToolError(f"ExifTool exited: {e}")
+
+            fd = self._process.stdout.fileno()
+            chunks = []
+            tail = b""
+            while not tail.rstrip().endswith(sentinel):
+                if not select.select([fd], [], [], timeout)[0]:
+                    raise ExifToolError(f"ExifTool timed out after {timeout}s")
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise ExifToolError("ExifTool exited")
+                chunks.append(chunk)
+                tail = (tail + chunk)[-64:]
+            output = b"".join(chunks).rstrip()
+            return output[: -len(sentinel)]
+
+    return Worker
+
+
+class ExifToolPool:
+    """
+    Thread-safe pool of ExifTool workers.
+
+    Workers are started on demand, up to `size` at a time; callers beyond
+    that wait for a free worker.
+
+    Args:
+        executable: Path of the exiftool script.
+        size: Maximum number of processes.
+        timeout: Seconds to wait for a worker and for each command.
+    """
+
+    def __init__(self, executable: str, size: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT):
+        self.executable = executable
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.restarts = 0
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._workers: List = []
+        self._lock = threading.Lock()
+        self._worker_class = _worker_class()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = self._worker_class(self.executable)
+                self._workers.append(worker)
+                return worker
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ExifToolError("No ExifTool worker available")
+
+    def run(self, fn: Callable, timeout: Optional[float] = None):
+        """
+        Call fn(worker) with a started worker held for the whole call.
+
+        fn may issue several commands through the PyExifTool methods of the
+        worker (execute, execute_json, get_metadata_batch, ...).
+
+        Args:
+            fn: Function of a worker.
+            timeout: Seconds to wait for each piece of output (default:
+                pool timeout).
+
+        Raises:
+            ExifToolError: If the process fails or times out.
+        """
+        worker = self._acquire()
+        try:
+            if worker.running and worker._process.poll() is not None:
+                # Exited while idle
+                worker.kill()
+                with self._lock:
+                    self.restarts += 1
+            if not worker.running:
+                worker.start()
+            worker.timeout = timeout or self.timeout
+            return fn(worker)
+        except Exception:
+            # The stream may be out of step with the commands; start afresh
+            worker.kill()
+            with self._lock:
+                self.restarts += 1
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def execute(self, *params: str, timeout: Optional[float] = None) -> bytes:
+        """Run one ExifTool command and return its raw standard output."""
+        args = tuple(os.fsencode(p) for p in params)
+        return self.run(lambda worker: worker.execute(*args), timeout)
+
+    def execute_json(self, *params: str, timeout: Optional[float] = None) -> list:
+        """Run a command with -j and parse its output."""
+        output = self.execute("-j", *params, timeout=timeout)
+        return parse_json(output)
+
+    def close(self) -> None:
+        """Stop every worker process."""
+        with self._lock:
+            for worker in self._workers:
+                worker.terminate()
+
+
+def parse_json(output: bytes) -> list:
+    """Parse -j output; ExifTool prints nothing when no file could be read."""
+    if not output:
+        raise ExifToolError("ExifTool returned no output")
+    return json.loads(output.decode("utf-8"))
+
+
+_pool: Optional[ExifToolPool] = None
+_pool_lock = threading.Lock()
+
+
+def available() -> bool:
+    """Whether the exiftool script is present."""
+    path = get_exiftool_path()
+    return bool(path) and os.path.exists(path)
+
+
+def get_pool() -> ExifToolPool:
+    """The process-wide pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExifToolPool(get_exiftool_path())
+            atexit.register(_pool.close)
+        return _pool
+
+
+def execute(*params: str, timeout: Optional[float] = None) -> bytes:
+    return get_pool().execute(*params, timeout=timeout)
+
+
+def execute_json(*params: str, timeout: Optional[float] = None) -> list:
+    return get_pool().execute_json(*params, timeout=timeout)
@@ -0,0 +1,159 @@
+"""
+Memory-bounded LRU cache of decoded images.
+
+Images are keyed by path plus inode, size and modification time, so a
+file replaced on disk is decoded again. Cached arrays are marked
+read-only and callers receive read-only views: a tool that needs to
+modify its input must take a copy first.
+
+Because cached images cannot change, values derived from them (channel
+histograms, statistics) can be memoized per array with derived().
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ImageCache:
+    """
+    LRU of decoded images under a byte budget.
+
+    Args:
+        max_bytes: Total size of cached pixel data. Images larger than the
+            budget are decoded but not cached.
+        loader: Function decoding a path into an array (None on failure).
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        loader: Callable[[str], Optional[np.ndarray]] = cv.imread,
+    ):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> Tuple:
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, path: str) -> Optional[np.ndarray]:
+        """Return a read-only view of the decoded image, or None if undecodable."""
+        key = self._key(path)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image.view()
+            self.misses += 1
+
+        image = self.loader(path)
+        if image is None:
+            return None
+        image.flags.writeable = False
+
+        if image.nbytes <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = image
+                    self._bytes += image.nbytes
+                    self._shrink(self.max_bytes)
+        return image.view()
+
+    def _shrink(self, budget: int) -> None:
+        while self._bytes > budget and self._entries:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes: int) -> None:
+        """Change the byte budget, evicting as needed."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._shrink(max_bytes)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+
+# Owner array id -> {(view identity, name): value}
+_derived: Dict[int, Dict[Tuple, Any]] = {}
+_derived_lock = threading.Lock()
+
+
+def _view_key(array: np.ndarray) -> Optional[Tuple[np.ndarray, Tuple]]:
+    """
+    The array owning a read-only array's memory, and the identity of the
+    view (buffer address, shape, strides, dtype). None unless the array
+    and its owner are both read-only.
+    """
+    owner = array
+    while isinstance(owner.base, np.ndarray):
+        owner = owner.base
+    if owner.base is not None or array.flags.writeable or owner.flags.writeable:
+        return None
+    return owner, (array.__array_interface__["data"][0], array.shape, array.strides, array.dtype.str)
+
+
+def _forget(owner_id: int) -> None:
+    with _derived_lock:
+        _derived.pop(owner_id, None)
+
+
+def derived(array: np.ndarray, name: str, compute: Callable[[np.ndarray], Any]) -> Any:
+    """
+    compute(array), memoized under name while array's memory is alive.
+
+    Only read-only arrays (such as the images of an ImageCache) are
+    memoized; entries are dropped when the owning array is freed, so a
+    recycled buffer address never returns a stale value. Writable arrays
+    are always recomputed.
+    """
+    found = _view_key(array)
+    if found is None:
+        return compute(array)
+    owner, view = found
+    key = view + (name,)
+    with _derived_lock:
+        values = _derived.get(id(owner))
+        if values is not None and key in values:
+            return values[key]
+
+    value = compute(array)
+    with _derived_lock:
+        values = _derived.get(id(owner))
+        if values is None:
+            values = _derived[id(owner)] = {}
+            weakref.finalize(owner, _forget, id(owner))
+        values.setdefault(key, value)
+    return value
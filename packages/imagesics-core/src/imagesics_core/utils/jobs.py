@@ -0,0 +1,225 @@
+"""
+Background job execution on a local process pool.
+
+Heavy analyses are submitted as jobs and run in worker processes, so a
+request can return immediately with a job id that clients poll. Worker
+functions report progress with report_progress(), which is forwarded to
+the parent over a multiprocessing queue. With a state directory, each
+job's state is also written to <state_dir>/<id>.json so that any server
+worker can answer for a job submitted to another.
+"""
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINAL_STATES = (DONE, FAILED)
+
+# Set in worker processes by _init_worker / _run_job
+_progress_queue = None
+_current_job: Optional[str] = None
+
+
+def _init_worker(queue) -> None:
+    global _progress_queue
+    _progress_queue = queue
+
+
+def _run_job(job_id: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+    global _current_job
+    _current_job = job_id
+    report_progress(0.0, "started")
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_job = None
+
+
+def report_progress(fraction: float, message: str = "") -> None:
+    """Report progress (0-1) of the job running in this worker, if any."""
+    if _progress_queue is not None and _current_job is not None:
+        _progress_queue.put((_current_job, float(fraction), message))
+
+
+class JobManager:
+    """
+    Bounded pool of worker processes plus the state of submitted jobs.
+
+    Args:
+        max_workers: Number of worker processes.
+        max_jobs: Number of job records kept; the oldest finished jobs
+            are forgotten first.
+        state_dir: Directory job states are persisted to, if any.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_jobs: int = 1000,
+        state_dir: Optional[Path] = None
+    ):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_jobs = max_jobs
+        self.state_dir = Path(state_dir) if state_dir is not None else None
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue = None
+        self._listener: Optional[threading.Thread] = None
+
+    def _ensure_executor(self, broken: Optional[ProcessPoolExecutor] = None) -> ProcessPoolExecutor:
+        """
+        Return the pool, starting it lazily so importing the app does not
+        fork workers. A pool passed as broken is replaced, unless another
+        thread has already done so.
+        """
+        with self._lock:
+            if broken is not None and self._executor is broken:
+                self._drop_executor()
+            if self._executor is None:
+                self._queue = multiprocessing.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    initargs=(self._queue,),
+                )
+                self._listener = threading.Thread(
+                    target=self._listen, args=(self._queue,), daemon=True
+                )
+                self._listener.start()
+            return self._executor
+
+    def _drop_executor(self) -> None:
+        """Shut the pool down and stop its listener. Needs self._lock."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._queue.put(None)
+        self._executor = None
+        self._queue = None
+
+    def _listen(self, queue) -> None:
+        while True:
+            item = queue.get()
+            if item is None:
+                return  # Pool replaced or shut down
+            job_id, fraction, message = item
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] in FINAL_STATES:
+                    continue
+                if job["status"] == QUEUED:
+                    job["status"] = RUNNING
+                    job["started"] = time.time()
+                job["progress"] = fraction
+                job["message"] = message
+                self._store(job)
+
+    def submit(self, tool: str, fn: Callable, *args, **kwargs) -> str:
+        """Queue fn(*args, **kwargs) and return the new job id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "tool": tool,
+                "status": QUEUED,
+                "progress": 0.0,
+                "message": "",
+                "result": None,
+                "error": None,
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+            }
+            self._store(self._jobs[job_id])
+            self._prune()
+
+        executor = self._ensure_executor()
+        try:
+            future = executor.submit(_run_job, job_id, fn, args, kwargs)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool and retry once
+            future = self._ensure_executor(broken=executor).submit(_run_job, job_id, fn, args, kwargs)
+        future.add_done_callback(functools.partial(self._finish, job_id))
+        return job_id
+
+    def _finish(self, job_id: str, future) -> None:
+        try:
+            result = future.result()
+            error = result.get("error") if isinstance(result, dict) else None
+        except Exception as e:
+            result, error = None, str(e) or type(e).__name__
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = FAILED if error else DONE
+            job["result"] = result
+            job["error"] = error
+            job["progress"] = 1.0
+            job["finished"] = time.time()
+            self._store(job)
+
+    def _state_path(self, job_id: str) -> Optional[Path]:
+        # Ids are uuid hex; anything else cannot name a state file
+        if self.state_dir is None or not job_id.isalnum():
+            return None
+        return self.state_dir / f"{job_id}.json"
+
+    def _store(self, job: Dict[str, Any]) -> None:
+        """Write a job's state to its state file. Needs self._lock."""
+        path = self._state_path(job["id"])
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(job, f, default=str)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # The in-memory state still serves this worker
+
+    def _prune(self) -> None:
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [k for k, j in self._jobs.items() if j["status"] in FINAL_STATES][:excess]:
+            del self._jobs[job_id]
+            path = self._state_path(job_id)
+            if path is not None:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's state, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # Submitted to another worker process
+        path = self._state_path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._drop_executor()
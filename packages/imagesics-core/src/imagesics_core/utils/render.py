@@ -0,0 +1,256 @@
+"""
+Side-by-side result panels without matplotlib.
+
+Tools that only show a few images next to each other with titles build
+the picture here: each image is converted to BGR (float maps through an
+OpenCV colormap), fitted into an equally sized cell, given a title bar
+drawn with cv.putText, and the cells are tiled with NumPy. This takes a
+few milliseconds, holds no global state and is safe to call from several
+threads at once; matplotlib is left to the tools that draw real plots.
+"""
+import math
+from typing import List, Optional, Sequence
+
+import cv2 as cv
+import numpy as np
+
+# Widest cell; larger images are downscaled, smaller ones keep their size
+MAX_CELL_WIDTH = 800
+MIN_CELL_WIDTH = 240
+JPEG_QUALITY = 90
+
+FONT = cv.FONT_HERSHEY_SIMPLEX
+BACKGROUND = 255
+TEXT_COLOR = (0, 0, 0)
+MARGIN = 10
+COLORBAR_WIDTH = 16
+
+# Colormaps render_map() accepts; "gray" leaves single-channel maps gray
+COLORMAPS = {
+    "gray": None,
+    "jet": cv.COLORMAP_JET,
+    "hot": cv.COLORMAP_HOT,
+    "viridis": cv.COLORMAP_VIRIDIS,
+    "inferno": cv.COLORMAP_INFERNO,
+    "magma": cv.COLORMAP_MAGMA,
+    "plasma": cv.COLORMAP_PLASMA,
+    "turbo": cv.COLORMAP_TURBO,
+    "bone": cv.COLORMAP_BONE,
+    "cool": cv.COLORMAP_COOL,
+}
+
+
+class Panel:
+    """
+    One titled image of a composite.
+
+    Args:
+        image: uint8 gray or BGR image, or a 2-D float map.
+        title: Title drawn above the image; "\\n" starts a new line.
+        colormap: OpenCV colormap applied to single-channel images
+            (None keeps them gray).
+        vmin, vmax: Value range of float maps (their min and max if None).
+        colorbar: Draw a colorbar with the value range next to the image.
+    """
+
+    def __init__(self, image: np.ndarray, title: str = "", colormap: Optional[int] = None,
+                 vmin: Optional[float] = None, vmax: Optional[float] = None, colorbar: bool = False):
+        self.image = image
+        self.title = title
+        self.colormap = colormap
+        self.vmin = vmin
+        self.vmax = vmax
+        self.colorbar = colorbar
+
+
+def scale_to_uint8(values: np.ndarray, vmin: Optional[float] = None,
+                   vmax: Optional[float] = None) -> np.ndarray:
+    """Linearly map [vmin, vmax] to [0, 255], clipping outside values."""
+    values = np.asarray(values, dtype=np.float32)
+    if vmin is None:
+        vmin = float(values.min()) if values.size else 0.0
+    if vmax is None:
+        vmax = float(values.max()) if values.size else 1.0
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    return cv.convertScaleAbs(np.clip(values, vmin, vmax), alpha=scale, beta=-vmin * scale)
+
+
+def to_bgr(image: np.ndarray, colormap: Optional[int] = None, vmin: Optional[float] = None,
+           vmax: Optional[float] = None) -> np.ndarray:
+    """uint8 BGR version of an image or map."""
+    if image.dtype != np.uint8 or vmin is not None or vmax is not None:
+        if image.ndim == 3:
+            return scale_to_uint8(image, 0.0 if vmin is None else vmin, 1.0 if vmax is None else vmax)
+        image = scale_to_uint8(image, vmin, vmax)
+    if image.ndim == 2:
+        if colormap is not None:
+            return cv.applyColorMap(image, colormap)
+        return cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv.cvtColor(image, cv.COLOR_BGRA2BGR)
+    return image
+
+
+def render_map(
+    values: np.ndarray,
+    colormap: str = "gray",
+    gain: float = 1.0,
+    threshold: Optional[float] = None,
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    layer: Optional[int] = None
+) -> np.ndarray:
+    """
+    Display image of a raw analysis map.
+
+    Args:
+        values: 2-D map, (H, W, 3) per-channel map, or (H, W, n) stack of
+            maps of which one layer is shown.
+        colormap: Name from COLORMAPS, applied to single-channel maps.
+        gain: Multiplier of the values after the value range is mapped
+            to [0, 1]; results above 1 saturate.
+        threshold: Values below this (in map units) are shown as zero.
+        vmin, vmax: Value range (the map's min and max if None).
+        layer: Layer of a stack to show.
+
+    Returns:
+        uint8 BGR image.
+    """
+    if colormap not in COLORMAPS:
+        raise ValueError(f"Unknown colormap: {colormap}")
+    if values.ndim == 3 and (layer is not None or values.shape[2] != 3):
+        if layer is None or not 0 <= layer < values.shape[2]:
+            raise ValueError(f"layer must be between 0 and {values.shape[2] - 1}")
+        values = values[:, :, layer]
+    elif values.ndim not in (2, 3):
+        raise ValueError("Map must be 2-D or 3-D")
+
+    values = np.asarray(values, dtype=np.float32)
+    if vmin is None:
+        vmin = float(values.min()) if values.size else 0.0
+    if vmax is None:
+        vmax = float(values.max()) if values.size else 1.0
+    span = vmax - vmin if vmax > vmin else 1.0
+    scale = 255.0 * gain / span
+    if threshold is not None:
+        values = np.where(values < threshold, vmin, values)
+    # convertScaleAbs saturates, which also clips values outside the range
+    shown = cv.convertScaleAbs(np.maximum(values, vmin), alpha=scale, beta=-vmin * scale)
+    if shown.ndim == 2:
+        colormap_id = COLORMAPS[colormap]
+        return cv.applyColorMap(shown, colormap_id) if colormap_id is not None else cv.cvtColor(shown, cv.COLOR_GRAY2BGR)
+    return shown
+
+
+def _fit(image: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Resize keeping the aspect ratio and center on a background cell."""
+    h, w = image.shape[:2]
+    scale = min(width / w, height / h)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    if size != (w, h):
+        # Nearest keeps block-resolution maps crisp when enlarged
+        image = cv.resize(image, size, interpolation=cv.INTER_AREA if scale < 1 else cv.INTER_NEAREST)
+    cell = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    y, x = (height - size[1]) // 2, (width - size[0]) // 2
+    cell[y:y + size[1], x:x + size[0]] = image
+    return cell
+
+
+def _font_scale(width: int) -> float:
+    return max(0.45, min(0.9, width / 900))
+
+
+def _text_block(lines: Sequence[str], width: int, scale: float) -> np.ndarray:
+    """Centered lines of text on a background strip."""
+    thickness = 1 if scale < 0.7 else 2
+    line_height = cv.getTextSize("Ag", FONT, scale, thickness)[0][1] * 2
+    block = np.full((line_height * len(lines) + MARGIN, width, 3), BACKGROUND, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        (text_w, text_h), _ = cv.getTextSize(line, FONT, scale, thickness)
+        x = max(0, (width - text_w) // 2)
+        y = MARGIN + i * line_height + text_h
+        cv.putText(block, line, (x, y), FONT, scale, TEXT_COLOR, thickness, cv.LINE_AA)
+    return block
+
+
+def _colorbar(height: int, colormap: Optional[int], vmin: float, vmax: float, scale: float) -> np.ndarray:
+    """Vertical colorbar with its end values."""
+    ramp = np.linspace(255, 0, height, dtype=np.float32).astype(np.uint8)[:, None]
+    ramp = to_bgr(np.repeat(ramp, COLORBAR_WIDTH, axis=1), colormap)
+    labels = [f"{vmax:.3g}", f"{vmin:.3g}"]
+    text_w = max(cv.getTextSize(label, FONT, scale * 0.8, 1)[0][0] for label in labels)
+    bar = np.full((height, COLORBAR_WIDTH + text_w + 2 * MARGIN, 3), BACKGROUND, dtype=np.uint8)
+    bar[:, MARGIN:MARGIN + COLORBAR_WIDTH] = ramp
+    text_h = cv.getTextSize("0", FONT, scale * 0.8, 1)[0][1]
+    x = MARGIN + COLORBAR_WIDTH + 4
+    cv.putText(bar, labels[0], (x, text_h + 2), FONT, scale * 0.8, TEXT_COLOR, 1, cv.LINE_AA)
+    cv.putText(bar, labels[1], (x, height - 2), FONT, scale * 0.8, TEXT_COLOR, 1, cv.LINE_AA)
+    return bar
+
+
+def _cell_size(panels: Sequence[Panel], cols: int, max_width: int) -> tuple:
+    """Cell size from the first panel's aspect ratio."""
+    h, w = panels[0].image.shape[:2]
+    width = max(MIN_CELL_WIDTH, min(w, MAX_CELL_WIDTH, max_width // cols))
+    return width, max(1, round(width * h / w))
+
+
+def compose(panels: Sequence[Panel], cols: Optional[int] = None, title: str = "",
+            max_width: int = 2 * MAX_CELL_WIDTH) -> np.ndarray:
+    """
+    Tile titled panels into one BGR image.
+
+    Args:
+        panels: Panels in row-major order.
+        cols: Columns of the grid (all panels in one row if None).
+        title: Title drawn above the whole grid.
+        max_width: Cells are shrunk so a row of cols fits this width.
+    """
+    if not panels:
+        raise ValueError("No panels to compose")
+    cols = cols or len(panels)
+    width, height = _cell_size(panels, cols, max_width)
+    scale = _font_scale(width)
+
+    cells: List[np.ndarray] = []
+    for panel in panels:
+        vmin, vmax = panel.vmin, panel.vmax
+        if panel.colorbar:
+            # The colorbar labels the range the colors are stretched over
+            vmin = float(panel.image.min()) if vmin is None else vmin
+            vmax = float(panel.image.max()) if vmax is None else vmax
+        cell = _fit(to_bgr(panel.image, panel.colormap, vmin, vmax), width, height)
+        if panel.colorbar:
+            cell = np.hstack([cell, _colorbar(height, panel.colormap, vmin, vmax, scale)])
+        lines = panel.title.split("\n") if panel.title else []
+        parts = [_text_block(lines, cell.shape[1], scale)] if lines else []
+        cells.append(np.vstack(parts + [cell]))
+
+    # Pad cells to a common size so rows and columns line up
+    cell_h = max(c.shape[0] for c in cells)
+    cell_w = max(c.shape[1] for c in cells)
+    rows = math.ceil(len(cells) / cols)
+    grid = np.full((rows * (cell_h + MARGIN) + MARGIN, cols * (cell_w + MARGIN) + MARGIN, 3),
+                   BACKGROUND, dtype=np.uint8)
+    for i, cell in enumerate(cells):
+        r, c = divmod(i, cols)
+        y = MARGIN + r * (cell_h + MARGIN) + (cell_h - cell.shape[0])
+        x = MARGIN + c * (cell_w + MARGIN) + (cell_w - cell.shape[1]) // 2
+        grid[y:y + cell.shape[0], x:x + cell.shape[1]] = cell
+
+    if title:
+        grid = np.vstack([_text_block(title.split("\n"), grid.shape[1], scale * 1.2), grid])
+    return grid
+
+
+def encode_jpeg(image: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    """JPEG bytes of a BGR image."""
+    ok, buf = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode image")
+    return buf.tobytes()
+
+
+def render(panels: Sequence[Panel], cols: Optional[int] = None, title: str = "") -> bytes:
+    """compose() encoded as JPEG bytes."""
+    return encode_jpeg(compose(panels, cols, title))
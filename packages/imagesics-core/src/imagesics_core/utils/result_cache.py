@@ -0,0 +1,271 @@
+"""
+Content-addressed cache of forensic tool results.
+
+Entries are keyed by the SHA-256 of the source file, the tool name, the
+canonicalized parameters and a fingerprint of the analysis code, and map
+to the JSON payload the tool returned (which references files stored in
+the results directory). Result files are evicted by age and total size.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CHUNK_SIZE = 1 << 20
+
+_digest_memo: "OrderedDict[Tuple, str]" = OrderedDict()
+_digest_lock = threading.Lock()
+_DIGEST_MEMO_SIZE = 4096
+
+
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 of a file, memoized on (path, inode, size, mtime) so repeated
+    requests against the same upload only hash it once.
+    """
+    st = os.stat(path)
+    key = (str(path), st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_memo.get(key)
+        if digest is not None:
+            _digest_memo.move_to_end(key)
+            return digest
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[key] = digest
+        if len(_digest_memo) > _DIGEST_MEMO_SIZE:
+            _digest_memo.popitem(last=False)
+    return digest
+
+
+def remember_sha256(path: str, digest: str) -> None:
+    """Seed the file_sha256 memo with a digest computed elsewhere (e.g. at upload)."""
+    st = os.stat(path)
+    key = (str(path), st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        _digest_memo[key] = digest
+        if len(_digest_memo) > _DIGEST_MEMO_SIZE:
+            _digest_memo.popitem(last=False)
+
+
+def code_version(paths: Iterable[Path]) -> str:
+    """Fingerprint of the given source files/directories (*.py contents)."""
+    h = hashlib.sha256()
+    files: List[Path] = []
+    for p in map(Path, paths):
+        files.extend(sorted(p.rglob("*.py")) if p.is_dir() else [p])
+    for f in files:
+        try:
+            h.update(f.read_bytes())
+        except OSError:
+            continue
+    return h.hexdigest()[:16]
+
+
+def canonical_params(params: Any) -> str:
+    """Stable JSON form of request parameters."""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def collect_result_files(payload: Any, url_prefix: str) -> List[str]:
+    """Return every string in payload that points into the results directory."""
+    found = []
+    if isinstance(payload, str):
+        if payload.startswith(url_prefix):
+            found.append(payload[len(url_prefix):])
+    elif isinstance(payload, dict):
+        for v in payload.values():
+            found.extend(collect_result_files(v, url_prefix))
+    elif isinstance(payload, (list, tuple)):
+        for v in payload:
+            found.extend(collect_result_files(v, url_prefix))
+    return found
+
+
+class ResultCache:
+    """
+    Persistent map from cache key to tool payload.
+
+    Each entry is a small JSON record, index_dir/<key>.json, written
+    atomically, so server workers share entries without rewriting each
+    other's. A record's mtime is the entry's last use.
+
+    Args:
+        index_dir: Directory the entry records are stored in.
+        results_dir: Directory the result files live in.
+        url_prefix: URL prefix under which results_dir is served.
+        version: Code fingerprint mixed into every key.
+        max_bytes: Size budget for results_dir.
+        max_age: Maximum age in seconds of a result file.
+        evict_interval: Minimum seconds between eviction sweeps.
+    """
+
+    def __init__(
+        self,
+        index_dir: Path,
+        results_dir: Path,
+        url_prefix: str = "/storage/results/",
+        version: str = "",
+        max_bytes: int = 1 << 30,
+        max_age: float = 7 * 24 * 3600,
+        evict_interval: float = 60.0,
+    ):
+        self.index_dir = Path(index_dir)
+        self.results_dir = Path(results_dir)
+        self.url_prefix = url_prefix
+        self.version = version
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+
+    def _record_path(self, key: str) -> Path:
+        return self.index_dir / f"{key}.json"
+
+    def _read(self, path: Path) -> Optional[dict]:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _discard(self, path: Path) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def make_key(self, source_digest: str, tool: str, params: Any) -> str:
+        raw = "\n".join([source_digest, tool, canonical_params(params), self.version])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached payload, or None if absent or its files are gone."""
+        path = self._record_path(key)
+        entry = self._read(path)
+        if entry is not None and all(
+            (self.results_dir / name).is_file() for name in entry["files"]
+        ):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return entry["payload"]
+        if entry is not None:
+            self._discard(path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, payload: Any) -> None:
+        entry = {
+            "payload": payload,
+            "files": collect_result_files(payload, self.url_prefix),
+            "created": time.time(),
+        }
+        path = self._record_path(key)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # Unique temp name so concurrent writers of one key never interleave
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def _records(self) -> List[Tuple[Path, float, dict]]:
+        """(path, last use, entry) of every readable record."""
+        records = []
+        if not self.index_dir.exists():
+            return records
+        for e in os.scandir(self.index_dir):
+            if not e.name.endswith(".json"):
+                continue
+            try:
+                used = e.stat().st_mtime
+            except OSError:
+                continue
+            entry = self._read(Path(e.path))
+            if entry is not None:
+                records.append((Path(e.path), used, entry))
+        return records
+
+    def evict(self, force: bool = False) -> int:
+        """
+        Remove result files older than max_age, then the least recently
+        used ones until results_dir fits in max_bytes, together with the
+        records that reference them. Returns the number of files removed.
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_evict < self.evict_interval:
+                return 0
+            self._last_evict = now
+
+            # Last use of each file: cache hits refresh it, otherwise mtime
+            records = self._records()
+            last_used = {}
+            for _, used, entry in records:
+                for name in entry["files"]:
+                    last_used[name] = max(last_used.get(name, 0), used)
+
+            files = []
+            total = 0
+            if self.results_dir.exists():
+                for e in os.scandir(self.results_dir):
+                    if not e.is_file():
+                        continue
+                    st = e.stat()
+                    used = max(st.st_mtime, last_used.get(e.name, 0))
+                    files.append((used, st.st_size, e.name))
+                    total += st.st_size
+
+            removed = set()
+            files.sort()
+            for used, size, name in files:
+                if now - used <= self.max_age and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.results_dir / name)
+                except OSError:
+                    continue
+                removed.add(name)
+                total -= size
+
+            if removed:
+                self.evictions += len(removed)
+                for path, _, entry in records:
+                    if removed.intersection(entry["files"]):
+                        self._discard(path)
+            return len(removed)
+
+    def stats(self) -> dict:
+        entries = 0
+        if self.index_dir.exists():
+            entries = sum(1 for e in os.scandir(self.index_dir) if e.name.endswith(".json"))
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "max_bytes": self.max_bytes,
+                "max_age": self.max_age,
+            }
@@ -0,0 +1,135 @@
+"""
+Tiled, memory-bounded execution of per-pixel tools.
+
+Large images are processed tile by tile: each tile is read with a halo of
+surrounding context pixels, processed, and only its core written to the
+output, so neighbourhood operations are seamless across tile borders.
+Tiles are aligned to a grid (16 for the JPEG tools, the size of a 4:2:0
+MCU) so re-encoding a tile reproduces the blocks of the whole image.
+
+Images whose working set fits the memory budget are processed in one
+piece, exactly as before.
+"""
+import os
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_BUDGET = int(os.environ.get("IMAGESICS_TILE_BUDGET_BYTES", 256 * 1024 * 1024))
+
+# JPEG minimum coded unit with 4:2:0 chroma subsampling
+JPEG_ALIGN = 16
+
+
+class Tile:
+    """
+    One tile of an image.
+
+    Attributes:
+        core: (y0, y1, x0, x1) region of the image the tile produces.
+        outer: (y0, y1, x0, x1) region read, i.e. core plus halo.
+    """
+
+    def __init__(self, core: Tuple[int, int, int, int], outer: Tuple[int, int, int, int]):
+        self.core = core
+        self.outer = outer
+
+    @property
+    def source(self) -> Tuple[slice, slice]:
+        """Slices of the image to read."""
+        y0, y1, x0, x1 = self.outer
+        return slice(y0, y1), slice(x0, x1)
+
+    @property
+    def target(self) -> Tuple[slice, slice]:
+        """Slices of the output the tile's core is written to."""
+        y0, y1, x0, x1 = self.core
+        return slice(y0, y1), slice(x0, x1)
+
+    @property
+    def crop(self) -> Tuple[slice, slice]:
+        """Slices of the processed tile that hold its core."""
+        dy, dx = self.core[0] - self.outer[0], self.core[2] - self.outer[2]
+        return (slice(dy, dy + self.core[1] - self.core[0]),
+                slice(dx, dx + self.core[3] - self.core[2]))
+
+
+def _round_up(value: int, align: int) -> int:
+    return -(-value // align) * align
+
+
+def tile_size(
+    bytes_per_pixel: float,
+    budget: Optional[int] = None,
+    halo: int = 0,
+    align: int = 1
+) -> int:
+    """Side of the largest square aligned tile whose padded area fits the budget."""
+    budget = budget or DEFAULT_BUDGET
+    side = int((budget / bytes_per_pixel) ** 0.5) - 2 * halo
+    return max(align, side // align * align)
+
+
+def needs_tiling(shape: Tuple[int, ...], bytes_per_pixel: float, budget: Optional[int] = None) -> bool:
+    """Whether an image of this shape exceeds the budget in one piece."""
+    return shape[0] * shape[1] * bytes_per_pixel > (budget or DEFAULT_BUDGET)
+
+
+def iter_tiles(height: int, width: int, tile: int, halo: int = 0, align: int = 1) -> Iterator[Tile]:
+    """
+    Tiles covering a height x width image in row-major order.
+
+    Tile origins and halos are multiples of align (the halo is rounded up),
+    so every tile starts on the align grid of the whole image.
+    """
+    tile = max(align, tile // align * align)
+    halo = _round_up(halo, align) if halo else 0
+    for y0 in range(0, height, tile):
+        y1 = min(height, y0 + tile)
+        for x0 in range(0, width, tile):
+            x1 = min(width, x0 + tile)
+            yield Tile(
+                (y0, y1, x0, x1),
+                (max(0, y0 - halo), min(height, y1 + halo), max(0, x0 - halo), min(width, x1 + halo)),
+            )
+
+
+def process_tiled(
+    image: np.ndarray,
+    fn: Callable[[np.ndarray], np.ndarray],
+    bytes_per_pixel: float,
+    halo: int = 0,
+    align: int = 1,
+    budget: Optional[int] = None,
+    progress: Optional[Callable[[float], None]] = None
+) -> np.ndarray:
+    """
+    Apply a per-pixel (or local neighbourhood) tool tile by tile.
+
+    Args:
+        image: Input image.
+        fn: Tool mapping an image to a result of the same height and width.
+        bytes_per_pixel: Estimate of fn's peak working memory per pixel.
+        halo: Context pixels fn needs around each output pixel.
+        align: Grid tile origins are aligned to (e.g. JPEG_ALIGN).
+        budget: Memory budget in bytes (default DEFAULT_BUDGET).
+        progress: Called with the fraction of tiles done.
+
+    Returns:
+        fn(image), assembled from tiles when the image exceeds the budget.
+    """
+    if not needs_tiling(image.shape, bytes_per_pixel, budget):
+        return fn(image)
+
+    height, width = image.shape[:2]
+    side = tile_size(bytes_per_pixel, budget, _round_up(halo, align), align)
+    tiles = list(iter_tiles(height, width, side, halo, align))
+    output = None
+    for n, tile in enumerate(tiles):
+        result = fn(image[tile.source])
+        if output is None:
+            output = np.empty((height, width) + result.shape[2:], dtype=result.dtype)
+        output[tile.target] = result[tile.crop]
+        if progress is not None:
+            progress((n + 1) / len(tiles))
+    return output
@@ -0,0 +1,214 @@
+"""
+Uploads hashed while they are written.
+
+An upload is streamed to disk in chunks that also feed every digest
+hasher, then decoded once for the perceptual hashes. The results are kept
+in a JSON sidecar record per upload (records_dir/<upload id>.json) that
+the digest report and the result cache reuse instead of rehashing the
+file. An upload whose SHA-256 matches a stored file is not kept: the
+existing upload is returned instead. Each stored SHA-256 is claimed with
+a marker file (records_dir/by-sha256/<digest>, created exclusively), so
+identical uploads racing in different threads or server workers keep a
+single copy.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import cv2 as cv
+
+from imagesics_core.forensic import digest, phash_index
+from imagesics_core.utils import result_cache
+
+CHUNK_SIZE = 1 << 20
+# How long an identical upload waits for the record of the one that
+# claimed its SHA-256 before treating the claim as abandoned
+CLAIM_WAIT = 30.0
+
+
+class UploadStore:
+    """
+    Uploads directory with content-hash sidecar records.
+
+    Args:
+        uploads_dir: Directory uploads are stored in.
+        records_dir: Directory of the sidecar records.
+    """
+
+    def __init__(self, uploads_dir: Path, records_dir: Path):
+        self.uploads_dir = Path(uploads_dir)
+        self.records_dir = Path(records_dir)
+        self.markers_dir = self.records_dir / "by-sha256"
+        self._markers_ready = False
+        self._lock = threading.Lock()
+
+    def _record_path(self, upload_id: str) -> Path:
+        return self.records_dir / f"{upload_id}.json"
+
+    def _create_marker(self, sha256: str, upload_id: str) -> Optional[str]:
+        """
+        Claim a SHA-256 for an upload id. Returns None if claimed, or the
+        upload id that already holds the claim.
+        """
+        marker = self.markers_dir / sha256
+        try:
+            fd = os.open(marker, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            try:
+                return marker.read_text() or None
+            except OSError:
+                return None
+        with os.fdopen(fd, "w") as f:
+            f.write(upload_id)
+        return None
+
+    def _replace_marker(self, sha256: str, upload_id: str) -> None:
+        marker = self.markers_dir / sha256
+        tmp = marker.with_name(f".{sha256}.{upload_id}.tmp")
+        tmp.write_text(upload_id)
+        os.replace(tmp, marker)
+
+    def _ensure_markers(self) -> None:
+        """Create the markers of records written before markers existed. Needs self._lock."""
+        if self._markers_ready:
+            return
+        self.markers_dir.mkdir(parents=True, exist_ok=True)
+        for entry in os.scandir(self.records_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    record = json.load(f)
+                self._create_marker(record["sha256"], record["id"])
+            except (OSError, ValueError, KeyError):
+                continue
+        self._markers_ready = True
+
+    def _claim(self, sha256: str, upload_id: str) -> Optional[dict]:
+        """
+        Reserve sha256 for upload_id, or return the record of the upload
+        that holds it. A claim whose upload has gone (or changed) is taken
+        over.
+        """
+        with self._lock:
+            self._ensure_markers()
+            holder = self._create_marker(sha256, upload_id)
+        if holder is None:
+            return None
+        deadline = time.monotonic() + CLAIM_WAIT
+        while True:
+            record = self.record(holder)
+            if record is not None:
+                return record
+            # The holder may still be decoding; its record appears when done
+            if self._record_path(holder).exists() or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        self._replace_marker(sha256, upload_id)
+        return None
+
+    def record(self, upload_id: str) -> Optional[dict]:
+        """
+        The sidecar record of an upload, or None if there is none or the
+        file changed since it was written.
+        """
+        path = self.uploads_dir / upload_id
+        try:
+            with open(self._record_path(upload_id)) as f:
+                record = json.load(f)
+            st = os.stat(path)
+        except (OSError, ValueError):
+            return None
+        if record.get("size") != st.st_size or record.get("mtime_ns") != st.st_mtime_ns:
+            return None
+        return record
+
+    def record_for_path(self, path: Path) -> Optional[dict]:
+        """The record of a file on disk, if it is an upload of this store."""
+        path = Path(path)
+        if path.parent.resolve() != self.uploads_dir.resolve():
+            return None
+        return self.record(path.name)
+
+    def save(self, stream: BinaryIO, filename: str, chunk_size: int = CHUNK_SIZE) -> Tuple[dict, bool]:
+        """
+        Write an upload, hashing it on the way.
+
+        Returns:
+            (record, duplicate): duplicate is True when a file with the same
+            content was already stored, in which case its record is returned
+            and nothing new is kept.
+        """
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        upload_id = f"{uuid.uuid4()}_{filename}"
+        partial = self.uploads_dir / f".{upload_id}.part"
+
+        hashers = digest.new_hashers()
+        size = 0
+        try:
+            with open(partial, "wb") as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b""):
+                    for h in hashers.values():
+                        h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            file_hashes = {name: h.hexdigest() for name, h in hashers.items()}
+            sha256 = file_hashes["SHA2-256"]
+
+            existing = self._claim(sha256, upload_id)
+            if existing is not None:
+                partial.unlink()
+                return existing, True
+            os.replace(partial, self.uploads_dir / upload_id)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+        path = self.uploads_dir / upload_id
+        st = os.stat(path)
+        record = {
+            "id": upload_id,
+            "filename": filename,
+            "size": size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": sha256,
+            "file_hashes": file_hashes,
+            "image_hashes": None,
+            "phash": None,
+        }
+
+        # Decode once for both the digest and the similar-search hashes
+        image = cv.imread(str(path))
+        if image is not None:
+            record["image_hashes"] = digest.compute_image_hashes(image)
+            try:
+                record["phash"] = f"{phash_index.image_phash(image):016x}"
+            except Exception:
+                pass
+
+        self.records_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._record_path(upload_id).with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, self._record_path(upload_id))
+        result_cache.remember_sha256(str(path), sha256)
+        return record, False
+
+
+_stores: Dict[Tuple[str, str], UploadStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(uploads_dir: Path, records_dir: Path) -> UploadStore:
+    """Return the process-wide store for a storage location."""
+    key = (str(uploads_dir), str(records_dir))
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = UploadStore(uploads_dir, records_dir)
+            _stores[key] = store
+        return store
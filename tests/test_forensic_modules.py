@@ -6,6 +6,7 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'packages', 'imagesics-core', 'src'))
 
+import time
 import unittest
 import numpy as np
 import cv2
@@ -61,5 +62,965 @@ class TestForensicModules(unittest.TestCase):
         except Exception as e:
             self.fail(f"compare_images failed: {e}")
 
+
+class TestPHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.uploads = os.path.join(self.tmp.name, 'uploads')
+        os.makedirs(self.uploads)
+        self.index_path = os.path.join(self.tmp.name, 'index', 'phash.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_bktree_matches_brute_force(self):
+        """BK-tree radius queries return exactly the brute-force matches"""
+        from imagesics_core.forensic.phash_index import BKTree, hamming
+
+        rng = np.random.default_rng(0)
+        values = [int(v) for v in rng.integers(0, 2**63, 500, dtype=np.int64)]
+        tree = BKTree()
+        for i, v in enumerate(values):
+            tree.add(v, str(i))
+
+        query = values[17] ^ 0b1011
+        expected = {(str(i), hamming(query, v)) for i, v in enumerate(values)
+                    if hamming(query, v) <= 19}
+        self.assertEqual(set(tree.search(query, 19)), expected)
+
+    def test_index_persists_and_drops_missing_files(self):
+        """Index survives a reload and forgets deleted uploads"""
+        from imagesics_core.forensic.phash_index import PHashIndex
+
+        for name in ('a.jpg', 'b.jpg'):
+            open(os.path.join(self.uploads, name), 'wb').close()
+        index = PHashIndex(self.index_path, self.uploads)
+        index.add('a.jpg', 0xFF)
+        index.add('b.jpg', 0xF0)
+
+        reloaded = PHashIndex(self.index_path, self.uploads)
+        self.assertEqual(reloaded.get('b.jpg'), 0xF0)
+
+        os.remove(os.path.join(self.uploads, 'b.jpg'))
+        self.assertEqual(reloaded.search(0xFF, 4), [('a.jpg', 0)])
+        self.assertNotIn('b.jpg', PHashIndex(self.index_path, self.uploads))
+
+    def test_search_sees_other_processes(self):
+        """Entries appended to the log by another index show up in search"""
+        from imagesics_core.forensic.phash_index import PHashIndex
+
+        for name in ('a.jpg', 'b.jpg'):
+            open(os.path.join(self.uploads, name), 'wb').close()
+        first = PHashIndex(self.index_path, self.uploads)
+        second = PHashIndex(self.index_path, self.uploads)
+        first.add('a.jpg', 0xFF)
+        self.assertEqual(second.search(0xFF, 0), [('a.jpg', 0)])
+        second.add('b.jpg', 0xFE)
+        first.remove('a.jpg')
+        self.assertEqual(second.search(0xFF, 1), [('b.jpg', 1)])
+
+    def test_log_compaction(self):
+        """Churn is compacted away and other processes reload the rewritten log"""
+        from imagesics_core.forensic.phash_index import PHashIndex, COMPACT_MIN
+
+        for name in ('a.jpg', 'b.jpg'):
+            open(os.path.join(self.uploads, name), 'wb').close()
+        first = PHashIndex(self.index_path, self.uploads)
+        second = PHashIndex(self.index_path, self.uploads)
+        first.add('b.jpg', 0xF0)
+        for i in range(3 * COMPACT_MIN):
+            first.add('a.jpg', i)
+        with open(self.index_path) as f:
+            self.assertLess(len(f.readlines()), 2 * COMPACT_MIN)
+
+        second.add('c.jpg', 0x0F)
+        self.assertEqual(first.search(3 * COMPACT_MIN - 1, 0), [('a.jpg', 0)])
+        self.assertEqual(sorted(second.search(0xF0, 0)), [('b.jpg', 0)])
+        self.assertIn('c.jpg', first)
+        self.assertEqual(len(PHashIndex(self.index_path, self.uploads)), 3)
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from imagesics_core.utils.result_cache import ResultCache
+        self.tmp = tempfile.TemporaryDirectory()
+        self.results = os.path.join(self.tmp.name, 'results')
+        os.makedirs(self.results)
+        self.index = os.path.join(self.tmp.name, 'index')
+        self.cache = ResultCache(self.index, self.results, max_bytes=10, evict_interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _result(self, name, size, age=0):
+        path = os.path.join(self.results, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return {'result_url': f'/storage/results/{name}'}
+
+    def test_key_ignores_param_order(self):
+        """Parameter order does not change the cache key"""
+        k1 = self.cache.make_key('abc', 'ela', {'quality': 75, 'scale': 50})
+        k2 = self.cache.make_key('abc', 'ela', {'scale': 50, 'quality': 75})
+        self.assertEqual(k1, k2)
+        self.assertNotEqual(k1, self.cache.make_key('abc', 'ghost', {'quality': 75, 'scale': 50}))
+
+    def test_hit_miss_and_size_eviction(self):
+        """Hits return the stored payload and oversize results are evicted"""
+        self.assertIsNone(self.cache.get('k1'))
+        self.cache.put('k1', self._result('a.jpg', 6, age=60))
+        self.assertEqual(self.cache.get('k1'), {'result_url': '/storage/results/a.jpg'})
+        used = time.time() - 60
+        os.utime(self.cache._record_path('k1'), (used, used))
+
+        self.cache.put('k2', self._result('b.jpg', 6))
+        self.assertIsNone(self.cache.get('k1'))
+        self.assertIsNotNone(self.cache.get('k2'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 2, 1))
+        self.assertEqual(stats['entries'], 1)
+
+    def test_shared_between_processes(self):
+        """Entries written through one cache are read by another on the same directory"""
+        from imagesics_core.utils.result_cache import ResultCache
+
+        other = ResultCache(self.index, self.results, max_bytes=10, evict_interval=0)
+        self.cache.put('k1', self._result('a.jpg', 4))
+        other.put('k2', self._result('b.jpg', 4))
+        self.assertIsNotNone(other.get('k1'))
+        self.assertIsNotNone(self.cache.get('k2'))
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.tmp.name, f'{i}.png')
+            cv2.imwrite(path, np.full((10, 10, 3), i, np.uint8))
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_read_only_views_and_eviction(self):
+        """Cached images are read-only and evicted beyond the byte budget"""
+        from imagesics_core.utils.image_cache import ImageCache
+
+        cache = ImageCache(max_bytes=2 * 300)
+        img = cache.get(self.paths[0])
+        self.assertFalse(img.flags.writeable)
+        with self.assertRaises(ValueError):
+            img[0, 0] = 1
+
+        cache.get(self.paths[0])
+        cache.get(self.paths[1])
+        cache.get(self.paths[2])
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 3, 1))
+        self.assertEqual(stats['bytes'], 600)
+
+    def test_modified_file_is_reloaded(self):
+        """Rewriting a file invalidates its cached copy"""
+        from imagesics_core.utils.image_cache import ImageCache
+
+        cache = ImageCache()
+        self.assertEqual(cache.get(self.paths[0])[0, 0, 0], 0)
+        cv2.imwrite(self.paths[0], np.full((10, 10, 3), 7, np.uint8))
+        os.utime(self.paths[0], ns=(0, 10**9))
+        self.assertEqual(cache.get(self.paths[0])[0, 0, 0], 7)
+
+    def test_derived_values(self):
+        """Values derived from read-only arrays are memoized until freed"""
+        import gc
+        from imagesics_core.utils import image_cache
+
+        calls = []
+        compute = lambda a: calls.append(1) or int(a.sum())
+        image = np.ones((4, 4), np.uint8)
+        self.assertEqual(image_cache.derived(image, 'sum', compute), 16)
+        image_cache.derived(image, 'sum', compute)
+        self.assertEqual(len(calls), 2)
+
+        image.flags.writeable = False
+        image_cache.derived(image.view(), 'sum', compute)
+        image_cache.derived(image.view(), 'sum', compute)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(image_cache.derived(image[:2], 'sum', compute), 8)
+        owner = id(image)
+        del image
+        gc.collect()
+        self.assertNotIn(owner, image_cache._derived)
+
+class TestJobManager(unittest.TestCase):
+
+    def _wait(self, manager, job_id):
+        for _ in range(200):
+            job = manager.get(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail("job did not finish")
+
+    def test_jobs_complete_and_fail(self):
+        """Jobs run in the pool and report results or errors"""
+        import operator
+        from imagesics_core.utils.jobs import JobManager
+
+        manager = JobManager(max_workers=1)
+        try:
+            ok = manager.submit('add', operator.add, 2, 3)
+            bad = manager.submit('div', operator.truediv, 1, 0)
+            self.assertIn(manager.get(ok)['status'], ('queued', 'running', 'done'))
+
+            job = self._wait(manager, ok)
+            self.assertEqual((job['status'], job['result'], job['progress']), ('done', 5, 1.0))
+            job = self._wait(manager, bad)
+            self.assertEqual(job['status'], 'failed')
+            self.assertIn('division', job['error'])
+            self.assertIsNone(manager.get('missing'))
+        finally:
+            manager.shutdown()
+
+    def test_state_shared_between_processes(self):
+        """A manager on the same state directory reports jobs submitted to another"""
+        import operator
+        import tempfile
+        from imagesics_core.utils.jobs import JobManager
+
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = JobManager(max_workers=1, state_dir=tmp)
+            other = JobManager(max_workers=1, state_dir=tmp)
+            try:
+                job_id = manager.submit('add', operator.add, 2, 3)
+                self._wait(manager, job_id)
+                job = other.get(job_id)
+                self.assertEqual((job['status'], job['result']), ('done', 5))
+                self.assertIsNone(other.get('../missing'))
+            finally:
+                manager.shutdown()
+
+    def test_broken_pool_is_replaced(self):
+        """A crashed worker fails its job and the next submit gets a fresh pool"""
+        import operator
+        from imagesics_core.utils.jobs import JobManager
+
+        manager = JobManager(max_workers=1)
+        try:
+            crashed = manager.submit('crash', os._exit, 1)
+            self.assertEqual(self._wait(manager, crashed)['status'], 'failed')
+            broken, listener = manager._executor, manager._listener
+
+            job = self._wait(manager, manager.submit('add', operator.add, 2, 3))
+            self.assertEqual(job['result'], 5)
+            self.assertIsNot(manager._executor, broken)
+            listener.join(5)
+            self.assertFalse(listener.is_alive())
+        finally:
+            manager.shutdown()
+
+class TestReport(unittest.TestCase):
+    """Test the single-pass forensic report"""
+
+    def test_report_shares_intermediates(self):
+        """Tools run together and share JPEG round-trips"""
+        from imagesics_core.forensic import report
+
+        img = np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)
+        results = report.run_report(img, ['ela', 'noise', 'histogram'], {'ela': {'quality': 80}})
+
+        self.assertEqual(set(results), {'ela', 'noise', 'histogram'})
+        self.assertEqual(results['ela']['result'].shape, img.shape)
+        self.assertIn('elapsed', results['noise'])
+        self.assertIn('blue', results['histogram']['histograms'])
+
+        ctx = report.AnalysisContext(img)
+        self.assertIs(ctx.jpeg(80), ctx.jpeg(80))
+        self.assertFalse(ctx.gray.flags.writeable)
+
+        with self.assertRaises(ValueError):
+            report.run_report(img, ['nope'])
+
+class TestCloning(unittest.TestCase):
+    """Test copy-move clustering"""
+
+    def test_cluster_matches(self):
+        """Consistent matches group together; mirrors and outliers are dropped"""
+        from imagesics_core.forensic.cloning import _cluster_matches
+
+        # Keypoints 0-2 are copied to 3-5; 6 is unrelated
+        points = np.array([[10, 10], [12, 11], [11, 14],
+                           [80, 80], [82, 81], [81, 84], [5, 90]], dtype=float)
+        query = np.array([0, 1, 2, 3, 0, 6])
+        train = np.array([3, 4, 5, 0, 6, 2])
+        ds = np.linalg.norm(points[query] - points[train], axis=1)
+
+        # Match 3 mirrors match 0, so it only joins groups not started by 0
+        clusters = _cluster_matches(points, query, train, ds, 10, 3)
+        self.assertEqual([c.tolist() for c in clusters], [[0, 1, 2], [1, 2, 3]])
+        self.assertEqual(_cluster_matches(points, query, train, ds, 10, 4), [])
+
+    def test_copy_move_regions(self):
+        """A pasted patch is detected with its source as separate regions"""
+        from imagesics_core.forensic import cloning
+
+        rng = np.random.default_rng(0)
+        img = cv2.GaussianBlur(rng.integers(0, 255, (300, 400, 3), dtype=np.uint8), (5, 5), 0)
+        img[180:260, 250:350] = img[20:100, 20:120]
+        _, stats = cloning.perform_cloning_analysis(img, response_threshold=100, min_cluster_size=3)
+
+        self.assertGreater(stats.clusters_count, 0)
+        self.assertGreaterEqual(stats.regions_count, 2)
+
+class TestQualitySweep(unittest.TestCase):
+    """Test batched JPEG recompression sweeps"""
+
+    def test_sweep_matches_serial_and_memoizes(self):
+        """Threaded sweep equals per-quality errors and is reused"""
+        from imagesics_core.forensic import quality_sweep
+
+        quality_sweep.clear()
+        gray = np.random.randint(0, 255, (64, 64), dtype=np.uint8)
+        qualities = [10, 50, 90]
+        errors = quality_sweep.sweep(gray, qualities, max_workers=2)
+        expected = [quality_sweep.recompression_error(gray, q) for q in qualities]
+        np.testing.assert_allclose(errors, expected)
+
+        calls = []
+        quality_sweep.sweep(gray, qualities, progress=calls.append)
+        self.assertEqual(calls, [])
+
+    def test_coarse_to_fine_finds_exhaustive_minimum(self):
+        """Coarse-to-fine search agrees with the exhaustive search"""
+        from imagesics_core.forensic import quality_sweep
+
+        img = cv2.GaussianBlur(np.random.randint(0, 255, (64, 64), dtype=np.uint8), (3, 3), 0)
+        _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 73])
+        gray = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+
+        best, evaluated = quality_sweep.coarse_to_fine(gray, 1, 99, step=10)
+        exhaustive, _ = quality_sweep.coarse_to_fine(gray, 1, 99, step=1)
+        self.assertEqual(best, exhaustive)
+        self.assertLess(len(evaluated), 99)
+
+    def test_quality_estimation(self):
+        """The quality tool finds the quality an image was saved at"""
+        from imagesics_core.forensic import jpeg_quality, quality_sweep
+
+        rng = np.random.default_rng(1)
+        img = cv2.GaussianBlur(rng.integers(0, 255, (300, 1100), dtype=np.uint8), (5, 5), 0)
+        crop = quality_sweep.centre_crop(img, 1024)
+        # Origin on the 8x8 grid, as close to the centre as it allows
+        np.testing.assert_array_equal(crop, img[0:296, 32:1056])
+
+        for quality in (37, 71):
+            _, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            decoded = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+            result = jpeg_quality.compute_jpeg_quality_estimation(None, gray=decoded)
+            self.assertEqual(result['quality'], quality)
+            self.assertLess(len(result['errors']), 99)
+            self.assertTrue(result['plot'].startswith(b'\xff\xd8'))
+
+class TestJpegDct(unittest.TestCase):
+    """Test bitstream-level JPEG analysis"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.gray = cv2.GaussianBlur(rng.integers(0, 255, (64, 80), dtype=np.uint8), (5, 5), 0)
+        self.color = cv2.merge([self.gray, self.gray[::-1], 255 - self.gray])
+
+    def _encode(self, image, quality, *flags):
+        _, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality, *flags])
+        return buf.tobytes()
+
+    def test_exact_quality(self):
+        """Quality factor is recovered exactly from the quantization tables"""
+        from imagesics_core.forensic import jpeg_dct
+
+        for quality in (23, 47, 85):
+            tables = jpeg_dct.read_quantization_tables(self._encode(self.color, quality))
+            result = jpeg_dct.estimate_quality(tables)
+            self.assertEqual(result['quality'], quality)
+            self.assertTrue(result['exact'])
+
+    def test_coefficients_match_pixel_dct(self):
+        """Decoded coefficients equal the quantized DCT of the decoded pixels"""
+        from imagesics_core.forensic import jpeg_dct
+
+        data = self._encode(self.gray, 90)
+        coefficients = jpeg_dct.read_coefficients(data)
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE).astype(np.float32)
+        blocks = (decoded - 128).reshape(8, 8, 10, 8).transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+        expected = np.stack([cv2.dct(b).reshape(-1) for b in blocks]) / coefficients.table(0).reshape(-1)
+        np.testing.assert_array_equal(coefficients.components[0].coefficients.reshape(-1, 64),
+                                      np.round(expected))
+
+        # Subsampled color with restart markers
+        color = jpeg_dct.read_coefficients(self._encode(self.color, 80, cv2.IMWRITE_JPEG_RST_INTERVAL, 3))
+        self.assertEqual([c.coefficients.shape[:2] for c in color.components], [(8, 10), (4, 5), (4, 5)])
+
+        with self.assertRaises(ValueError):
+            jpeg_dct.read_coefficients(self._encode(self.color, 80, cv2.IMWRITE_JPEG_PROGRESSIVE, 1))
+        with self.assertRaises(ValueError):
+            jpeg_dct.read_quantization_tables(b'not a jpeg')
+
+    def test_iter_segments(self):
+        """Segments and scan data tile the file up to EOI; truncation raises after the parts read"""
+        from imagesics_core.forensic import jpeg_dct
+
+        data = self._encode(self.color, 80, cv2.IMWRITE_JPEG_RST_INTERVAL, 3) + b'tail'
+        parts = list(jpeg_dct.iter_segments(data))
+        self.assertEqual(parts[0], (jpeg_dct.SOI, 0, 2))
+        self.assertEqual(parts[-1], (jpeg_dct.EOI, len(data) - 6, 2))
+        self.assertEqual(sum(length for _, _, length in parts), len(data) - 4)
+        # Restart markers stay inside the scan data
+        self.assertEqual([m for m, _, _ in parts].count(None), 1)
+
+        seen = []
+        with self.assertRaises(ValueError):
+            for part in jpeg_dct.iter_segments(data[:30]):
+                seen.append(part[0])
+        self.assertEqual(seen, [jpeg_dct.SOI, 0xE0])
+
+    def test_dct_ghost_and_histograms(self):
+        """Ghost maps vanish at the original quality; histograms cover the range"""
+        from imagesics_core.forensic import jpeg_dct
+
+        coefficients = jpeg_dct.read_coefficients(self._encode(self.gray, 70))
+        maps = jpeg_dct.dct_ghost_maps(coefficients, [50, 60, 70, 80])
+        self.assertEqual(maps.shape, (4, 5, 4))
+        self.assertEqual(maps[..., 2].max(), 0)
+
+        histograms = jpeg_dct.dq_histograms(coefficients, frequencies=3, max_value=16)
+        self.assertEqual(len(histograms), 3)
+        self.assertEqual(len(histograms[0]['histogram']), 33)
+
+class TestTiling(unittest.TestCase):
+    """Test tiled, memory-bounded processing"""
+
+    def setUp(self):
+        from imagesics_core.utils import tiling
+        self.tiling = tiling
+        self.budget = tiling.DEFAULT_BUDGET
+        rng = np.random.default_rng(0)
+        self.img = cv2.GaussianBlur(rng.integers(0, 255, (150, 210, 3), dtype=np.uint8), (5, 5), 0)
+
+    def tearDown(self):
+        self.tiling.DEFAULT_BUDGET = self.budget
+
+    def test_tiles_cover_image(self):
+        """Tile cores partition the image and outer regions stay aligned"""
+        covered = np.zeros((100, 70), int)
+        for tile in self.tiling.iter_tiles(100, 70, 32, halo=5, align=16):
+            covered[tile.target] += 1
+            self.assertEqual(tile.outer[0] % 16, 0)
+            self.assertEqual(tile.outer[2] % 16, 0)
+        self.assertTrue((covered == 1).all())
+
+    def test_tiled_tools_match_whole_image(self):
+        """ELA, noise and min/max deviation are identical when tiled"""
+        from imagesics_core.forensic import ela, noise, pixel_analysis
+
+        tools = [
+            lambda: ela.perform_ela(self.img),
+            lambda: noise.perform_noise_separation(self.img, levels=0),
+            lambda: pixel_analysis.compute_minmax_deviation(self.img, 5),
+        ]
+        whole = [tool() for tool in tools]
+        self.tiling.DEFAULT_BUDGET = 64 * 64 * 64
+        for expected, tool in zip(whole, tools):
+            np.testing.assert_array_equal(tool(), expected)
+
+    def test_ghost_maps(self):
+        """Ghost maps dip at the saved quality and match when tiled"""
+        from unittest import mock
+        from imagesics_core.forensic import ghost_maps
+
+        _, encoded = cv2.imencode('.jpg', self.img, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        img = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        params = ghost_maps.GhostMapRequest(qmin=50, qmax=90, qstep=10)
+
+        def run():
+            with mock.patch.object(ghost_maps, 'plot_ghost_maps', return_value=b'') as plot:
+                ghost_maps.compute_ghost_maps(img, params)
+            return plot.call_args[0][0]
+
+        whole = run()
+        self.assertEqual(whole.shape, (150 // 16, 210 // 16, 5))
+        self.assertEqual(int(np.argmin(whole.mean(axis=(0, 1)))), 2)
+        self.tiling.DEFAULT_BUDGET = 64 * 64 * ghost_maps.GHOST_BYTES_PER_PIXEL
+        np.testing.assert_allclose(run(), whole, atol=1e-5)
+
+class TestExifTool(unittest.TestCase):
+    """Test the pooled ExifTool workers"""
+
+    def setUp(self):
+        from imagesics_core.utils import exiftool
+        if not exiftool.available():
+            self.skipTest("exiftool not available")
+        self.exiftool = exiftool
+        self.path = os.path.join(os.path.dirname(__file__), '..', 'test_image_with_metadata.jpg')
+
+    def test_metadata_and_restart(self):
+        """Workers are reused, serve binary output and restart after a crash"""
+        from imagesics_core.forensic import metadata
+
+        pool = self.exiftool.ExifToolPool(self.exiftool.get_exiftool_path(), size=1)
+        try:
+            data = pool.execute_json(self.path)[0]
+            self.assertEqual(data['Model'], 'Canon EOS 5D Mark IV')
+            thumbnail = pool.execute('-b', '-ThumbnailImage', self.path)
+            self.assertEqual(thumbnail, metadata.extract_thumbnail(self.path))
+            self.assertTrue(thumbnail.startswith(b'\xff\xd8'))
+
+            worker = pool._workers[0]
+            worker._process.kill()
+            worker._process.wait()
+            self.assertEqual(pool.execute_json(self.path)[0]['Model'], data['Model'])
+            self.assertEqual(pool.restarts, 1)
+            self.assertEqual(len(pool._workers), 1)
+        finally:
+            pool.close()
+
+    def test_metadata_batch(self):
+        """Batch records match the per-file functions, in input order"""
+        from imagesics_core.forensic import metadata
+
+        paths = [self.path, '/nonexistent.jpg', self.path]
+        records = list(metadata.get_metadata_batch(paths, thumbnails=True, batch_size=2))
+        self.assertEqual([r['path'] for r in records], paths)
+        self.assertEqual(records[0]['gps'], metadata.get_gps_coords(self.path))
+        self.assertEqual(records[2]['exif']['Model'], metadata.get_exif_metadata(self.path)['Model'])
+        self.assertEqual(records[0]['thumbnail']['size'], len(metadata.extract_thumbnail(self.path)))
+        self.assertIn('error', records[1]['gps'])
+        self.assertFalse(records[1]['thumbnail']['has_thumbnail'])
+
+class TestMetadataModel(unittest.TestCase):
+    """Test the single-parse metadata model"""
+
+    def setUp(self):
+        from imagesics_core.forensic import metadata_model
+        self.metadata_model = metadata_model
+        self.path = os.path.join(os.path.dirname(__file__), '..', 'test_image_with_metadata.jpg')
+
+    def test_model(self):
+        """One cached parse yields EXIF, GPS, thumbnail and segments"""
+        model = self.metadata_model.load(self.path)
+        self.assertIs(self.metadata_model.load(self.path), model)
+        self.assertEqual(model.format, 'JPEG')
+        self.assertEqual(model.exif()['Model'], 'Canon EOS 5D Mark IV')
+        gps = model.gps()
+        self.assertAlmostEqual(gps['latitude'], 48.8583, places=4)
+        self.assertAlmostEqual(gps['longitude'], 2.2945, places=4)
+        self.assertTrue(model.thumbnail.startswith(b'\xff\xd8'))
+        names = [s['name'] for s in model.segments]
+        self.assertEqual(names[:2], ['APP0 (JFIF)', 'APP1 (Exif)'])
+        self.assertEqual(names[-1], 'SOS')
+
+    def test_xmp_and_errors(self):
+        """XMP packets are extracted and unreadable data is reported"""
+        _, encoded = cv2.imencode('.jpg', np.zeros((16, 16, 3), np.uint8))
+        data = encoded.tobytes()
+        packet = b'<x:xmpmeta xmlns:x="adobe:ns:meta/"></x:xmpmeta>'
+        payload = self.metadata_model.XMP_HEADER + packet
+        segment = b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+        model = self.metadata_model.parse(data[:2] + segment + data[2:])
+        self.assertEqual(model.xmp, packet.decode())
+        self.assertIsNone(model.gps())
+        self.assertIsNone(model.error)
+        self.assertIsNotNone(self.metadata_model.parse(b'not an image').error)
+
+class TestDigest(unittest.TestCase):
+    """Test streaming file hashing"""
+
+    def setUp(self):
+        import tempfile
+        from imagesics_core.forensic import digest
+        self.digest = digest
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'data.bin')
+        self.data = np.random.default_rng(0).integers(0, 256, 3 * 1000 + 7, dtype=np.uint8).tobytes()
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streaming_matches_in_memory(self):
+        """Chunked, mapped and parallel hashing agree with hashing the bytes"""
+        expected = self.digest.compute_hashes(self.data)
+        self.assertEqual(self.digest.hash_file(self.path, chunk_size=1000), expected)
+        self.assertEqual(self.digest.hash_file(self.path, use_mmap=True, chunk_size=1000), expected)
+        threshold = self.digest.PARALLEL_THRESHOLD
+        self.digest.PARALLEL_THRESHOLD = 0
+        try:
+            self.assertEqual(self.digest.hash_file(self.path, chunk_size=1000, max_workers=3), expected)
+        finally:
+            self.digest.PARALLEL_THRESHOLD = threshold
+
+    def test_report_decodes_lazily(self):
+        """The image is only decoded when image hashes are requested"""
+        calls = []
+        report = self.digest.generate_digest_report(
+            self.path, image_hashes=False, load_image=lambda: calls.append(1))
+        self.assertEqual(calls, [])
+        self.assertNotIn('image_hashes', report)
+        self.assertEqual(report['file_hashes']['SHA2-256'], self.digest.compute_hashes(self.data)['SHA2-256'])
+
+class TestUploadStore(unittest.TestCase):
+    """Test hashing uploads while they are written"""
+
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+        from imagesics_core.utils import upload_store
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.store = upload_store.UploadStore(root / 'uploads', root / 'records')
+        self.data = cv2.imencode('.png', np.random.default_rng(0).integers(0, 255, (32, 32, 3), dtype=np.uint8))[1].tobytes()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_records_and_deduplication(self):
+        """Uploads are hashed once and identical content is stored once"""
+        import io
+        from imagesics_core.forensic import digest
+
+        record, duplicate = self.store.save(io.BytesIO(self.data), 'a.png', chunk_size=100)
+        self.assertFalse(duplicate)
+        path = self.store.uploads_dir / record['id']
+        self.assertEqual(record['file_hashes'], digest.hash_file(str(path)))
+        self.assertIsNotNone(record['phash'])
+        self.assertEqual(self.store.record_for_path(path), record)
+
+        again, duplicate = self.store.save(io.BytesIO(self.data), 'b.png')
+        self.assertTrue(duplicate)
+        self.assertEqual(again['id'], record['id'])
+        self.assertEqual(os.listdir(self.store.uploads_dir), [record['id']])
+
+        # A file changed after upload has no valid record
+        with open(path, 'ab') as f:
+            f.write(b'x')
+        self.assertIsNone(self.store.record(record['id']))
+
+        # The changed file no longer holds the content's claim
+        fresh, duplicate = self.store.save(io.BytesIO(self.data), 'c.png')
+        self.assertFalse(duplicate)
+        self.assertNotEqual(fresh['id'], record['id'])
+
+    def test_concurrent_identical_uploads(self):
+        """Identical uploads racing in threads and other stores keep one copy"""
+        import io
+        from concurrent.futures import ThreadPoolExecutor
+        from imagesics_core.utils import upload_store
+
+        stores = [self.store, upload_store.UploadStore(self.store.uploads_dir, self.store.records_dir)]
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda k: stores[k % 2].save(io.BytesIO(self.data), f'{k}.png'), range(8)))
+        self.assertEqual(len({r['id'] for r, _ in results}), 1)
+        self.assertEqual(sum(not duplicate for _, duplicate in results), 1)
+        self.assertEqual(len(os.listdir(self.store.uploads_dir)), 1)
+
+class TestHexView(unittest.TestCase):
+    """Test the memory-mapped hex view"""
+
+    def setUp(self):
+        import tempfile
+        from imagesics_core.forensic import hex_view
+        self.hex_view = hex_view
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'data.bin')
+        self.data = b'\xff\xd8' + bytes(range(40)) + b'Hello\xff\xd8\xff\xd8'
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_window_and_rows(self):
+        """Windows are clamped to the file and rows follow the dump layout"""
+        chunk, size = self.hex_view.read_window(self.path, 40, 100)
+        self.assertEqual((chunk, size), (self.data[40:], len(self.data)))
+        rows = self.hex_view.format_rows(b'AB\x00', 0x20).decode()
+        self.assertEqual(rows, '00000020  41 42 00' + ' ' * 41 + '|AB.             |\n')
+        self.assertEqual(len(self.hex_view.format_rows(self.data).splitlines()), 4)
+
+    def test_search(self):
+        """Search finds non-overlapping matches across the file"""
+        pattern = self.hex_view.parse_pattern('ff d8')
+        self.assertEqual(self.hex_view.search(self.path, pattern), ([0, 47, 49], False))
+        self.assertEqual(self.hex_view.search(self.path, pattern, start=1, limit=1), ([47], True))
+        with self.assertRaises(ValueError):
+            self.hex_view.parse_pattern('FFD')
+
+class TestContainer(unittest.TestCase):
+    """Test the JPEG/PNG/TIFF structure parser"""
+
+    def setUp(self):
+        import tempfile
+        from imagesics_core.forensic import container
+        self.container = container
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _save(self, name, **kwargs):
+        from PIL import Image
+        path = os.path.join(self.tmp.name, name)
+        image = Image.fromarray(np.random.randint(0, 255, (40, 60, 3), dtype=np.uint8))
+        image.save(path, **kwargs)
+        return path
+
+    def test_jpeg(self):
+        """JPEG segments cover the file and the Exif IFDs are walked"""
+        from PIL import Image
+        exif = Image.Exif()
+        exif[0x010F] = 'TestMake'
+        path = self._save('a.jpg', quality=80, exif=exif)
+        with open(path, 'ab') as f:
+            f.write(b'hidden')
+        result = self.container.parse(path)
+        self.assertIsNone(result['error'])
+        names = [e['name'] for e in result['entries']]
+        self.assertEqual(names[0], 'SOI')
+        self.assertEqual(names[-2:], ['EOI', 'Trailing data'])
+        self.assertEqual(sum(e['length'] for e in result['entries']), result['size'])
+        sof = next(e for e in result['entries'] if e['name'] == 'SOF0')
+        self.assertEqual((sof['fields']['width'], sof['fields']['height']), (60, 40))
+        app1 = next(e for e in result['entries'] if e['name'] == 'APP1')
+        tags = app1['children'][1]['fields']['tags']
+        self.assertIn(('Make', 'TestMake'), [(t['name'], t['value']) for t in tags])
+        self.assertIs(self.container.parse(path), result)
+
+    def test_png_and_tiff(self):
+        """PNG chunks carry decoded fields; TIFF IFDs are listed"""
+        png = self.container.parse(self._save('a.png'))
+        ihdr = png['entries'][1]
+        self.assertEqual((ihdr['name'], ihdr['fields']['width'], ihdr['fields']['crc_ok']), ('IHDR', 60, True))
+        self.assertEqual(png['entries'][-1]['name'], 'IEND')
+
+        tiff = self.container.parse(self._save('a.tif'))
+        self.assertEqual([e['name'] for e in tiff['entries']], ['TIFF header', 'IFD 0'])
+        tags = {t['name']: t['value'] for t in tiff['entries'][1]['fields']['tags']}
+        self.assertEqual((tags['ImageWidth'], tags['ImageLength']), (60, 40))
+
+    def test_truncated(self):
+        """Truncation keeps the entries read so far and reports an error"""
+        path = self._save('a.jpg')
+        with open(path, 'rb') as f:
+            data = f.read()
+        result = self.container.parse_bytes(data[:30])
+        self.assertTrue(result['error'])
+        self.assertEqual(result['format'], 'JPEG')
+        self.assertEqual([e['name'] for e in result['entries']], ['SOI', 'APP0'])
+
+        with open(self._save('a.png'), 'rb') as f:
+            png = self.container.parse_bytes(f.read()[:50])
+        self.assertTrue(png['error'])
+        self.assertEqual([e['name'] for e in png['entries']], ['Signature', 'IHDR'])
+        with self.assertRaises(self.container.ContainerError):
+            self.container.parse_bytes(b'not an image')
+
+class TestPixelStats(unittest.TestCase):
+    """Test histogram-derived pixel statistics"""
+
+    def test_matches_numpy(self):
+        """Statistics from the histograms equal the NumPy reductions"""
+        from imagesics_core.forensic import pixel_analysis, histogram
+        image = np.random.randint(0, 256, (41, 30, 3), dtype=np.uint8)
+        stats = pixel_analysis.compute_pixel_stats(image)
+        for name, channel in zip(['Blue', 'Green', 'Red'], cv2.split(image)):
+            flat = channel.ravel()
+            s = stats[name]
+            self.assertEqual((s['min'], s['max']), (flat.min(), flat.max()))
+            self.assertAlmostEqual(s['mean'], flat.mean())
+            self.assertAlmostEqual(s['std_dev'], flat.std())
+            self.assertAlmostEqual(s['median'], np.median(flat))
+            self.assertAlmostEqual(s['percentiles']['95'], np.percentile(flat, 95))
+            _, counts = np.unique(flat, return_counts=True)
+            p = counts / flat.size
+            self.assertAlmostEqual(s['entropy'], -(p * np.log2(p)).sum())
+        hists = histogram.compute_all_histograms(image)
+        self.assertEqual(hists['red'], np.bincount(image[:, :, 2].ravel(), minlength=256).tolist())
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.assertEqual(hists['value'], np.bincount(gray.ravel(), minlength=256).tolist())
+
+class TestRender(unittest.TestCase):
+    """Test matplotlib-free panel compositing"""
+
+    def test_compose(self):
+        """Panels of mixed types tile into one BGR image without pyplot"""
+        from imagesics_core.utils import render
+        image = np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+        heat = np.linspace(0, 1, 30 * 40, dtype=np.float32).reshape(30, 40)
+        panels = [
+            render.Panel(image, 'Original'),
+            render.Panel(heat, 'Map\nsecond line', colormap=cv2.COLORMAP_HOT, colorbar=True),
+            render.Panel(image[:, :, 0], 'Gray'),
+        ]
+        grid = render.compose(panels, cols=2, title='Title')
+        self.assertEqual((grid.dtype, grid.ndim, grid.shape[2]), (np.uint8, 3, 3))
+        self.assertGreater(grid.shape[1], 2 * render.MIN_CELL_WIDTH)
+        encoded = render.render(panels, cols=2, title='Title')
+        decoded = cv2.imdecode(np.frombuffer(encoded, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded.shape, grid.shape)
+        self.assertTrue(np.array_equal(render.to_bgr(heat, vmin=0, vmax=1)[-1, -1], [255, 255, 255]))
+
+    def test_render_map(self):
+        """Raw maps re-render with colormap, gain, threshold and layers"""
+        from imagesics_core.utils import render
+        values = np.tile(np.linspace(0, 2, 5, dtype=np.float32), (2, 1))
+        gray = render.render_map(values)[0, :, 0]
+        self.assertEqual(list(gray), [0, 64, 128, 191, 255])
+        self.assertEqual(list(render.render_map(values, gain=2)[0, :, 0]), [0, 128, 255, 255, 255])
+        self.assertEqual(list(render.render_map(values, threshold=1.0)[0, :, 0]), [0, 0, 128, 191, 255])
+        self.assertEqual(render.render_map(values, colormap='jet').shape, (2, 5, 3))
+        stack = np.stack([values, 2 - values], axis=2)
+        self.assertEqual(render.render_map(stack, layer=1)[0, 0, 0], 255)
+        with self.assertRaises(ValueError):
+            render.render_map(stack)
+        with self.assertRaises(ValueError):
+            render.render_map(values, colormap='nope')
+
+    def test_raw_maps(self):
+        """Renderings from a precomputed raw map match the direct ones"""
+        from imagesics_core.forensic import ela, noise, pixel_analysis
+        image = np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)
+        difference = ela.ela_map(image, 80)
+        self.assertEqual(difference.dtype, np.float32)
+        np.testing.assert_array_equal(ela.perform_ela(image, 80, difference=difference), ela.perform_ela(image, 80))
+        residual = noise.noise_map(image, 'Gaussian', 2)
+        np.testing.assert_array_equal(
+            noise.perform_noise_separation(image, 'Gaussian', 2, noise=residual),
+            noise.perform_noise_separation(image, 'Gaussian', 2)
+        )
+        deviation = pixel_analysis.minmax_map(image)
+        np.testing.assert_array_equal(
+            pixel_analysis.compute_minmax_deviation(image, deviation=deviation),
+            pixel_analysis.compute_minmax_deviation(image)
+        )
+
+class TestStereogram(unittest.TestCase):
+    """Test the vectorized stereogram decoder"""
+
+    def test_row_periods(self):
+        """Row periods match a per-row corrcoef search; depth is a gather"""
+        from imagesics_core.forensic import stereogram
+        rng = np.random.default_rng(0)
+        gray = rng.integers(0, 255, (12, 200), dtype=np.uint8)
+        gray[:6] = np.tile(gray[:6, :37], 6)[:, :200]
+        gray[9] = 5
+        shifts, _ = stereogram.row_periods(gray)
+        for y, row in enumerate(gray.astype(np.float64)):
+            best, best_corr = 0, 0
+            for shift in range(10, 50):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    corr = np.corrcoef(row[:-shift], row[shift:])[0, 1]
+                if not np.isnan(corr) and corr > best_corr:
+                    best, best_corr = shift, corr
+            self.assertEqual(shifts[y], best)
+        self.assertEqual(list(shifts[:6]), [37] * 6)
+        self.assertEqual(shifts[9], 0)
+
+        depth = stereogram.depth_map(gray, shifts)
+        self.assertEqual(depth[0, :200 - 37].max(), 0)
+        self.assertEqual(depth[9].max(), 0)
+        self.assertEqual(depth[7, 5], abs(int(gray[7, 5]) - int(gray[7, 5 + shifts[7]])))
+
+class TestHistogramTable(unittest.TestCase):
+    """Test range statistics from histogram prefix tables"""
+
+    def test_matches_direct_range(self):
+        """Range queries equal the statistics of the sliced histogram"""
+        from imagesics_core.forensic.histogram import HistogramTable
+        hist = np.random.randint(0, 50, 256)
+        hist[100:120] = 0
+        table = HistogramTable(hist)
+        x = np.arange(256)
+        for start, end in [(0, 255), (3, 90), (95, 125), (100, 119), (200, 204)]:
+            stats = table.stats(start, end)
+            y = hist[start:end + 1]
+            self.assertEqual(stats.pixel_count, y.sum())
+            if not y.any():
+                self.assertEqual(stats.nonzero_range, (0, 0))
+                continue
+            self.assertEqual(stats.most_frequent, start + np.argmax(y))
+            self.assertEqual(stats.least_frequent, start + np.argmin(y))
+            self.assertEqual(stats.empty_bins, np.count_nonzero(y == 0))
+            self.assertEqual(stats.median_level, start + np.argmax(np.cumsum(y) > y.sum() / 2))
+            self.assertAlmostEqual(stats.average_level, (x[start:end + 1] * y).sum() / y.sum(), places=2)
+            nonzero = np.nonzero(y)[0] + start
+            self.assertEqual(stats.nonzero_range, (nonzero[0], nonzero[-1]))
+            n = y / y.max()
+            rough = np.abs(n[2:-2] - (2 * n[1:-3] - n[:-4] + 2 * n[3:-1] - n[4:]) / 2).sum()
+            self.assertAlmostEqual(stats.smoothness, (1 - rough / (len(y) - 2)) * 100, delta=0.011)
+
+class TestUniqueColors(unittest.TestCase):
+    """Test color counting over packed color keys"""
+
+    def test_matches_unique_rows(self):
+        """Counts and frequencies equal np.unique over the pixel rows"""
+        from imagesics_core.forensic import histogram
+        image = np.random.randint(0, 4, (300, 70, 3), dtype=np.uint8) * 60
+        image[5, 5] = (1, 2, 3)
+        colors, counts = np.unique(image.reshape(-1, 3), axis=0, return_counts=True)
+        self.assertEqual(histogram.get_unique_colors_info(image)[0], len(colors))
+        self.assertEqual(histogram.count_unique_colors(image[:, :, 1]), 5)
+
+        top_colors, top_counts = histogram.color_frequencies(image, top=5)
+        order = np.argsort(-counts, kind='stable')[:5]
+        np.testing.assert_array_equal(top_counts, counts[order])
+        np.testing.assert_array_equal(top_colors, colors[order])
+        self.assertEqual(histogram.color_frequencies(image)[1].sum(), image.shape[0] * image.shape[1])
+
+class TestResampling(unittest.TestCase):
+    """Test the block-wise EM resampling detector"""
+
+    def test_detects_interpolation_period(self):
+        """A 1.5x upscaled texture gives a p-map with period 3"""
+        from imagesics_core.forensic import resampling
+        rng = np.random.default_rng(0)
+        texture = cv2.GaussianBlur(rng.random((120, 150)).astype(np.float32), (0, 0), 1.0)
+        upscaled = cv2.resize(texture, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+        gray = (upscaled - upscaled.min()) / (upscaled.max() - upscaled.min())
+
+        for radius in (1, 2):
+            p_map = resampling.compute_probability_map(gray, radius)
+            self.assertEqual(p_map.shape, (gray.shape[0] - 2 * radius, gray.shape[1] - 2 * radius))
+            spectrum = np.abs(np.fft.fft(p_map - p_map.mean(), axis=1)).mean(axis=0)
+            freqs = np.abs(np.fft.fftfreq(p_map.shape[1]))
+            spectrum[freqs < 0.1] = 0
+            self.assertAlmostEqual(freqs[spectrum.argmax()], 1 / 3, places=2)
+
+    def test_regions(self):
+        """ROIs are analysed on their bounding boxes, zero outside polygons"""
+        from imagesics_core.forensic import resampling
+        image = np.random.randint(0, 256, (90, 120, 3), dtype=np.uint8)
+        params = resampling.ResamplingRequest(
+            selected_points=[(10, 5), (49, 34)],
+            regions=[[(60, 10), (110, 10), (60, 80)]],
+            upsample=False
+        )
+        first, triangle = resampling.resampling_region_maps(image, params)
+        self.assertEqual(first.bbox, (10, 5, 50, 35))
+        self.assertEqual(first.p_map.shape, (30, 40))
+        self.assertEqual(first.magnitude.shape, (30, 40))
+        self.assertEqual(triangle.bbox, (60, 10, 111, 81))
+        # Below the diagonal of the triangle nothing is analysed
+        self.assertEqual(triangle.p_map[-1, -1], 0)
+        self.assertGreater(triangle.p_map[:10, :10].max(), 0)
+
+        with self.assertRaises(ValueError):
+            resampling.resampling_region_maps(
+                image, resampling.ResamplingRequest(selected_points=[(200, 200), (300, 300)]))
+
 if __name__ == '__main__':
     unittest.main()
@@ -54,5 +54,19 @@ class TestRoutes(unittest.TestCase):
         # Should not be 404
         self.assertNotEqual(response.status_code, 404)
 
+    def test_hex_routes_confined_to_storage(self):
+        """Test that hex routes refuse files outside storage"""
+        if not self.app_available:
+            self.skipTest("Flask app not available")
+
+        outside = os.path.abspath(__file__)
+        for route in ('raw', 'rows', 'search'):
+            response = self.client.get(f'/api/forensic/hex/{route}',
+                                       query_string={'path': outside, 'pattern': '69'})
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/forensic/hex/raw',
+                                   query_string={'path': '/storage/../tests/test_routes.py'})
+        self.assertEqual(response.status_code, 404)
+
 if __name__ == '__main__':
     unittest.main()